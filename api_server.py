@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import base64
+import contextlib
+import contextvars
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from functools import partial
+
+from aiohttp import web
+
+from library import analytics, catalog, changes, circulation, holds, metrics, reports, users
+from library.bootstrap import bootstrap
+from library.db import DB_PATH, configure_pool
+from library.search import search_books
+
+logger = logging.getLogger("library.api")
+
+MAX_PAGE_SIZE = 100
+MAX_HISTORY = 10000
+
+# Every other route needs a session token from POST /sessions
+PUBLIC_ROUTES = {("POST", "/sessions")}
+# Normalized SQL and timings are for administrators only, as in the app
+ADMIN_ROUTES = {("GET", "/metrics")}
+
+# Client errors raised by the service layer, mapped to HTTP status codes
+ERROR_STATUS = {
+    circulation.BookNotFound: 404,
+    circulation.LoanNotFound: 404,
+    holds.HoldNotFound: 404,
+    holds.HoldError: 409,
+    circulation.CirculationError: 409,
+    catalog.CatalogError: 409,
+}
+
+
+def to_json(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_cursor(cursor):
+    if cursor is None:
+        return None
+    raw = json.dumps(list(cursor), default=to_json).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        raise web.HTTPBadRequest(text="invalid cursor")
+    # Every cursor is (sort value, unique key); anything else cannot be bound
+    if not (isinstance(cursor, list) and len(cursor) == 2
+            and all(isinstance(value, (str, int, float)) for value in cursor)):
+        raise web.HTTPBadRequest(text="invalid cursor")
+    return tuple(cursor)
+
+
+def int_param(request, name, default, maximum=None):
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be an integer")
+    # SQLite reads a negative LIMIT as no limit at all
+    if value < 1:
+        raise web.HTTPBadRequest(text=f"{name} must be at least 1")
+    return min(value, maximum) if maximum else value
+
+
+def date_field(body, name, default):
+    value = body.get(name)
+    if value is None:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(text=f"{name} must be an ISO date")
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="request body must be JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="request body must be a JSON object")
+    return body
+
+
+async def offload(request, fn, *args, **kwargs):
+    """Run blocking SQLite work on the bounded worker pool."""
+    app = request.app
+    # Executor threads do not inherit context; carry the route tag over explicitly
+    with metrics.tag_page(f"API {request.method} {request.match_info.route.resource.canonical}"):
+        context = contextvars.copy_context()
+    async with app["slots"]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(app["executor"], partial(context.run, fn, *args, **kwargs))
+
+
+async def stream_rows(request, rows, **extra):
+    """Write ``{"rows": [...], **extra}`` incrementally as JSON."""
+    response = web.StreamResponse(headers={"Content-Type": "application/json"})
+    await response.prepare(request)
+    await response.write(b'{"rows": [')
+    chunk = []
+    for index, row in enumerate(rows):
+        item = row._asdict() if hasattr(row, "_asdict") else row
+        chunk.append(("," if index else "") + json.dumps(item, default=to_json))
+        if len(chunk) >= 200:
+            await response.write("".join(chunk).encode())
+            chunk = []
+    tail = "".join(chunk) + "]"
+    for key, value in extra.items():
+        tail += f", {json.dumps(key)}: {json.dumps(value, default=to_json)}"
+    await response.write((tail + "}").encode())
+    await response.write_eof()
+    return response
+
+
+@web.middleware
+async def require_session(request, handler):
+    """Reject requests without an ``Authorization: Bearer <token>`` header for a live session."""
+    resource = request.match_info.route.resource
+    route = (request.method, resource.canonical if resource else None)
+    if resource is None or route in PUBLIC_ROUTES:
+        return await handler(request)
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    user = users.tokens.user_for(token.strip()) if scheme.lower() == "bearer" else None
+    if user is None:
+        raise web.HTTPUnauthorized(text="a session token is required", headers={"WWW-Authenticate": "Bearer"})
+    if route in ADMIN_ROUTES and user.role != "admin":
+        raise web.HTTPForbidden(text="admin only")
+    return await handler(request)
+
+
+@web.middleware
+async def service_errors(request, handler):
+    try:
+        return await handler(request)
+    except tuple(ERROR_STATUS) as e:
+        status = next(code for cls, code in ERROR_STATUS.items() if isinstance(e, cls))
+        return web.json_response({"error": str(e), "type": type(e).__name__}, status=status)
+
+
+def text_fields(body, names):
+    """The stripped, non-empty string values of ``names`` in ``body``."""
+    try:
+        values = [body[name] for name in names]
+    except KeyError:
+        raise web.HTTPBadRequest(text=f"{', '.join(names)} are required")
+    if not all(isinstance(value, str) and value.strip() for value in values):
+        raise web.HTTPBadRequest(text=f"{', '.join(names)} must be non-empty strings")
+    return [value.strip() for value in values]
+
+
+async def open_session(request):
+    body = await read_json(request)
+    username, password = text_fields(body, ("username", "password"))
+    user, token = await offload(request, users.login, username, password)
+    if user is None:
+        raise web.HTTPUnauthorized(text="invalid username or password", headers={"WWW-Authenticate": "Bearer"})
+    return web.json_response({"token": token, "username": user.username, "role": user.role}, status=201)
+
+
+async def close_session(request):
+    users.logout(request.headers["Authorization"].partition(" ")[2].strip())
+    return web.Response(status=204)
+
+
+async def list_books(request):
+    limit = int_param(request, "limit", 25, MAX_PAGE_SIZE)
+    after = decode_cursor(request.query.get("after"))
+    term = request.query.get("q")
+    filters = {"subject": request.query.get("subject"),
+               "available_only": request.query.get("available") == "1"}
+    if term:
+        rows, next_cursor = await offload(request, search_books, term, limit=limit, after=after, **filters)
+        return await stream_rows(request, rows, next=encode_cursor(next_cursor))
+    sort = request.query.get("sort", catalog.BOOK_SORTS[0])
+    if sort not in catalog.BOOK_SORTS:
+        raise web.HTTPBadRequest(text=f"sort must be one of {catalog.BOOK_SORTS}")
+    page = await offload(
+        request, catalog.list_books, sort=sort, after=after, page_size=limit,
+        descending=request.query.get("descending") == "1", **filters,
+    )
+    return await stream_rows(request, page.rows, next=encode_cursor(page.next_cursor))
+
+
+async def add_book(request):
+    body = await read_json(request)
+    bname, bcode, subject = text_fields(body, ("bname", "bcode", "subject"))
+    try:
+        total = int(body["total"])
+    except (KeyError, TypeError, ValueError):
+        raise web.HTTPBadRequest(text="total must be an integer")
+    if total < 1:
+        raise web.HTTPBadRequest(text="total must be at least 1")
+    book = await offload(request, catalog.add_book, bname, bcode, total, subject)
+    return web.json_response(book._asdict(), status=201)
+
+
+async def issue_book(request):
+    body = await read_json(request)
+    name, regno, bcode = text_fields(body, ("name", "regno", "bcode"))
+    idate = date_field(body, "idate", date.today())
+    due_date = date_field(body, "due_date", idate + timedelta(days=14))
+    loan_id = await offload(request, circulation.issue_book, name, regno, bcode, idate, due_date)
+    return web.json_response({"id": loan_id, "bcode": bcode, "due_date": due_date.isoformat()}, status=201)
+
+
+async def return_book(request):
+    try:
+        loan_id = int(request.match_info["loan_id"])
+    except ValueError:
+        raise web.HTTPNotFound()
+    body = await read_json(request) if request.can_read_body else {}
+    return_date = date_field(body, "return_date", date.today())
+    bcode, hold = await offload(request, circulation.return_copy, loan_id, return_date)
+    return web.json_response({
+        "id": loan_id, "bcode": bcode, "return_date": return_date.isoformat(),
+        "hold": hold._asdict() if hold else None,
+    }, dumps=partial(json.dumps, default=to_json))
+
+
+async def place_hold(request):
+    body = await read_json(request)
+    name, regno, bcode = text_fields(body, ("name", "regno", "bcode"))
+    hold_id, position = await offload(request, holds.place_hold, name, regno, bcode)
+    return web.json_response({"id": hold_id, "bcode": bcode, "position": position}, status=201)
+
+
+async def cancel_hold(request):
+    try:
+        hold_id = int(request.match_info["hold_id"])
+    except ValueError:
+        raise web.HTTPNotFound()
+    passed_to = await offload(request, holds.cancel_hold, hold_id)
+    return web.json_response({"id": hold_id, "passed_to": passed_to.id if passed_to else None})
+
+
+async def active_holds(request):
+    limit = int_param(request, "limit", 100, MAX_HISTORY)
+    rows = await offload(request, holds.active_holds, bcode=request.query.get("bcode"), limit=limit)
+    return await stream_rows(request, rows)
+
+
+async def open_loans(request):
+    sort = request.query.get("sort", reports.LOAN_SORTS[0])
+    if sort not in reports.LOAN_SORTS:
+        raise web.HTTPBadRequest(text=f"sort must be one of {reports.LOAN_SORTS}")
+    page = await offload(
+        request, reports.open_loans, sort=sort,
+        after=decode_cursor(request.query.get("after")),
+        page_size=int_param(request, "limit", 25, MAX_PAGE_SIZE),
+        descending=request.query.get("descending") == "1",
+        overdue_only=request.query.get("overdue") == "1",
+    )
+    return await stream_rows(request, page.rows, next=encode_cursor(page.next_cursor))
+
+
+async def return_history(request):
+    limit = int_param(request, "limit", 100, MAX_HISTORY)
+    rows = await offload(request, reports.return_history, limit=limit)
+    return await stream_rows(request, rows)
+
+
+async def stats(request):
+    return web.json_response(await offload(request, reports.dashboard_stats))
+
+
+async def query_metrics(request):
+    """Prometheus scrape endpoint; empty unless LIBRARY_QUERY_METRICS=1."""
+    return web.Response(text=metrics.metrics.prometheus(), content_type="text/plain")
+
+
+async def poll_changes(app):
+    """Apply other processes' writes to this process's caches every POLL_SECONDS."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(changes.POLL_SECONDS)
+        try:
+            await loop.run_in_executor(app["executor"], changes.poll)
+        except Exception:
+            logger.exception("Polling the change log failed")
+
+
+async def on_startup(app):
+    app["startup"] = await asyncio.get_running_loop().run_in_executor(app["executor"], bootstrap)
+    holds.start_scheduler()
+    analytics.start_refresher()
+    app["change_poller"] = asyncio.create_task(poll_changes(app))
+
+
+async def on_cleanup(app):
+    app["change_poller"].cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await app["change_poller"]
+    holds.stop_scheduler()
+    analytics.stop_refresher()
+    app["executor"].shutdown(wait=True)
+
+
+def create_app(db_path=DB_PATH, workers=8):
+    """
+    Build the HTTP API application.
+    SQLite calls run on a thread pool of ``workers`` threads with one pooled
+    connection each, so the event loop never blocks on the database. Every
+    route except ``POST /sessions`` needs a staff session token.
+    """
+    configure_pool(db_path, max_size=workers)
+    app = web.Application(middlewares=[require_session, service_errors])
+    app["executor"] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sqlite")
+    # Bound queued work so a burst waits here instead of piling up in the executor
+    app["slots"] = asyncio.Semaphore(workers * 4)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.add_routes([
+        web.post("/sessions", open_session),
+        web.delete("/sessions", close_session),
+        web.get("/books", list_books),
+        web.post("/books", add_book),
+        web.post("/loans", issue_book),
+        web.post("/loans/{loan_id}/return", return_book),
+        web.get("/holds", active_holds),
+        web.post("/holds", place_hold),
+        web.post("/holds/{hold_id}/cancel", cancel_hold),
+        web.get("/reports/open", open_loans),
+        web.get("/reports/history", return_history),
+        web.get("/stats", stats),
+        web.get("/metrics", query_metrics),
+    ])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the library circulation API over HTTP")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=8, help="database worker threads")
+    args = parser.parse_args()
+    web.run_app(create_app(args.db, args.workers), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
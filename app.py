@@ -1,7 +1,18 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
+import io
+import tempfile
 from datetime import datetime, timedelta
+from functools import partial
+
+import numpy as np
+
+from library import analytics, catalog, changes, circulation, export, fines, holds, metrics, profiling, reports, users
+from library.bootstrap import bootstrap
+from library.bulk_import import detect_format, import_books
+from library.db import get_pool
+from library.search import search_books
+from library.statements import registry
 
 # Page configuration
 st.set_page_config(
@@ -13,7 +24,8 @@ st.set_page_config(
 
 # Custom CSS for better UI
 
-st.markdown("""
+with profiling.phase("css"):
+    st.markdown("""
 <style>
      body {
             background-color: #87CEEB !important;
@@ -55,7 +67,8 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-st.markdown("""
+with profiling.phase("css"):
+    st.markdown("""
 <style>
     .footer {
         position: fixed;
@@ -77,95 +90,61 @@ if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
 if "username" not in st.session_state:
     st.session_state.username = ""
+if "auth_token" not in st.session_state:
+    st.session_state.auth_token = None
 
-# Database connection function
-def get_sqlite_connection():
-    try:
-        conn = sqlite3.connect('library.db', check_same_thread=False)
-        return conn, None
-    except Exception as e:
-        return None, e
+# Paginated table views
+PAGE_SIZES = [25, 50, 100]
+BOOK_COLUMNS = ["Book Name", "Book Code", "Available", "Subject"]
+LOAN_COLUMNS = ["ID", "Student Name", "Reg No", "Book Name", "Book Code", "Issue Date", "Due Date"]
 
-# Function to execute SQL queries with error handling
-def execute_query(query, data=None, fetch=False):
-    # Convert MySQL queries to SQLite format if needed
-    query = query.replace("AUTO_INCREMENT", "AUTOINCREMENT")
-    query = query.replace("TINYINT(1)", "INTEGER")
-    query = query.replace("CURDATE()", "date('now')")
-    
-    conn, error = get_sqlite_connection()
-    
-    if error:
-        st.error(f"Database connection error: {error}")
-        return None
-    
-    try:
-        cursor = conn.cursor()
-        if data:
-            cursor.execute(query, data)
-        else:
-            cursor.execute(query)
-            
-        if fetch:
-            result = cursor.fetchall()
-            cursor.close()
-            return result
-        else:
-            conn.commit()
-            cursor.close()
-            return True
-    except Exception as e:
-        st.error(f"SQLite query execution error: {e}")
-        return None
-    finally:
-        if conn:
-            conn.close()
+# Cached statistics; every write made through this app clears them
+STATS_TTL_SECONDS = 30
 
-# Function to initialize database tables
+@st.cache_data(ttl=STATS_TTL_SECONDS, show_spinner=False)
+def cached_dashboard_stats():
+    return reports.dashboard_stats()
+
+@st.cache_data(ttl=STATS_TTL_SECONDS, show_spinner=False)
+def cached_recent_activity():
+    return reports.recent_activity()
+
+@st.cache_data(ttl=STATS_TTL_SECONDS, show_spinner=False)
+def cached_subjects():
+    return catalog.subjects()
+
+# Function to drop cached statistics after a write
+def invalidate_stats():
+    cached_dashboard_stats.clear()
+    cached_recent_activity.clear()
+    cached_subjects.clear()
+
+# Function to drop cached loan statistics after a write in any process
+def invalidate_loan_stats(bcodes):
+    cached_dashboard_stats.clear()
+    cached_recent_activity.clear()
+
+# Function to drop cached statistics and subjects after a catalog write in any process
+def invalidate_catalog_stats(bcodes):
+    invalidate_stats()
+
+# Function to clear these caches when other server processes write, once per process
+@st.cache_resource(show_spinner=False)
+def watch_changes():
+    changes.subscribe(changes.BOOKS, invalidate_catalog_stats)
+    changes.subscribe(changes.STOCK, invalidate_loan_stats)
+    changes.subscribe(changes.LOANS, invalidate_loan_stats)
+    return changes.watcher
+
+# Function to initialize database tables, once per server process
+@st.cache_resource(show_spinner=False)
 def initialize_database():
-    # Create books table for SQLite
-    books_table = """
-    CREATE TABLE IF NOT EXISTS books (
-        bname TEXT NOT NULL,
-        bcode TEXT PRIMARY KEY,
-        total INTEGER NOT NULL,
-        subject TEXT NOT NULL
-    )
-    """
-    execute_query(books_table)
-    
-    # Create issue table for SQLite
-    issue_table = """
-    CREATE TABLE IF NOT EXISTS issue (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        regno TEXT NOT NULL,
-        bcode TEXT NOT NULL,
-        idate DATE NOT NULL,
-        due_date DATE NOT NULL,
-        return_date DATE,
-        returned INTEGER DEFAULT 0,
-        FOREIGN KEY (bcode) REFERENCES books(bcode)
-    )
-    """
-    execute_query(issue_table)
-    
-    # Add sample data if the tables are empty
-    check_books = "SELECT COUNT(*) FROM books"
-    result = execute_query(check_books, fetch=True)
-    if result and result[0][0] == 0:
-        # Add sample books
-        sample_books = [
-            ('The Great Gatsby', 'BOOK001', 5, 'Fiction'),
-            ('To Kill a Mockingbird', 'BOOK002', 3, 'Fiction'),
-            ('Introduction to Algorithms', 'BOOK003', 2, 'Computer Science'),
-            ('Database Systems', 'BOOK004', 4, 'Computer Science'),
-            ('Physics for Scientists and Engineers', 'BOOK005', 3, 'Science')
-        ]
-        
-        for book in sample_books:
-            insert_query = "INSERT INTO books (bname, bcode, total, subject) VALUES (?, ?, ?, ?)"
-            execute_query(insert_query, book)
+    # Migrations and sample data; failures are not cached, so the next rerun retries
+    startup = bootstrap()
+    # Expires uncollected holds and folds new loans into the analytics in the background
+    holds.start_scheduler()
+    analytics.start_refresher()
+    return startup
 
 # Function to add a new book
 def add_book():
@@ -183,20 +162,72 @@ def add_book():
     
     if st.button("Add Book", key="add_book_btn"):
         if bname and bcode and total and sub:
-            # Check if book code already exists
-            check_query = "SELECT bcode FROM books WHERE bcode = ?"
-            result = execute_query(check_query, (bcode,), fetch=True)
-            
-            if result:
-                st.markdown("<div class='warning-msg'>⚠️ Book with this code already exists!</div>", unsafe_allow_html=True)
+            try:
+                catalog.add_book(bname, bcode, int(total), sub)
+            except catalog.DuplicateBook as e:
+                st.markdown(f"<div class='warning-msg'>⚠️ {e}</div>", unsafe_allow_html=True)
+            except Exception as e:
+                st.error(f"SQLite query execution error: {e}")
             else:
-                sql = "INSERT INTO books (bname, bcode, total, subject) VALUES (?, ?, ?, ?)"
-                data = (bname, bcode, total, sub)
-                if execute_query(sql, data):
-                    st.markdown(f"<div class='success-msg'>✅ Book '{bname}' added successfully!</div>", unsafe_allow_html=True)
+                invalidate_stats()
+                st.markdown(f"<div class='success-msg'>✅ Book '{bname}' added successfully!</div>", unsafe_allow_html=True)
         else:
             st.markdown("<div class='warning-msg'>⚠️ Please fill all fields before adding the book.</div>", unsafe_allow_html=True)
 
+# Function to bulk import books from a file
+def bulk_import_books():
+    st.markdown("<h2 class='sub-header'>📥 Import Books</h2>", unsafe_allow_html=True)
+    st.markdown("Upload a CSV file with the columns `bname, bcode, total, subject`, "
+                "or a JSONL file with one book object per line. Existing book codes are updated.")
+    
+    uploaded = st.file_uploader("Catalog File", type=["csv", "jsonl", "ndjson"])
+    
+    if uploaded and st.button("Import Books", key="import_books_btn"):
+        progress_text = st.empty()
+        
+        def report(result):
+            progress_text.markdown(
+                f"{result.imported + result.rejected:,} rows read · "
+                f"{result.rejected:,} rejected · {result.rows_per_sec:,.0f} rows/sec"
+            )
+        
+        stream = io.TextIOWrapper(uploaded, encoding="utf-8", newline="")
+        try:
+            result = import_books(stream, detect_format(uploaded.name), progress=report)
+        except Exception as e:
+            st.markdown(f"<div class='error-msg'>❌ Import failed: {e}</div>", unsafe_allow_html=True)
+            return
+        finally:
+            invalidate_stats()
+        
+        st.markdown(
+            f"<div class='success-msg'>✅ Imported {result.imported:,} books in {result.seconds:.2f}s "
+            f"({result.rows_per_sec:,.0f} rows/sec).</div>",
+            unsafe_allow_html=True
+        )
+        if result.rejected:
+            st.markdown(f"<div class='warning-msg'>⚠️ {result.rejected:,} rows were rejected.</div>", unsafe_allow_html=True)
+            st.code("\n".join(result.errors))
+
+# Function to pick a book by typing part of its title or code
+PICKER_LIMIT = 20
+
+def book_picker(key, empty_message, label="Select Book", available_only=False):
+    query = st.text_input("Find Book", placeholder="Type a title or book code", key=f"{key}_find")
+    try:
+        matches = catalog.find_books(query, limit=PICKER_LIMIT, available_only=available_only)
+    except Exception as e:
+        st.error(f"SQLite query execution error: {e}")
+        matches = []
+    
+    if matches:
+        book_options = {book.label(): book.bcode for book in matches}
+        selected_book = st.selectbox(label, options=list(book_options.keys()), key=f"{key}_book")
+        return book_options[selected_book] if selected_book else ""
+    
+    st.warning(empty_message)
+    return st.text_input("Book Code", placeholder="Enter book code", key=f"{key}_code")
+
 # Function to issue a book
 def issue_book():
     st.markdown("<h2 class='sub-header'>📖 Issue a Book</h2>", unsafe_allow_html=True)
@@ -208,79 +239,98 @@ def issue_book():
         rno = st.text_input("Registration Number", placeholder="Enter registration number")
     
     with col2:
-        # Fetch available books for selection
-        books_query = "SELECT bname, bcode FROM books WHERE total > 0"
-        books = execute_query(books_query, fetch=True)
-        
-        if books:
-            book_options = {f"{book[0]} ({book[1]})": book[1] for book in books}
-            selected_book = st.selectbox("Select Book", options=list(book_options.keys()))
-            code = book_options[selected_book] if selected_book else ""
-        else:
-            st.warning("No books available for issue")
-            code = st.text_input("Book Code", placeholder="Enter book code")
+        # Typeahead over the shared catalog index instead of loading every title
+        code = book_picker("issue", "No books available for issue", available_only=True)
         
         date = st.date_input("Issue Date", value=datetime.now())
         due_date = st.date_input("Due Date", value=datetime.now() + timedelta(days=14))
     
     if st.button("Issue Book", key="issue_book_btn"):
         if name and rno and code:
-            # Check if book exists and has stock
-            check_query = "SELECT total FROM books WHERE bcode = ?"
-            result = execute_query(check_query, (code,), fetch=True)
-            
-            if not result:
-                st.markdown("<div class='error-msg'>❌ Book not found in the system.</div>", unsafe_allow_html=True)
-            elif result[0][0] <= 0:
-                st.markdown("<div class='warning-msg'>⚠️ Book is out of stock.</div>", unsafe_allow_html=True)
+            # Stock check, duplicate check, loan insert and stock update in one transaction
+            try:
+                circulation.issue_book(name, rno, code, date, due_date)
+            except circulation.BookNotFound as e:
+                st.markdown(f"<div class='error-msg'>❌ {e}</div>", unsafe_allow_html=True)
+            except circulation.OutOfStock as e:
+                st.markdown(f"<div class='warning-msg'>⚠️ {e} Place a hold on the 🔖 Holds page to join the waiting list.</div>", unsafe_allow_html=True)
+            except circulation.CirculationError as e:
+                st.markdown(f"<div class='warning-msg'>⚠️ {e}</div>", unsafe_allow_html=True)
+            except Exception as e:
+                st.error(f"SQLite query execution error: {e}")
             else:
-                # Check if student already has this book
-                check_issue = "SELECT id FROM issue WHERE regno = ? AND bcode = ? AND returned = 0"
-                issue_result = execute_query(check_issue, (rno, code), fetch=True)
-                
-                if issue_result:
-                    st.markdown("<div class='warning-msg'>⚠️ This student already has this book issued.</div>", unsafe_allow_html=True)
-                else:
-                    sql = "INSERT INTO issue (name, regno, bcode, idate, due_date, returned) VALUES (?, ?, ?, ?, ?, ?)"
-                    data = (name, rno, code, date, due_date, 0)
-                    if execute_query(sql, data):
-                        # Update book stock
-                        update_query = "UPDATE books SET total = total - 1 WHERE bcode = ?"
-                        if execute_query(update_query, (code,)):
-                            st.markdown(f"<div class='success-msg'>📘 Book '{code}' issued to {name} successfully!</div>", unsafe_allow_html=True)
+                invalidate_stats()
+                st.markdown(f"<div class='success-msg'>📘 Book '{code}' issued to {name} successfully!</div>", unsafe_allow_html=True)
         else:
             st.markdown("<div class='warning-msg'>⚠️ Please fill all fields before issuing the book.</div>", unsafe_allow_html=True)
 
+# Function to draw previous/next controls over a stack of page cursors
+def page_navigation(cursors, next_cursor, key, caption):
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("← Previous", key=f"{key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(caption)
+    with col3:
+        if st.button("Next →", key=f"{key}_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+
+# Function to fetch one page of a paginated listing as a DataFrame
+def paged_table(key, columns, sort_labels, fetch_page, count_rows, filters=()):
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        sort = st.selectbox("Sort by", sort_labels, key=f"{key}_sort")
+    with col2:
+        descending = st.checkbox("Descending", key=f"{key}_desc")
+    with col3:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_size")
+    
+    # Start again from the first page whenever ordering or filters change
+    signature = (sort, descending, page_size, tuple(filters))
+    state = st.session_state.setdefault(f"{key}_pages", {"signature": None, "cursors": [None]})
+    if state["signature"] != signature:
+        state["signature"] = signature
+        state["cursors"] = [None]
+    cursors = state["cursors"]
+    
+    try:
+        with profiling.phase("query"):
+            page = fetch_page(sort=sort, after=cursors[-1], page_size=page_size, descending=descending)
+            total = count_rows()
+    except Exception as e:
+        st.error(f"SQLite query execution error: {e}")
+        return None
+    
+    first = (len(cursors) - 1) * page_size
+    caption = f"Rows {first + 1:,}–{first + len(page.rows):,} of {total:,}" if page.rows else f"{total:,} rows"
+    page_navigation(cursors, page.next_cursor, key, caption)
+    with profiling.phase("dataframe"):
+        return pd.DataFrame(page.rows, columns=columns)
+
 # Function to return a book
 def submit_book():
     st.markdown("<h2 class='sub-header'>📤 Return a Book</h2>", unsafe_allow_html=True)
     
-    # Get list of issued books
-    issued_query = """
-    SELECT i.id, i.name, i.regno, b.bname, i.bcode, i.idate, i.due_date 
-    FROM issue i 
-    JOIN books b ON i.bcode = b.bcode 
-    WHERE i.returned = 0
-    """
-    issued_books = execute_query(issued_query, fetch=True)
+    # Get one page of issued books
+    df = paged_table("return", LOAN_COLUMNS, reports.LOAN_SORTS, reports.open_loans, reports.count_open_loans)
     
-    if not issued_books:
+    if df is None or df.empty:
         st.info("No books are currently issued")
         return
     
-    # Create a DataFrame for better display
-    df = pd.DataFrame(
-        issued_books, 
-        columns=["ID", "Student Name", "Reg No", "Book Name", "Book Code", "Issue Date", "Due Date"]
-    )
-    
-    # Calculate overdue status
-    today = datetime.now().date()
-    df["Status"] = df["Due Date"].apply(lambda x: "Overdue" if x < today else "Active")
-    df["Days Overdue"] = df["Due Date"].apply(lambda x: (today - x).days if x < today else 0)
+    # Calculate overdue status and fines for the whole page at once
+    with profiling.phase("dataframe"):
+        days = fines.days_overdue(df["Due Date"])
+        df["Status"] = np.where(days > 0, "Overdue", "Active")
+        df["Days Overdue"] = days
+        df["Fine"] = fines.DEFAULT_POLICY.fines(days)
     
     # Display the table with styling
-    st.dataframe(df)
+    with profiling.phase("render"):
+        st.dataframe(df)
     
     # Return book form
     col1, col2 = st.columns(2)
@@ -293,21 +343,19 @@ def submit_book():
     
     if st.button("Return Book", key="return_book_btn"):
         if selected_id:
-            # Get the book code for the selected issue
-            book_code_query = "SELECT bcode FROM issue WHERE id = ?"
-            book_code_result = execute_query(book_code_query, (selected_id,), fetch=True)
-            
-            if book_code_result:
-                book_code = book_code_result[0][0]
-                
-                # Mark as returned in issue table
-                update_issue = "UPDATE issue SET returned = 1, return_date = ? WHERE id = ?"
-                if execute_query(update_issue, (return_date, selected_id)):
-                    # Update book stock
-                    update_book = "UPDATE books SET total = total + 1 WHERE bcode = ?"
-                    if execute_query(update_book, (book_code,)):
-                        st.markdown(f"<div class='success-msg'>📘 Book returned successfully!</div>", unsafe_allow_html=True)
-                        st.rerun()
+            # Close the loan and restock the copy, or set it aside for the next hold, in one transaction
+            try:
+                _, hold = circulation.return_copy(int(selected_id), return_date)
+            except circulation.CirculationError as e:
+                st.markdown(f"<div class='warning-msg'>⚠️ {e}</div>", unsafe_allow_html=True)
+            except Exception as e:
+                st.error(f"SQLite query execution error: {e}")
+            else:
+                invalidate_stats()
+                if hold:
+                    st.toast(f"🔖 Copy set aside for {hold.name} ({hold.regno}) until {hold.expires_at:%Y-%m-%d %H:%M}")
+                st.markdown(f"<div class='success-msg'>📘 Book returned successfully!</div>", unsafe_allow_html=True)
+                st.rerun()
         else:
             st.markdown("<div class='warning-msg'>⚠️ Please select an issue to return.</div>", unsafe_allow_html=True)
 
@@ -315,93 +363,197 @@ def submit_book():
 def delete_book():
     st.markdown("<h2 class='sub-header'>🗑️ Delete a Book</h2>", unsafe_allow_html=True)
     
-    # Get list of books
-    books_query = "SELECT bname, bcode, total, subject FROM books"
-    books = execute_query(books_query, fetch=True)
+    # Get one page of books
+    df = paged_table("delete", BOOK_COLUMNS, catalog.BOOK_SORTS, catalog.list_books, catalog.count_books)
     
-    if not books:
+    if df is None or df.empty:
         st.info("No books available in the library")
         return
     
-    # Create a DataFrame for better display
-    df = pd.DataFrame(books, columns=["Book Name", "Book Code", "Available", "Subject"])
-    st.dataframe(df)
+    with profiling.phase("render"):
+        st.dataframe(df)
     
     # Book deletion form
-    book_codes = [book[1] for book in books]
-    selected_code = st.selectbox("Select Book Code to Delete", options=book_codes)
+    selected_code = book_picker("delete", "No books match", label="Select Book to Delete")
     
     if st.button("Delete Book", key="delete_book_btn"):
         if selected_code:
-            # Check if book is currently issued
-            check_issued = "SELECT id FROM issue WHERE bcode = ? AND returned = 0"
-            issued_result = execute_query(check_issued, (selected_code,), fetch=True)
-            
-            if issued_result:
-                st.markdown("<div class='warning-msg'>⚠️ Cannot delete book as it is currently issued to students.</div>", unsafe_allow_html=True)
+            # Refuses while the book is issued to students
+            try:
+                catalog.delete_book(selected_code)
+            except (catalog.CatalogError, circulation.CirculationError) as e:
+                st.markdown(f"<div class='warning-msg'>⚠️ {e}</div>", unsafe_allow_html=True)
+            except Exception as e:
+                st.error(f"SQLite query execution error: {e}")
             else:
-                delete_query = "DELETE FROM books WHERE bcode = ?"
-                if execute_query(delete_query, (selected_code,)):
-                    st.markdown("<div class='success-msg'>🗑️ Book deleted successfully!</div>", unsafe_allow_html=True)
-                    st.rerun()
+                invalidate_stats()
+                st.markdown("<div class='success-msg'>🗑️ Book deleted successfully!</div>", unsafe_allow_html=True)
+                st.rerun()
         else:
             st.markdown("<div class='warning-msg'>⚠️ Please select a book to delete.</div>", unsafe_allow_html=True)
 
+# Function to place, check out and cancel holds on out-of-stock books
+def manage_holds():
+    st.markdown("<h2 class='sub-header'>🔖 Holds</h2>", unsafe_allow_html=True)
+    
+    try:
+        with profiling.phase("query"):
+            counts = holds.count_holds()
+    except Exception as e:
+        st.error(f"SQLite query execution error: {e}")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Students Waiting", counts["waiting"])
+    with col2:
+        st.metric("Ready for Pickup", counts["ready"])
+    
+    with st.expander("➕ Place a Hold"):
+        col1, col2 = st.columns(2)
+        with col1:
+            name = st.text_input("Student Name", placeholder="Enter student name", key="hold_name")
+            rno = st.text_input("Registration Number", placeholder="Enter registration number", key="hold_regno")
+        with col2:
+            code = book_picker("hold", "No books match")
+        
+        if st.button("Place Hold", key="place_hold_btn"):
+            if name and rno and code:
+                try:
+                    hold_id, position = holds.place_hold(name, rno, code)
+                except holds.HoldError as e:
+                    st.markdown(f"<div class='warning-msg'>⚠️ {e}</div>", unsafe_allow_html=True)
+                except Exception as e:
+                    st.error(f"SQLite query execution error: {e}")
+                else:
+                    st.markdown(f"<div class='success-msg'>🔖 Hold #{hold_id} placed for {name}; position {position} in the queue.</div>", unsafe_allow_html=True)
+            else:
+                st.markdown("<div class='warning-msg'>⚠️ Please fill all fields before placing the hold.</div>", unsafe_allow_html=True)
+    
+    # Active holds in queue order
+    bcode = st.text_input("Filter by Book Code", placeholder="All books", key="holds_bcode").strip()
+    try:
+        with profiling.phase("query"):
+            active = holds.active_holds(bcode=bcode or None)
+    except Exception as e:
+        st.error(f"SQLite query execution error: {e}")
+        return
+    
+    if not active:
+        st.info("No active holds")
+        return
+    
+    df = pd.DataFrame(active, columns=["ID", "Student Name", "Reg No", "Book Code", "Status", "Placed", "Pickup By"])
+    with profiling.phase("render"):
+        st.dataframe(df, use_container_width=True)
+    
+    by_id = {hold.id: hold for hold in active}
+    selected_id = st.selectbox("Select Hold", options=list(by_id), key="hold_select",
+                               format_func=lambda hold_id: f"#{hold_id} · {by_id[hold_id].name} · {by_id[hold_id].bcode} ({by_id[hold_id].status})")
+    hold = by_id[selected_id]
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        # Issues the copy set aside for this student
+        if st.button("Check Out", key="checkout_hold_btn", disabled=hold.status != "ready"):
+            today = datetime.now().date()
+            try:
+                circulation.issue_book(hold.name, hold.regno, hold.bcode, today, today + timedelta(days=14))
+            except circulation.CirculationError as e:
+                st.markdown(f"<div class='warning-msg'>⚠️ {e}</div>", unsafe_allow_html=True)
+            except Exception as e:
+                st.error(f"SQLite query execution error: {e}")
+            else:
+                invalidate_stats()
+                st.rerun()
+    with col2:
+        if st.button("Cancel Hold", key="cancel_hold_btn"):
+            try:
+                holds.cancel_hold(hold.id)
+            except holds.HoldError as e:
+                st.markdown(f"<div class='warning-msg'>⚠️ {e}</div>", unsafe_allow_html=True)
+            except Exception as e:
+                st.error(f"SQLite query execution error: {e}")
+            else:
+                invalidate_stats()
+                st.rerun()
+
 # Function to display all books
+SEARCH_PAGE_SIZE = 25
+
 def display_books():
     st.markdown("<h2 class='sub-header'>📚 Library Books</h2>", unsafe_allow_html=True)
     
     # Search functionality
-    search_term = st.text_input("Search by book name or subject", placeholder="Enter search term...")
+    search_term = st.text_input("Search by book name, code or subject",
+                                placeholder='Enter words, prefixes or a "quoted phrase"...')
+    
+    # Add filters
+    col1, col2 = st.columns(2)
+    with col1:
+        selected_subject = st.selectbox("Filter by Subject", options=["All"] + cached_subjects())
+    
+    with col2:
+        availability = st.checkbox("Show only available books")
     
     # Get books with optional search filter
+    filters = {"subject": None if selected_subject == "All" else selected_subject,
+               "available_only": availability}
     if search_term:
-        books_query = """
-        SELECT bname, bcode, total, subject FROM books 
-        WHERE bname LIKE ? OR subject LIKE ?
-        ORDER BY bname
-        """
-        search_param = f"%{search_term}%"
-        books = execute_query(books_query, (search_param, search_param), fetch=True)
+        # Ranked full-text search, paged with keyset cursors
+        search_key = (search_term, tuple(filters.items()))
+        if st.session_state.get("search_key") != search_key:
+            st.session_state.search_key = search_key
+            st.session_state.search_cursors = [None]
+        cursors = st.session_state.search_cursors
+        try:
+            with profiling.phase("query"):
+                books, next_cursor = search_books(search_term, limit=SEARCH_PAGE_SIZE,
+                                                  after=cursors[-1], **filters)
+        except Exception as e:
+            st.error(f"SQLite query execution error: {e}")
+            books, next_cursor = [], None
+        page_navigation(cursors, next_cursor, "search", f"Best matches, page {len(cursors)}")
+        with profiling.phase("dataframe"):
+            df = pd.DataFrame(books, columns=BOOK_COLUMNS)
     else:
-        books_query = "SELECT bname, bcode, total, subject FROM books ORDER BY bname"
-        books = execute_query(books_query, fetch=True)
-    
-    if books:
-        # Create a DataFrame for better display
-        df = pd.DataFrame(books, columns=["Book Name", "Book Code", "Available", "Subject"])
-        
-        # Add filters
-        col1, col2 = st.columns(2)
-        with col1:
-            subjects = ["All"] + sorted(list(set([book[3] for book in books])))
-            selected_subject = st.selectbox("Filter by Subject", options=subjects)
-        
-        with col2:
-            availability = st.checkbox("Show only available books")
-        
-        # Apply filters
-        filtered_df = df
-        if selected_subject != "All":
-            filtered_df = filtered_df[filtered_df["Subject"] == selected_subject]
-        
-        if availability:
-            filtered_df = filtered_df[filtered_df["Available"] > 0]
-        
+        # Push filters into the paged query
+        df = paged_table(
+            "books", BOOK_COLUMNS, catalog.BOOK_SORTS,
+            partial(catalog.list_books, **filters), partial(catalog.count_books, **filters),
+            filters=tuple(filters.items())
+        )
+    
+    if df is not None and not df.empty:
         # Display the table
-        st.dataframe(filtered_df, use_container_width=True)
-        
-        # Display statistics
-        st.markdown("### 📊 Library Statistics")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Total Books", len(df))
-        with col2:
-            st.metric("Available Books", df["Available"].sum())
-        with col3:
-            st.metric("Unique Subjects", len(df["Subject"].unique()))
+        with profiling.phase("render"):
+            st.dataframe(df, use_container_width=True)
     else:
         st.info("📌 No books available in the library.")
+    
+    # Display statistics
+    stats = cached_dashboard_stats()
+    st.markdown("### 📊 Library Statistics")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total Books", stats["book_titles"])
+    with col2:
+        st.metric("Available Books", stats["book_copies"])
+    with col3:
+        st.metric("Unique Subjects", stats["subjects"])
+
+# Function to stream the filtered loan history into a temporary file for download
+def export_history_file(fmt, start, end, regno):
+    output = tempfile.TemporaryFile()
+    if fmt == "csv":
+        text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+        export.export_history(text, "csv", start, end, regno or None)
+        text.flush()
+        text.detach()
+    else:
+        export.export_history(output, "parquet", start, end, regno or None)
+    output.seek(0)
+    return output
 
 # Function to view issued books and overdue reports
 def view_reports():
@@ -409,84 +561,224 @@ def view_reports():
     
     report_type = st.radio(
         "Select Report Type",
-        ["Currently Issued Books", "Overdue Books", "Return History"]
+        ["Currently Issued Books", "Overdue Books", "Fines by Student", "Borrowing Trends", "Return History"]
     )
     
     if report_type == "Currently Issued Books":
-        issued_query = """
-        SELECT i.name, i.regno, b.bname, i.bcode, i.idate, i.due_date 
-        FROM issue i 
-        JOIN books b ON i.bcode = b.bcode 
-        WHERE i.returned = 0
-        ORDER BY i.due_date
-        """
-        issued_books = execute_query(issued_query, fetch=True)
+        df = paged_table("issued_report", LOAN_COLUMNS, reports.LOAN_SORTS,
+                         reports.open_loans, reports.count_open_loans)
         
-        if issued_books:
-            df = pd.DataFrame(
-                issued_books, 
-                columns=["Student Name", "Reg No", "Book Name", "Book Code", "Issue Date", "Due Date"]
-            )
-            st.dataframe(df, use_container_width=True)
+        if df is not None and not df.empty:
+            with profiling.phase("render"):
+                st.dataframe(df.drop(columns=["ID"]), use_container_width=True)
         else:
             st.info("No books are currently issued")
     
     elif report_type == "Overdue Books":
-        today = datetime.now().date()
+        df = paged_table("overdue_report", LOAN_COLUMNS, reports.LOAN_SORTS,
+                         partial(reports.open_loans, overdue_only=True),
+                         partial(reports.count_open_loans, overdue_only=True))
         
-        # Use SQLite syntax
-        overdue_query = """
-        SELECT i.name, i.regno, b.bname, i.bcode, i.idate, i.due_date 
-        FROM issue i 
-        JOIN books b ON i.bcode = b.bcode 
-        WHERE i.returned = 0 AND i.due_date < date('now')
-        ORDER BY i.due_date
-        """
-        overdue_books = execute_query(overdue_query, fetch=True)
+        if df is not None and not df.empty:
+            # Calculate days overdue and fines
+            with profiling.phase("dataframe"):
+                df = df.drop(columns=["ID"])
+                df["Days Overdue"] = fines.days_overdue(df["Due Date"])
+                df["Fine"] = fines.DEFAULT_POLICY.fines(df["Days Overdue"])
+            with profiling.phase("render"):
+                st.dataframe(df, use_container_width=True)
+        else:
+            st.success("No overdue books!")
+    
+    elif report_type == "Fines by Student":
+        try:
+            with profiling.phase("query"):
+                outstanding = fines.total_outstanding()
+                student_fines = fines.student_fines(limit=100)
+        except Exception as e:
+            st.error(f"SQLite query execution error: {e}")
+            return
         
-        if overdue_books:
+        st.metric("Total Outstanding Fines", f"{outstanding:,.0f}")
+        if student_fines:
             df = pd.DataFrame(
-                overdue_books, 
-                columns=["Student Name", "Reg No", "Book Name", "Book Code", "Issue Date", "Due Date"]
+                student_fines,
+                columns=["Reg No", "Student Name", "Overdue Books", "Days Overdue", "Fine"]
             )
-            # Calculate days overdue
-            df["Days Overdue"] = df["Due Date"].apply(lambda x: (today - x).days)
-            st.dataframe(df, use_container_width=True)
+            with profiling.phase("render"):
+                st.dataframe(df, use_container_width=True)
         else:
-            st.success("No overdue books!")
+            st.success("No outstanding fines!")
+    
+    elif report_type == "Borrowing Trends":
+        borrowing_trends()
     
     else:  # Return History
-        history_query = """
-        SELECT i.name, i.regno, b.bname, i.bcode, i.idate, i.return_date 
-        FROM issue i 
-        JOIN books b ON i.bcode = b.bcode 
-        WHERE i.returned = 1
-        ORDER BY i.return_date DESC
-        LIMIT 100
-        """
-        history = execute_query(history_query, fetch=True)
+        try:
+            with profiling.phase("query"):
+                history = reports.return_history(limit=100)
+        except Exception as e:
+            st.error(f"SQLite query execution error: {e}")
+            history = []
         
         if history:
             df = pd.DataFrame(
                 history, 
                 columns=["Student Name", "Reg No", "Book Name", "Book Code", "Issue Date", "Return Date"]
             )
-            st.dataframe(df, use_container_width=True)
+            with profiling.phase("render"):
+                st.dataframe(df, use_container_width=True)
         else:
             st.info("No return history available")
+        
+        # The table above shows only the latest returns; auditors download everything
+        with st.expander("📤 Export Full Loan History"):
+            col1, col2 = st.columns(2)
+            with col1:
+                start = st.date_input("Issued From", value=None, key="export_start")
+                regno = st.text_input("Student Reg No (optional)", key="export_regno").strip()
+            with col2:
+                end = st.date_input("Issued To", value=None, key="export_end")
+                fmt = st.selectbox("Format", ["CSV", "Parquet"], key="export_format").lower()
+            
+            st.download_button(
+                "⬇️ Download History",
+                data=partial(export_history_file, fmt, start, end, regno),
+                file_name=f"loan_history.{fmt}",
+                mime="text/csv" if fmt == "csv" else "application/vnd.apache.parquet",
+                on_click="ignore",
+            )
+
+# Function to show popular titles and "also borrowed" from the analytics aggregates
+def borrowing_trends():
+    try:
+        with profiling.phase("query"):
+            # New loans are folded in by a background thread; lookups read the aggregates only
+            pending = analytics.pending_loans()
+    except Exception as e:
+        st.error(f"SQLite query execution error: {e}")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        subject = st.selectbox("Subject", options=["All"] + cached_subjects(), key="trends_subject")
+    with col2:
+        window = st.selectbox("Period", options=list(analytics.WINDOWS), index=2, key="trends_window")
+    
+    try:
+        with profiling.phase("query"):
+            popular = analytics.popular_titles(
+                None if subject == "All" else subject, analytics.WINDOWS[window], limit=20
+            )
+    except Exception as e:
+        st.error(f"SQLite query execution error: {e}")
+        popular = []
+    
+    st.markdown("#### Most Borrowed Titles")
+    if popular:
+        df = pd.DataFrame(popular, columns=["Book Name", "Book Code", "Subject", "Loans"])
+        with profiling.phase("render"):
+            st.dataframe(df, use_container_width=True)
+    else:
+        st.info("No loans in this period")
+    
+    st.markdown("#### Students Who Borrowed This Also Borrowed")
+    code = book_picker("trends", "No books match")
+    if code:
+        try:
+            with profiling.phase("query"):
+                also = analytics.also_borrowed(code, limit=10)
+        except Exception as e:
+            st.error(f"SQLite query execution error: {e}")
+            also = []
+        if also:
+            df = pd.DataFrame(also, columns=["Book Name", "Book Code", "Students"])
+            with profiling.phase("render"):
+                st.dataframe(df, use_container_width=True)
+        else:
+            st.info("No other titles borrowed by the same students yet")
+    
+    if pending:
+        st.caption(f"{pending:,} recent loans are not counted yet; they are added within a few minutes "
+                   "(or run `python refresh_analytics.py`).")
+
+# Function to show query latency metrics and the slow-query log (admin only)
+def query_metrics():
+    st.markdown("<h1 class='main-header'>📈 Query Metrics</h1>", unsafe_allow_html=True)
+    
+    with st.expander("Statement Cache"):
+        st.json(registry.stats(get_pool()))
+        st.caption("Each pooled SQLite connection keeps its last `cache_size` statements compiled "
+                   "(`LIBRARY_STATEMENT_CACHE_SIZE`); MySQL also caches their translations.")
+    
+    if not metrics.enabled():
+        st.markdown("<div class='warning-msg'>⚠️ Query metrics are off. Restart the app with LIBRARY_QUERY_METRICS=1 to collect them.</div>", unsafe_allow_html=True)
+        return
+    
+    snapshot = metrics.metrics.snapshot()
+    pages = sorted({row["page"] for row in snapshot})
+    page = st.selectbox("Page", ["All pages"] + pages, key="metrics_page")
+    if page != "All pages":
+        snapshot = [row for row in snapshot if row["page"] == page]
+    
+    if snapshot:
+        df = pd.DataFrame(snapshot)
+        df.columns = ["Page", "Statement", "Calls", "Rows", "Total (ms)", "Mean (ms)", "p95 (ms)", "Max (ms)"]
+        st.dataframe(df, use_container_width=True)
+    else:
+        st.info("No queries recorded yet")
+    
+    st.markdown(f"### Slow Queries (over {metrics.metrics.slow_seconds * 1000:.0f} ms)")
+    slow = metrics.metrics.slow_queries()
+    if not slow:
+        st.success("No slow queries recorded!")
+    for entry in slow:
+        with st.expander(f"{entry.seconds * 1000:.1f} ms · {entry.page} · {entry.statement[:80]}"):
+            st.code(entry.sql, language="sql")
+            st.text("\n".join(entry.plan) or "(no plan)")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("⬇️ Prometheus Metrics", metrics.metrics.prometheus(),
+                           file_name="library_metrics.prom", mime="text/plain")
+    with col2:
+        if st.button("Reset Metrics"):
+            metrics.metrics.reset()
+            st.rerun()
+
+# Function to show aggregated render timings below the page (LIBRARY_PROFILE=1)
+def render_profile_panel():
+    with st.expander("⏱️ Render Profile"):
+        snapshot = profiling.profiler.snapshot()
+        if snapshot:
+            df = pd.DataFrame(snapshot)
+            df["page"] = df["page"].replace("-", "(app)")
+            df.columns = ["Page", "Phase", "Calls", "Total (ms)", "Mean (ms)", "p95 (ms)", "Max (ms)"]
+            st.dataframe(df, use_container_width=True)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("Profile Next Rerun", key="profile_capture_btn"):
+                st.session_state["profile_capture"] = True
+                st.rerun()
+        with col2:
+            if profiling.PROFILE_DIR and st.button("Save to Disk", key="profile_dump_btn"):
+                st.caption(f"Saved {profiling.profiler.dump()}")
+        with col3:
+            if st.button("Reset Profile", key="profile_reset_btn"):
+                profiling.profiler.reset()
+                st.rerun()
+        
+        for capture in profiling.profiler.captures():
+            st.markdown(f"**{capture.page}** rerun, {capture.seconds * 1000:.1f} ms"
+                        + (f" (saved to `{capture.path}`)" if capture.path else ""))
+            st.code(capture.text, language=None)
 
-# Function for login with proper authentication
+# Function for login against the hashed staff accounts
 def login():
  
     st.markdown("<h1 class='main-header'>🔐 Library Management System</h1>", unsafe_allow_html=True)
     
-    # In a real application, you would store usernames and hashed passwords in the database
-    # For this example, we'll use a simple dictionary
-    valid_users = {
-        "admin": "12345",
-        "librarian": "library2025"
-    }
-    
     col1, col2 = st.columns([1, 1])
     
     with col1:
@@ -498,30 +790,100 @@ def login():
         password = st.text_input("Password", type="password", placeholder="Enter password")
         
         if st.button("Login", key="login_btn"):
-            if username in valid_users and password == valid_users[username]:
+            # The password is hashed once here; later reruns only check the session token
+            try:
+                user, token = users.login(username.strip(), password)
+            except Exception as e:
+                st.error(f"SQLite query execution error: {e}")
+                return
+            if user:
                 st.session_state["authenticated"] = True
-                st.session_state["username"] = username
+                st.session_state["username"] = user.username
+                st.session_state["role"] = user.role
+                st.session_state["auth_token"] = token
                 st.rerun()
             else:
                 st.markdown("<div class='error-msg'>❌ Invalid username or password!</div>", unsafe_allow_html=True)
 
+# Function to manage staff accounts (admin only)
+def staff_accounts():
+    st.markdown("<h1 class='main-header'>👥 Staff Accounts</h1>", unsafe_allow_html=True)
+    
+    try:
+        accounts = users.list_users()
+    except Exception as e:
+        st.error(f"SQLite query execution error: {e}")
+        return
+    
+    df = pd.DataFrame(accounts, columns=["Username", "Role", "Disabled"])
+    st.dataframe(df, use_container_width=True)
+    st.caption("Active sessions: {active}".format(**users.tokens.stats()))
+    
+    tab1, tab2 = st.tabs(["Add Account", "Change Account"])
+    
+    with tab1:
+        col1, col2 = st.columns(2)
+        with col1:
+            new_username = st.text_input("Username", key="new_user_name").strip()
+            new_role = st.selectbox("Role", users.ROLES, index=1, key="new_user_role")
+        with col2:
+            new_password = st.text_input("Password", type="password", key="new_user_password")
+        
+        if st.button("Add Account", key="add_user_btn"):
+            if new_username and new_password:
+                try:
+                    users.create_user(new_username, new_password, new_role)
+                except users.UserError as e:
+                    st.markdown(f"<div class='warning-msg'>⚠️ {e}</div>", unsafe_allow_html=True)
+                except Exception as e:
+                    st.error(f"SQLite query execution error: {e}")
+                else:
+                    st.markdown(f"<div class='success-msg'>✅ Account '{new_username}' created!</div>", unsafe_allow_html=True)
+            else:
+                st.markdown("<div class='warning-msg'>⚠️ Please enter a username and password.</div>", unsafe_allow_html=True)
+    
+    with tab2:
+        account = st.selectbox("Account", [row[0] for row in accounts], key="change_user_name")
+        password = st.text_input("New Password", type="password", key="change_user_password")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Reset Password", key="reset_password_btn"):
+                if password:
+                    try:
+                        users.set_password(account, password)
+                    except Exception as e:
+                        st.error(f"SQLite query execution error: {e}")
+                    else:
+                        st.markdown(f"<div class='success-msg'>✅ Password for '{account}' changed; its sessions were signed out.</div>", unsafe_allow_html=True)
+                else:
+                    st.markdown("<div class='warning-msg'>⚠️ Please enter the new password.</div>", unsafe_allow_html=True)
+        with col2:
+            disabled = dict((row[0], row[2]) for row in accounts).get(account, False)
+            if account == st.session_state.get("username"):
+                st.caption("You cannot disable your own account.")
+            elif st.button("Enable Account" if disabled else "Disable Account", key="toggle_user_btn"):
+                try:
+                    users.set_disabled(account, not disabled)
+                except Exception as e:
+                    st.error(f"SQLite query execution error: {e}")
+                else:
+                    st.rerun()
+
 # Main function to navigate between options
 def main():
-    # Check SQLite database connection
-    conn, error = get_sqlite_connection()
-    if error:
-        st.error(f"Database connection error: {error}")
+    # Connect and initialize database tables (skipped after the first run)
+    try:
+        startup = initialize_database()
+        # Apply writes from other server processes before reading any cache
+        watch_changes().poll()
+    except Exception as e:
+        st.error(f"Database connection error: {e}")
         return
-
-    # Close connection if it was successful
-    if conn:
-        conn.close()
-    
-    # Initialize database tables
-    initialize_database()
     
-    # Authentication check
-    if not st.session_state.authenticated:
+    # Authentication check: a cache lookup on the session token, not a password hash
+    user = users.tokens.user_for(st.session_state.auth_token)
+    if user is None:
+        st.session_state.authenticated = False
         login()
         return
     
@@ -529,89 +891,87 @@ def main():
     st.sidebar.markdown(f"### Welcome, {st.session_state.get('username', 'User')}!")
     
     st.sidebar.markdown("## 📚 Library Management Menu")
-    choice = st.sidebar.radio("Select an option:", [
+    options = [
         "📊 Dashboard",
         "📚 View Books",
         "➕ Add Book",
+        "📥 Import Books",
         "📖 Issue Book",
         "📤 Return Book",
+        "🔖 Holds",
         "🗑️ Delete Book",
         "📋 Reports"
-    ])
+    ]
+    if user.role == "admin":
+        options.append("📈 Query Metrics")
+        options.append("👥 Staff Accounts")
+    choice = st.sidebar.radio("Select an option:", options)
+    
+    # Connection pool health
+    with st.sidebar.expander("Database"):
+        st.json({"startup": startup, "pool": get_pool().stats()})
     
     # Logout button
     if st.sidebar.button("Logout"):
+        users.logout(st.session_state.auth_token)
         st.session_state.clear()
         st.rerun()
     
-    # Main content based on selection
-    if choice == "📊 Dashboard":
-        st.markdown("<h1 class='main-header'>📊 Library Management Dashboard</h1>", unsafe_allow_html=True)
+    # Main content based on selection; queries and render phases are tagged with the page name
+    capture = st.session_state.pop("profile_capture", False)
+    with metrics.tag_page(choice.split(" ", 1)[1]), profiling.rerun(capture):
+        if choice == "📊 Dashboard":
+            st.markdown("<h1 class='main-header'>📊 Library Management Dashboard</h1>", unsafe_allow_html=True)
         
-        # Get statistics
-        total_books_query = "SELECT COUNT(*), SUM(total) FROM books"
-        total_books_result = execute_query(total_books_query, fetch=True)
+            # Get statistics from the cached counters
+            with profiling.phase("query"):
+                stats = cached_dashboard_stats()
+                recent_activities = cached_recent_activity()
         
-        issued_books_query = "SELECT COUNT(*) FROM issue WHERE returned = 0"
-        issued_books_result = execute_query(issued_books_query, fetch=True)
+            # Display metrics
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Total Book Titles", stats["book_titles"])
+                st.metric("Total Book Copies", stats["book_copies"])
+            with col2:
+                st.metric("Currently Issued", stats["open_loans"])
+            with col3:
+                st.metric("Overdue Books", stats["overdue"])
         
-        # Use SQLite syntax for overdue query
-        overdue_query = "SELECT COUNT(*) FROM issue WHERE returned = 0 AND due_date < date('now')"
-        overdue_result = execute_query(overdue_query, fetch=True)
-        
-        # Display metrics
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Total Book Titles", total_books_result[0][0] if total_books_result else 0)
-            st.metric("Total Book Copies", total_books_result[0][1] if total_books_result else 0)
-        with col2:
-            st.metric("Currently Issued", issued_books_result[0][0] if issued_books_result else 0)
-        with col3:
-            st.metric("Overdue Books", overdue_result[0][0] if overdue_result else 0)
-        
-        # Recent activities
-        st.markdown("### Recent Activities")
-
-        # For SQLite, handle recent activities
-        recent_issues = """
-        SELECT 'Issue' as action, name, bcode, idate as date 
-        FROM issue 
-        WHERE returned = 0 
-        ORDER BY idate DESC LIMIT 5
-        """
-        recent_returns = """
-        SELECT 'Return' as action, name, bcode, return_date as date 
-        FROM issue 
-        WHERE returned = 1 
-        ORDER BY return_date DESC LIMIT 5
-        """
-
-        # Execute both queries separately and combine results
-        issues = execute_query(recent_issues, fetch=True) or []
-        returns = execute_query(recent_returns, fetch=True) or []
+            # Recent activities
+            st.markdown("### Recent Activities")
 
-        # Combine and sort manually
-        recent_activities = sorted(issues + returns, key=lambda x: x[3], reverse=True)[:10]
-
-        if recent_activities:
-            df = pd.DataFrame(
-                recent_activities, 
-                columns=["Action", "Student Name", "Book Code", "Date"]
-            )
-            st.dataframe(df, use_container_width=True)
-    
-    elif choice == "📚 View Books":
-        display_books()
-    elif choice == "➕ Add Book":
-        add_book()
-    elif choice == "📖 Issue Book":
-        issue_book()
-    elif choice == "📤 Return Book":
-        submit_book()
-    elif choice == "🗑️ Delete Book":
-        delete_book()
-    elif choice == "📋 Reports":
-        view_reports()
+            if recent_activities:
+                df = pd.DataFrame(
+                    recent_activities, 
+                    columns=["Action", "Student Name", "Book Code", "Date"]
+                )
+                with profiling.phase("render"):
+                    st.dataframe(df, use_container_width=True)
+    
+        elif choice == "📚 View Books":
+            display_books()
+        elif choice == "➕ Add Book":
+            add_book()
+        elif choice == "📥 Import Books":
+            bulk_import_books()
+        elif choice == "📖 Issue Book":
+            issue_book()
+        elif choice == "📤 Return Book":
+            submit_book()
+        elif choice == "🔖 Holds":
+            manage_holds()
+        elif choice == "🗑️ Delete Book":
+            delete_book()
+        elif choice == "📋 Reports":
+            view_reports()
+        elif choice == "📈 Query Metrics":
+            query_metrics()
+        elif choice == "👥 Staff Accounts":
+            staff_accounts()
+    
+    if profiling.enabled():
+        render_profile_panel()
 # Add footer with student information
     st.markdown(
         """
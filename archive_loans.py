@@ -0,0 +1,41 @@
+import argparse
+import sys
+
+from library.archive import DEFAULT_BATCH_SIZE, DEFAULT_RETENTION_DAYS, archive_returned, count_eligible
+from library.db import DB_PATH, configure_pool
+
+
+def main():
+    """
+    Move returned loans older than the retention period from the issue table
+    into issue_archive, in short batches that never hold the write lock for
+    long. Safe to run from cron while the app is serving; reports and exports
+    read both tables through the loan_history view.
+    """
+    parser = argparse.ArgumentParser(description="Archive old returned loans in library.db")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file")
+    parser.add_argument("--older-than-days", type=int, default=DEFAULT_RETENTION_DAYS,
+                        help="archive loans returned more than this many days ago")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="loans moved per transaction")
+    parser.add_argument("--pause-ms", type=float, default=10, help="sleep between batches")
+    parser.add_argument("--dry-run", action="store_true", help="only count the loans that would move")
+    args = parser.parse_args()
+
+    configure_pool(args.db, max_size=1)
+    if args.dry_run:
+        print(f"{count_eligible(args.older_than_days):,} loans would be archived")
+        return
+
+    def report(result):
+        print(f"\r{result.moved:,} loans archived in {result.batches:,} batches",
+              end="", file=sys.stderr, flush=True)
+
+    result = archive_returned(args.older_than_days, args.batch_size,
+                              pause=args.pause_ms / 1000, progress=report)
+    print(file=sys.stderr)
+    print(f"Archived {result.moved:,} loans in {result.seconds:.2f}s "
+          f"({result.rows_per_sec:,.0f} rows/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from datetime import date, datetime, timedelta
+
+from library import analytics, archive, backup, catalog, changes, circulation, export, fines, holds, reports, stats, users
+from library.bulk_import import import_books
+from library.catalog_index import CatalogIndex
+from library.db import open_pool
+from library.migrations import LATEST_VERSION, apply_migrations, schema_version
+from library.search import search_books
+
+TODAY = date.today()
+CHECKS = []
+
+# Everything the MySQL schema creates; dropped before each run
+MYSQL_OBJECTS = [
+    "DROP VIEW IF EXISTS loan_history",
+    "DROP TABLE IF EXISTS issue_archive",
+    "DROP TABLE IF EXISTS issue",
+    "DROP TABLE IF EXISTS books",
+    "DROP TABLE IF EXISTS library_stats",
+    "DROP TABLE IF EXISTS subject_counts",
+    "DROP TABLE IF EXISTS users",
+    "DROP TABLE IF EXISTS holds",
+    "DROP TABLE IF EXISTS loan_counts",
+    "DROP TABLE IF EXISTS co_loans",
+    "DROP TABLE IF EXISTS analytics_state",
+    "DROP TABLE IF EXISTS data_changes",
+    "DROP TABLE IF EXISTS schema_version",
+]
+
+
+class ConformanceError(AssertionError):
+    pass
+
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+
+def expect(condition, message):
+    if not condition:
+        raise ConformanceError(message)
+
+
+def expect_raises(error, operation):
+    try:
+        operation()
+    except error:
+        return
+    raise ConformanceError(f"expected {error.__name__}")
+
+
+@check
+def migrations(pool):
+    with pool.connection() as conn:
+        expect(schema_version(conn) == LATEST_VERSION, f"schema at {schema_version(conn)}")
+        expect(apply_migrations(conn) == [], "migrations re-applied on an up-to-date schema")
+
+
+@check
+def add_and_get_books(pool):
+    book = catalog.add_book("Database Systems", "CF001", 2, "Computer Science", pool=pool)
+    expect(catalog.get_book("CF001", pool=pool) == book, "added book not read back")
+    expect(catalog.get_book("NOPE", pool=pool) is None, "missing book found")
+    expect_raises(catalog.DuplicateBook, lambda: catalog.add_book("Again", "CF001", 1, "X", pool=pool))
+
+
+@check
+def bulk_import_upserts(pool):
+    rows = "bname,bcode,total,subject\n" + "".join(
+        f"Imported Title {i},IMP{i:03d},{i % 4},Subject {i % 3}\n" for i in range(40)
+    )
+    result = import_books(io.StringIO(rows), "csv", chunk_size=7, pool=pool)
+    expect(result.imported == 40 and result.rejected == 0, f"imported {result.as_dict()}")
+    again = "bname,bcode,total,subject\nRenamed Title,IMP000,9,Subject 0\n"
+    import_books(io.StringIO(again), "csv", pool=pool)
+    expect(catalog.get_book("IMP000", pool=pool).total == 9, "upsert did not update the row")
+
+
+@check
+def keyset_pagination(pool):
+    seen, after = [], None
+    while True:
+        page = catalog.list_books("Book Code", after=after, page_size=7, pool=pool)
+        seen.extend(book.bcode for book in page.rows)
+        if page.next_cursor is None:
+            break
+        after = page.next_cursor
+    expect(seen == sorted(seen) and len(seen) == len(set(seen)), "pages overlap or are out of order")
+    expect(len(seen) == catalog.count_books(pool=pool), "pages and count disagree")
+    subject = catalog.list_books(subject="Subject 1", page_size=100, pool=pool).rows
+    expect(subject and all(book.subject == "Subject 1" for book in subject), "subject filter")
+    available = catalog.list_books(available_only=True, page_size=100, pool=pool).rows
+    expect(all(book.total > 0 for book in available), "available filter")
+
+
+@check
+def issue_and_return(pool):
+    loan = circulation.issue_book("Ali", "R1", "CF001", TODAY, TODAY + timedelta(days=14), pool=pool)
+    expect(catalog.get_book("CF001", pool=pool).total == 1, "stock not taken")
+    expect_raises(circulation.AlreadyIssued,
+                  lambda: circulation.issue_book("Ali", "R1", "CF001", TODAY, TODAY, pool=pool))
+    circulation.issue_book("Sara", "R2", "CF001", TODAY, TODAY, pool=pool)
+    expect_raises(circulation.OutOfStock,
+                  lambda: circulation.issue_book("Omar", "R3", "CF001", TODAY, TODAY, pool=pool))
+    expect_raises(circulation.BookNotFound,
+                  lambda: circulation.issue_book("Omar", "R3", "NOPE", TODAY, TODAY, pool=pool))
+    expect(circulation.return_book(loan, TODAY, pool=pool) == "CF001", "return gave wrong book")
+    expect(catalog.get_book("CF001", pool=pool).total == 1, "stock not restored")
+    expect_raises(circulation.LoanNotFound, lambda: circulation.return_book(loan, TODAY, pool=pool))
+
+
+@check
+def reports_and_dates(pool):
+    overdue = circulation.issue_book("Late", "R9", "IMP001", TODAY - timedelta(days=40),
+                                     TODAY - timedelta(days=20), pool=pool)
+    open_ids = [loan.id for loan in reports.open_loans(page_size=100, pool=pool).rows]
+    overdue_ids = [loan.id for loan in reports.open_loans(page_size=100, overdue_only=True, pool=pool).rows]
+    expect(overdue in open_ids and overdue_ids == [overdue], f"overdue filter gave {overdue_ids}")
+    expect(reports.count_open_loans(overdue_only=True, pool=pool) == 1, "overdue count")
+    loan = reports.open_loans(page_size=100, pool=pool).rows[0]
+    expect(isinstance(loan.due_date, date), f"DATE columns come back as {type(loan.due_date).__name__}")
+    history = reports.return_history(pool=pool)
+    expect(history and history[0].bcode == "CF001", "return history")
+
+
+@check
+def fines_match_vectorised(pool):
+    loans = reports.open_loans(page_size=100, overdue_only=True, pool=pool).rows
+    expected = float(fines.DEFAULT_POLICY.fines(fines.days_overdue([loan.due_date for loan in loans])).sum())
+    total = float(fines.total_outstanding(pool=pool))
+    expect(abs(total - expected) < 0.01, f"SQL fines {total} != vectorised {expected}")
+    per_student = fines.student_fines(pool=pool)
+    expect(per_student and per_student[0].regno == "R9", "per-student fines")
+
+
+@check
+def dashboard_counters(pool):
+    counted = stats.dashboard_stats(pool=pool)
+    stats.recount(pool=pool)
+    expect(stats.dashboard_stats(pool=pool) == counted, "trigger counters drifted from a recount")
+    expect(counted["overdue"] == 1, "overdue count on the dashboard")
+
+
+@check
+def full_text_search(pool):
+    books, _ = search_books("data sys", pool=pool)
+    expect([book.bcode for book in books] == ["CF001"], f"search found {books}")
+    seen, after = set(), None
+    while True:
+        books, after = search_books("imported", limit=6, after=after, pool=pool)
+        new = {book.bcode for book in books}
+        expect(not seen & new, "search pages overlap")
+        seen |= new
+        if after is None:
+            break
+    # IMP000 was renamed by the upsert check
+    expect(len(seen) == 39, f"search paged through {len(seen)} of 39 titles")
+
+
+@check
+def delete_guards(pool):
+    expect_raises(catalog.BookOnLoan, lambda: catalog.delete_book("IMP001", pool=pool))
+    expect_raises(circulation.BookNotFound, lambda: catalog.delete_book("NOPE", pool=pool))
+    catalog.delete_book("IMP039", pool=pool)
+    expect(catalog.get_book("IMP039", pool=pool) is None, "book not deleted")
+
+
+@check
+def concurrent_issues_never_oversell(pool):
+    catalog.add_book("Contended", "HOT01", 5, "Load", pool=pool)
+    issued, errors = [], []
+
+    def desk(n):
+        try:
+            issued.append(circulation.issue_book(f"S{n}", f"HOT-R{n}", "HOT01", TODAY, TODAY, pool=pool))
+        except circulation.OutOfStock:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=desk, args=(n,)) for n in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    expect(not errors, f"unexpected errors: {errors[:3]}")
+    expect(len(issued) == 5, f"{len(issued)} copies issued of 5")
+    expect(catalog.get_book("HOT01", pool=pool).total == 0, "stock went negative or leaked")
+
+
+@check
+def archive_keeps_history(pool):
+    loan = circulation.issue_book("Old", "R7", "IMP002", TODAY - timedelta(days=30), TODAY - timedelta(days=16), pool=pool)
+    circulation.return_book(loan, TODAY - timedelta(days=10), pool=pool)
+    before = sum(len(rows) for rows in export.iter_history(pool=pool))
+    result = archive.archive_returned(retention_days=5, batch_size=1, pool=pool)
+    expect(result.moved == 1, f"archived {result.moved} loans")
+    expect(sum(len(rows) for rows in export.iter_history(pool=pool)) == before, "history lost rows")
+    expect(any(row.regno == "R7" for row in reports.return_history(pool=pool)), "archived loan missing")
+
+
+@check
+def hold_queue_fifo(pool):
+    catalog.add_book("Reserved", "HOLD01", 1, "Load", pool=pool)
+    loan = circulation.issue_book("First", "H-R0", "HOLD01", TODAY, TODAY, pool=pool)
+    expect_raises(holds.CopiesAvailable, lambda: holds.place_hold("X", "H-RX", "IMP003", pool=pool))
+    expect(holds.place_hold("Second", "H-R1", "HOLD01", pool=pool)[1] == 1, "queue position")
+    expect(holds.place_hold("Third", "H-R2", "HOLD01", pool=pool)[1] == 2, "queue position")
+    expect_raises(holds.DuplicateHold, lambda: holds.place_hold("Second", "H-R1", "HOLD01", pool=pool))
+    _, ready = circulation.return_copy(loan, TODAY, pool=pool)
+    expect(ready is not None and ready.regno == "H-R1", f"returned copy went to {ready}")
+    expect(catalog.get_book("HOLD01", pool=pool).total == 0, "held copy went back on the shelf")
+    expect(isinstance(holds.next_expiry(pool=pool), datetime), "pickup deadline type")
+    expect(holds.expire_due(ready.expires_at, pool=pool) == 1, "uncollected hold not expired")
+    expect([hold.regno for hold in holds.active_holds("HOLD01", pool=pool)] == ["H-R2"], "copy not passed on")
+    loan = circulation.issue_book("Third", "H-R2", "HOLD01", TODAY, TODAY, pool=pool)
+    expect(catalog.get_book("HOLD01", pool=pool).total == 0, "claimed copy taken twice")
+    circulation.return_book(loan, TODAY, pool=pool)
+    expect(catalog.get_book("HOLD01", pool=pool).total == 1, "copy not restocked with nobody waiting")
+    expect(holds.count_holds(pool=pool) == {"waiting": 0, "ready": 0}, "holds left open")
+
+
+@check
+def borrowing_analytics(pool):
+    # Results are cached per high-water mark, which another target may share
+    analytics.cache.clear()
+    analytics.refresh(pool=pool)
+    for code in ("TREND1", "TREND2", "TREND3"):
+        catalog.add_book(f"Trend {code[-1]}", code, 2, "Trends", pool=pool)
+    for regno, codes in (("T-R1", ["TREND1", "TREND2", "TREND3"]), ("T-R2", ["TREND2", "TREND1"])):
+        for code in codes:
+            circulation.issue_book("Reader", regno, code, TODAY, TODAY, pool=pool)
+    expect(analytics.pending_loans(pool=pool) == 5, "new loans not pending")
+    result = analytics.refresh(batch_size=2, pool=pool)
+    expect((result.loans, result.batches) == (5, 3), f"refresh folded in {result.as_dict()}")
+    popular = analytics.popular_titles("Trends", months=1, pool=pool)
+    expect([(title.bcode, title.loans) for title in popular] == [("TREND1", 2), ("TREND2", 2), ("TREND3", 1)],
+           f"popular titles {popular}")
+    also = analytics.also_borrowed("TREND1", pool=pool)
+    expect([(title.bcode, title.patrons) for title in also] == [("TREND2", 2), ("TREND3", 1)],
+           f"also borrowed {also}")
+    expect(analytics.refresh(pool=pool).loans == 0, "loans counted twice")
+
+
+@check
+def staff_logins(pool):
+    with pool.connection() as conn:
+        password = users.seed_users(conn)
+        expect(password and users.seed_users(conn) is None, "initial admin seeded twice")
+    expect(users.authenticate("admin", password, pool=pool) == users.User("admin", "admin"), "admin login")
+    expect(users.authenticate("admin", "12345", pool=pool) is None, "old default password accepted")
+    users.create_user("librarian", "library-pass", pool=pool)
+    expect_raises(users.DuplicateUser, lambda: users.create_user("librarian", "x", pool=pool))
+    users.set_disabled("librarian", pool=pool)
+    expect(users.authenticate("librarian", "library-pass", pool=pool) is None, "disabled account logged in")
+
+
+def race(operation, refused, desks=8):
+    """Run ``operation`` on ``desks`` threads at once; returns what succeeded and unexpected errors."""
+    barrier = threading.Barrier(desks)
+    done, errors = [], []
+
+    def desk():
+        barrier.wait()
+        try:
+            done.append(operation())
+        except refused:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=desk) for _ in range(desks)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return done, errors
+
+
+@check
+def concurrent_duplicates_refused(pool):
+    catalog.add_book("Twice", "DUP01", 5, "Load", pool=pool)
+    loans, errors = race(lambda: circulation.issue_book("Same", "DUP-R1", "DUP01", TODAY, TODAY, pool=pool),
+                         circulation.AlreadyIssued)
+    expect(not errors, f"unexpected errors: {errors[:3]}")
+    expect(len(loans) == 1, f"{len(loans)} loans of one title to one student")
+    expect(catalog.get_book("DUP01", pool=pool).total == 4, "refused issues took stock")
+
+    catalog.add_book("Queued", "DUP02", 1, "Load", pool=pool)
+    circulation.issue_book("Other", "DUP-R0", "DUP02", TODAY, TODAY, pool=pool)
+    placed, errors = race(lambda: holds.place_hold("Same", "DUP-R1", "DUP02", pool=pool), holds.DuplicateHold)
+    expect(not errors, f"unexpected errors: {errors[:3]}")
+    expect(len(placed) == 1, f"{len(placed)} holds on one title for one student")
+    holds.cancel_hold(placed[0][0], pool=pool)
+
+    created, errors = race(lambda: users.create_user("twin", "twin-password", pool=pool), users.DuplicateUser)
+    expect(not errors, f"unexpected errors: {errors[:3]}")
+    expect(len(created) == 1, f"{len(created)} accounts created with one name")
+
+
+@check
+def change_notifications(pool):
+    # As another process would see them: its own index, changes recorded elsewhere
+    watcher = changes.ChangeWatcher(pool, origin="elsewhere")
+    seen = {}
+    for topic in (changes.BOOKS, changes.STOCK, changes.LOANS, changes.USERS):
+        watcher.subscribe(topic, lambda items, topic=topic: seen.setdefault(topic, set()).update(items))
+    index = CatalogIndex(pool)
+    watcher.subscribe(changes.BOOKS, index.refresh)
+    watcher.subscribe(changes.STOCK, index.refresh)
+    expect(watcher.poll() == 0 and watcher.poll() == 0, "changes before the first poll replayed")
+    index.load()
+    catalog.add_book("Watched", "WATCH1", 1, "Notify", pool=pool)
+    circulation.issue_book("Reader", "W-R1", "WATCH1", TODAY, TODAY, pool=pool)
+    # Disabled by staff_logins; enabling is not logged, disabling again is
+    users.set_disabled("librarian", False, pool=pool)
+    users.set_disabled("librarian", pool=pool)
+    expect(watcher.poll() == 4, "changes not read once each")
+    expect(seen == {changes.BOOKS: {"WATCH1"}, changes.STOCK: {"WATCH1"},
+                    changes.LOANS: {"WATCH1"}, changes.USERS: {"librarian"}}, f"changes seen {seen}")
+    expect(index.get("WATCH1").total == 0, "stale stock in another process's index")
+
+
+@check
+def backup_and_restore(pool):
+    if pool.dialect.name == "mysql":
+        expect_raises(backup.BackupError, lambda: backup.backup(os.devnull, pool=pool))
+        return
+    with tempfile.TemporaryDirectory() as scratch:
+        taken = backup.snapshot(scratch, keep=1, pages=8, pause=0, pool=pool)
+        expect(taken.steps > 1 and taken.verified["counts"]["books"] == catalog.count_books(pool=pool),
+               f"snapshot {taken.as_dict()}")
+        catalog.add_book("Lost In Restore", "RESTORE1", 1, "Backup", pool=pool)
+        watcher = changes.ChangeWatcher(pool, origin="elsewhere")
+        reloaded = []
+        watcher.subscribe(changes.BOOKS, reloaded.append)
+        watcher.poll()
+        backup.restore(backup.find_snapshot(scratch), pool=pool)
+        expect(catalog.get_book("RESTORE1", pool=pool) is None, "restore kept a later write")
+        expect(watcher.poll() == 1 and reloaded == [None], "caches not told about the restore")
+        with open(taken.path, "r+b") as f:
+            f.seek(taken.bytes // 2)
+            f.write(b"\xff" * 4096)
+        expect_raises(backup.BackupError, lambda: backup.verify(taken.path))
+
+
+def reset(pool):
+    """Drop the library schema so the checks start from nothing."""
+    with pool.connection() as conn:
+        if pool.dialect.name == "mysql":
+            conn.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for statement in MYSQL_OBJECTS:
+                conn.execute(statement)
+            conn.execute("SET FOREIGN_KEY_CHECKS = 1")
+        apply_migrations(conn)
+
+
+def run(target, stop_on_failure=False):
+    """Run every check against ``target``; returns the number of failures."""
+    pool = open_pool(target, max_size=8)
+    failures = 0
+    try:
+        reset(pool)
+        for fn in CHECKS:
+            start = time.perf_counter()
+            try:
+                fn(pool)
+            except Exception as e:
+                failures += 1
+                print(f"FAIL {fn.__name__}: {e}")
+                if not isinstance(e, ConformanceError):
+                    traceback.print_exc()
+                if stop_on_failure:
+                    break
+            else:
+                print(f"ok   {fn.__name__} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+    finally:
+        pool.close()
+    return failures
+
+
+def main():
+    """
+    Run the storage backend conformance checks.
+    By default they run against a fresh temporary SQLite file. Pass --db with
+    a mysql:// URL (or set LIBRARY_TEST_MYSQL_URL) to also run them against a
+    MySQL server, e.g. a local container. The MySQL database is wiped first,
+    so point it at a scratch schema, never at production. SQLite targets must
+    not exist yet.
+    """
+    parser = argparse.ArgumentParser(description="Check that every storage backend behaves the same")
+    parser.add_argument("--db", action="append", default=[],
+                        help="SQLite file or mysql:// URL to test (repeatable; default: temporary SQLite file)")
+    parser.add_argument("--stop", action="store_true", help="stop at the first failing check")
+    args = parser.parse_args()
+
+    targets = list(args.db)
+    for target in targets:
+        if not target.startswith("mysql") and os.path.exists(target):
+            parser.error(f"{target} already exists; SQLite checks need a new file")
+    if os.environ.get("LIBRARY_TEST_MYSQL_URL"):
+        targets.append(os.environ["LIBRARY_TEST_MYSQL_URL"])
+    scratch = None
+    if not any(not target.startswith("mysql") for target in targets):
+        scratch = tempfile.TemporaryDirectory()
+        targets.insert(0, os.path.join(scratch.name, "conformance.db"))
+
+    failures = 0
+    for target in targets:
+        label = target.split("@")[-1] if target.startswith("mysql") else target
+        print(f"== {label}")
+        failures += run(target, args.stop)
+    if scratch:
+        scratch.cleanup()
+    print(f"{len(CHECKS) * len(targets) - failures} passed, {failures} failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from library import backup, catalog, reports
+from library.db import DB_PATH, configure_pool
+
+from benchmark import percentile
+
+# Pause between foreground probe queries while measuring backup impact
+PROBE_INTERVAL = 0.002
+
+
+def probe(pool, stop):
+    """Run catalog and report reads until ``stop`` is set; returns sorted latencies (ms)."""
+    operations = [
+        lambda: catalog.list_books(pool=pool),
+        lambda: catalog.count_books(pool=pool),
+        lambda: reports.open_loans(pool=pool),
+        lambda: reports.dashboard_stats(pool=pool),
+    ]
+    latencies = []
+    while not stop.is_set():
+        t = time.perf_counter()
+        operations[len(latencies) % len(operations)]()
+        latencies.append((time.perf_counter() - t) * 1000)
+        time.sleep(PROBE_INTERVAL)
+    return sorted(latencies)
+
+
+def probed(pool, run=None, seconds=None):
+    """Probe while ``run()`` executes, or for ``seconds``; returns (run's result, latencies)."""
+    stop = threading.Event()
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.setdefault("latencies", probe(pool, stop)))
+    thread.start()
+    try:
+        result = run() if run else time.sleep(seconds)
+    finally:
+        stop.set()
+        thread.join()
+    return result, outcome["latencies"]
+
+
+def report_impact(baseline, during):
+    print(f"\n{'foreground reads':<18} {'queries':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, latencies in (("before backup", baseline), ("during backup", during)):
+        print(f"{name:<18} {len(latencies):>8,} {percentile(latencies, 50):>8.2f} "
+              f"{percentile(latencies, 99):>8.2f} {latencies[-1] if latencies else 0:>8.2f}")
+    if baseline and during and percentile(baseline, 99):
+        change = (percentile(during, 99) / percentile(baseline, 99) - 1) * 100
+        print(f"p99 change: {change:+.1f}%")
+
+
+def run_backup(args, pool):
+    def progress(copied, total):
+        print(f"\r{copied:,}/{total:,} pages", end="", file=sys.stderr, flush=True)
+
+    pause = args.pause_ms / 1000
+    if args.command == "snapshot":
+        run = lambda: backup.snapshot(args.dir, args.keep, args.pages, pause, pool, progress)
+    elif args.vacuum:
+        run = lambda: backup.vacuum_into(args.dest, pool)
+    else:
+        run = lambda: backup.backup(args.dest, args.pages, pause, pool, progress)
+
+    if not args.measure:
+        result = run()
+        print(file=sys.stderr)
+    else:
+        _, baseline = probed(pool, seconds=args.measure)
+        result, during = probed(pool, run)
+        print(file=sys.stderr)
+    print(f"Wrote {result.path}: {result.bytes / 2 ** 20:,.1f} MiB, {result.pages:,} pages in "
+          f"{result.steps:,} steps, {result.seconds:.2f}s ({result.mb_per_sec:,.1f} MiB/s)")
+    if result.verified:
+        print(f"Verified: schema version {result.verified['schema_version']}, "
+              + ", ".join(f"{count:,} {table}" for table, count in result.verified["counts"].items()))
+    if args.measure:
+        report_impact(baseline, during)
+
+
+def main():
+    """
+    Back up the live database without stopping the app. Backups copy a few
+    pages at a time from one read snapshot, pausing between steps, so
+    circulation keeps running. Snapshots go into a directory with retention;
+    run them from cron or with --every-minutes. Restore verifies the
+    snapshot, copies it over the database in one step and makes every app
+    process drop its caches. --measure reports foreground p99 latency before
+    and during the backup.
+    """
+    parser = argparse.ArgumentParser(description="Back up, snapshot and restore library.db")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    throttle = argparse.ArgumentParser(add_help=False)
+    throttle.add_argument("--pages", type=int, default=backup.DEFAULT_PAGES, help="pages copied per step")
+    throttle.add_argument("--pause-ms", type=float, default=backup.DEFAULT_PAUSE * 1000,
+                          help="sleep between steps")
+    throttle.add_argument("--measure", type=float, metavar="SECONDS", nargs="?", const=3.0,
+                          help="probe foreground latency for this long, then during the backup")
+
+    one = commands.add_parser("backup", parents=[throttle], help="copy the database to a file")
+    one.add_argument("dest", help="backup file to write")
+    one.add_argument("--vacuum", action="store_true", help="compact with VACUUM INTO (one pass, unthrottled)")
+
+    snap = commands.add_parser("snapshot", parents=[throttle], help="timestamped, verified backup with retention")
+    snap.add_argument("--dir", default="backups", help="snapshot directory")
+    snap.add_argument("--keep", type=int, default=backup.DEFAULT_KEEP, help="snapshots to keep")
+    snap.add_argument("--every-minutes", type=float, help="keep running, taking a snapshot this often")
+
+    listing = commands.add_parser("list", help="list snapshots")
+    listing.add_argument("--dir", default="backups", help="snapshot directory")
+
+    check = commands.add_parser("verify", help="check a backup's integrity")
+    check.add_argument("path", help="backup file")
+
+    back = commands.add_parser("restore", help="replace the database with a snapshot")
+    back.add_argument("path", nargs="?", help="backup file (default: newest snapshot in --dir)")
+    back.add_argument("--dir", default="backups", help="snapshot directory")
+    back.add_argument("--at", type=datetime.fromisoformat,
+                      help="restore the newest snapshot taken at or before this time (YYYY-MM-DD HH:MM)")
+    back.add_argument("--no-safety-copy", action="store_true",
+                      help="do not keep a copy of the current database")
+    back.add_argument("--yes", action="store_true", help="really overwrite the database")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            for taken_at, path in backup.list_snapshots(args.dir):
+                print(f"{taken_at:%Y-%m-%d %H:%M:%S}  {os.path.getsize(path) / 2 ** 20:>9,.1f} MiB  {path}")
+            return
+        if args.command == "verify":
+            verified = backup.verify(args.path)
+            print(f"{args.path}: ok, schema version {verified['schema_version']}, "
+                  + ", ".join(f"{count:,} {table}" for table, count in verified["counts"].items()))
+            return
+
+        pool = configure_pool(args.db, max_size=4)
+        if args.command == "restore":
+            path = args.path or backup.find_snapshot(args.dir, args.at)
+            if not args.yes:
+                print(f"Would replace {args.db} with {path}; rerun with --yes to restore.")
+                return
+            safety_copy = None if args.no_safety_copy else f"{args.db}.before-restore"
+            restored = backup.restore(path, pool=pool, safety_copy=safety_copy)
+            if safety_copy:
+                print(f"Saved the previous database to {safety_copy}")
+            print(f"Restored {args.db} from {path}: "
+                  + ", ".join(f"{count:,} {table}" for table, count in restored["counts"].items()))
+            return
+
+        run_backup(args, pool)
+        while args.command == "snapshot" and args.every_minutes:
+            time.sleep(args.every_minutes * 60)
+            run_backup(args, pool)
+    except backup.BackupError as e:
+        raise SystemExit(f"error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+
+from library import catalog, circulation, reports
+from library.db import configure_pool
+from library.search import search_books
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(operation, iterations, warmup=5):
+    """Run ``operation`` and return latency percentiles (ms) and ops/sec."""
+    for _ in range(warmup):
+        operation()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        operation()
+        latencies.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(latencies, 50), 4),
+        "p99_ms": round(percentile(latencies, 99), 4),
+        "max_ms": round(latencies[-1], 4),
+        "ops_per_sec": round(iterations / elapsed, 1),
+    }
+
+
+def build_operations(pool, rng):
+    """Map operation names to zero-argument callables over the data layer."""
+    with pool.connection() as conn:
+        codes = [row[0] for row in conn.execute("SELECT bcode FROM books WHERE total > 0 LIMIT 5000")]
+        titles = [row[0] for row in conn.execute("SELECT bname FROM books LIMIT 5000")]
+    if not codes:
+        raise SystemExit("The database has no books in stock; run generate_data.py first")
+    today = date.today()
+    issued = []
+
+    def issue():
+        try:
+            loan_id = circulation.issue_book(
+                "Bench Student", f"BENCH{rng.randrange(10**6)}", rng.choice(codes),
+                today, today + timedelta(days=14), pool=pool)
+            issued.append(loan_id)
+        except circulation.CirculationError:
+            pass
+
+    def return_():
+        if not issued:
+            issue()
+        if issued:
+            circulation.return_book(issued.pop(), today, pool=pool)
+
+    def search():
+        words = rng.choice(titles).split()
+        search_books(" ".join(w[:4] for w in words[:2]), limit=25, pool=pool)
+
+    deep_cursor = {}
+
+    def catalog_deep_page():
+        # Walk ten pages in, as a user paging through the catalog would
+        cursor = deep_cursor.get("books")
+        if cursor is None:
+            for _ in range(10):
+                cursor = catalog.list_books(after=cursor, pool=pool).next_cursor
+            deep_cursor["books"] = cursor
+        catalog.list_books(after=cursor, pool=pool)
+
+    return {
+        "issue_book": issue,
+        "return_book": return_,
+        "search": search,
+        "catalog_first_page": lambda: catalog.list_books(pool=pool),
+        "catalog_deep_page": catalog_deep_page,
+        "catalog_count": lambda: catalog.count_books(pool=pool),
+        "open_loans_page": lambda: reports.open_loans(pool=pool),
+        "overdue_page": lambda: reports.open_loans(overdue_only=True, pool=pool),
+        "overdue_count": lambda: reports.count_open_loans(overdue_only=True, pool=pool),
+        "dashboard_stats": lambda: reports.dashboard_stats(pool=pool),
+        "recent_activity": lambda: reports.recent_activity(pool=pool),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nChange vs {baseline_path} (p99 latency, ops/sec):")
+    for name, current in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        p99 = (current["p99_ms"] - old["p99_ms"]) / old["p99_ms"] * 100 if old["p99_ms"] else 0.0
+        ops = (current["ops_per_sec"] - old["ops_per_sec"]) / old["ops_per_sec"] * 100 if old["ops_per_sec"] else 0.0
+        print(f"  {name:<20} p99 {p99:+7.1f}%   ops/sec {ops:+7.1f}%")
+
+
+def main():
+    """
+    Benchmark the library data layer without Streamlit.
+    Circulation operations write to the database, so point this at a copy
+    made with generate_data.py rather than the live library.db.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark library data-access operations")
+    parser.add_argument("--db", default="library_bench.db", help="database to benchmark")
+    parser.add_argument("--iterations", type=int, default=500, help="timed calls per operation")
+    parser.add_argument("--only", nargs="*", help="run only these operations")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--seed", type=int, default=7, help="random seed")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist; create it with generate_data.py")
+    pool = configure_pool(args.db, max_size=1)
+    operations = build_operations(pool, random.Random(args.seed))
+    with pool.connection() as conn:
+        books = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+        loans = conn.execute("SELECT COUNT(*) FROM issue").fetchone()[0]
+
+    results = {}
+    print(f"{args.db}: {books:,} books, {loans:,} loans, {args.iterations} iterations\n")
+    print(f"{'operation':<20} {'p50 ms':>9} {'p99 ms':>9} {'ops/sec':>10}")
+    for name, operation in operations.items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = measure(operation, args.iterations)
+        r = results[name]
+        print(f"{name:<20} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['ops_per_sec']:>10,.0f}")
+
+    if args.output:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "db": args.db,
+                "books": books,
+                "loans": loans,
+                "iterations": args.iterations,
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from library import users
+from library.db import configure_pool
+from library.migrations import apply_migrations
+
+from benchmark import percentile
+
+
+def timed_logins(username, password, iterations, threads, pool, succeed=True):
+    """Run ``iterations`` logins across ``threads``; returns (latencies ms, elapsed s)."""
+    # Warm up: the first unknown-user login also hashes the dummy password
+    users.login(username, password, pool=pool)
+    latencies = []
+    lock = threading.Lock()
+    remaining = [iterations]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            t = time.perf_counter()
+            user, _ = users.login(username, password, pool=pool)
+            elapsed = (time.perf_counter() - t) * 1000
+            if (user is not None) != succeed:
+                raise SystemExit(f"unexpected login result for {username}")
+            with lock:
+                latencies.append(elapsed)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sorted(latencies), time.perf_counter() - start
+
+
+def report(name, latencies, elapsed):
+    print(f"{name:<22} {percentile(latencies, 50):>9.2f} {percentile(latencies, 99):>9.2f} "
+          f"{len(latencies) / elapsed:>12,.1f}")
+
+
+def main():
+    """
+    Benchmark staff logins at the chosen scrypt cost.
+    Creates a throwaway account in a temporary database, then times
+    successful logins, failed logins and unknown usernames (which should cost
+    the same), and the per-rerun session token check that replaces them.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark login throughput at given scrypt parameters")
+    parser.add_argument("--n", type=int, default=users.SCRYPT_N, help="scrypt CPU/memory cost (power of two)")
+    parser.add_argument("--r", type=int, default=users.SCRYPT_R, help="scrypt block size")
+    parser.add_argument("--p", type=int, default=users.SCRYPT_P, help="scrypt parallelism")
+    parser.add_argument("--iterations", type=int, default=50, help="logins per measurement")
+    parser.add_argument("--threads", type=int, default=users.KDF_CONCURRENCY, help="concurrent logins")
+    args = parser.parse_args()
+    if args.n < 2 or args.n & (args.n - 1):
+        parser.error("--n must be a power of two")
+
+    # Everything in library.users reads the cost from these at call time
+    users.SCRYPT_N, users.SCRYPT_R, users.SCRYPT_P = args.n, args.r, args.p
+    users._kdf_slots = threading.BoundedSemaphore(args.threads)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        pool = configure_pool(os.path.join(scratch, "login_bench.db"), max_size=args.threads)
+        with pool.connection() as conn:
+            apply_migrations(conn)
+        users.create_user("bench", "correct horse battery staple", pool=pool)
+
+        memory_mib = 128 * args.n * args.r / 2 ** 20
+        print(f"scrypt n={args.n} r={args.r} p={args.p}: {memory_mib:.0f} MiB per hash, "
+              f"{args.threads} threads, {args.iterations} logins\n")
+        print(f"{'operation':<22} {'p50 ms':>9} {'p99 ms':>9} {'logins/sec':>12}")
+        report("login", *timed_logins("bench", "correct horse battery staple",
+                                      args.iterations, args.threads, pool))
+        report("wrong password", *timed_logins("bench", "wrong", args.iterations, args.threads, pool, False))
+        report("unknown user", *timed_logins("nobody", "wrong", args.iterations, args.threads, pool, False))
+
+        _, token = users.login("bench", "correct horse battery staple", pool=pool)
+        checks = 100_000
+        start = time.perf_counter()
+        for _ in range(checks):
+            users.tokens.user_for(token)
+        elapsed = time.perf_counter() - start
+        print(f"\nsession token check: {elapsed / checks * 1e6:.2f} µs ({checks / elapsed:,.0f}/sec)")
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
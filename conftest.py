@@ -0,0 +1 @@
+"""Lets the tests import the top-level scripts, such as backend_conformance."""
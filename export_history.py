@@ -0,0 +1,52 @@
+import argparse
+import sys
+
+from library.db import DB_PATH, configure_pool
+from library.export import FORMATS, STATUSES, ExportError, detect_format, export_history
+
+
+def main():
+    """
+    Export the loan history from the library database to CSV or Parquet.
+    Rows are streamed in chunks, so the whole history never sits in memory.
+    --from/--to bound the issue date (inclusive, YYYY-MM-DD) and --regno
+    limits the export to one student. Parquet output needs pyarrow.
+    """
+    parser = argparse.ArgumentParser(description="Export loan history from library.db")
+    parser.add_argument("path", help="output file ('-' for CSV on stdout)")
+    parser.add_argument("--format", choices=FORMATS, help="output format (default: from file extension)")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file")
+    parser.add_argument("--from", dest="start", help="earliest issue date")
+    parser.add_argument("--to", dest="end", help="latest issue date")
+    parser.add_argument("--regno", help="only this student's loans")
+    parser.add_argument("--status", choices=STATUSES, default="all", help="which loans to include")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows fetched per batch")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path == "-" else detect_format(args.path))
+    configure_pool(args.db, max_size=1)
+
+    def report(result):
+        print(f"\r{result.rows:,} rows written, {result.rows_per_sec:,.0f} rows/sec",
+              end="", file=sys.stderr, flush=True)
+
+    options = dict(fmt=fmt, start=args.start, end=args.end, regno=args.regno,
+                   status=args.status, chunk_size=args.chunk_size, progress=report)
+    try:
+        if args.path == "-":
+            result = export_history(sys.stdout, **options)
+        elif fmt == "csv":
+            with open(args.path, "w", newline="", encoding="utf-8") as stream:
+                result = export_history(stream, **options)
+        else:
+            result = export_history(args.path, **options)
+    except ExportError as e:
+        print(file=sys.stderr)
+        sys.exit(f"error: {e}")
+    print(file=sys.stderr)
+    print(f"Exported {result.rows:,} loans in {result.seconds:.2f}s "
+          f"({result.rows_per_sec:,.0f} rows/sec)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
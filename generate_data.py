@@ -0,0 +1,130 @@
+import argparse
+import bisect
+import itertools
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from library.bootstrap import bootstrap
+from library.db import configure_pool, transaction
+
+WORDS = (
+    "introduction advanced principles modern applied theory practical guide history "
+    "systems analysis design data network quantum organic linear discrete digital "
+    "economics physics chemistry biology algorithms databases programming statistics "
+    "literature poetry philosophy psychology sociology calculus geometry mechanics "
+    "learning ethics politics language culture art music ancient world future"
+).split()
+
+SUBJECTS = [
+    "Fiction", "Computer Science", "Science", "Mathematics", "History", "Philosophy",
+    "Economics", "Engineering", "Literature", "Biology", "Chemistry", "Physics",
+    "Psychology", "Art", "Music", "Law", "Medicine", "Languages", "Geography", "Education",
+]
+
+FIRST_NAMES = ["Ali", "Sara", "Ahmed", "Ayesha", "Bilal", "Fatima", "Hassan", "Zainab",
+               "Omar", "Hina", "Usman", "Maryam", "Imran", "Sana", "Kamran", "Nadia"]
+
+
+def zipf_picker(n, skew, rng):
+    """Return a function picking 0..n-1 with Zipf(skew) popularity."""
+    cumulative = list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, n + 1)))
+    total = cumulative[-1]
+    # Shuffle which titles are popular so popularity is not tied to book code order
+    order = list(range(n))
+    rng.shuffle(order)
+    return lambda: order[bisect.bisect_left(cumulative, rng.random() * total)]
+
+
+def generate(path, books, loans, students, open_ratio, skew, seed, batch=10000):
+    """
+    Build a library database with synthetic books and loan history.
+    Loan popularity follows a Zipf distribution so a few titles are borrowed
+    far more often than the rest, like a real library.
+    """
+    rng = random.Random(seed)
+    pool = configure_pool(path, max_size=1, pragmas={
+        "journal_mode": "WAL", "synchronous": "OFF", "cache_size": -200000, "temp_store": "MEMORY",
+    })
+    bootstrap(pool, seed=False)
+
+    start = time.perf_counter()
+    copies = [rng.randint(1, 10) for _ in range(books)]
+    with pool.connection() as conn:
+        for offset in range(0, books, batch):
+            rows = []
+            for i in range(offset, min(offset + batch, books)):
+                title = " ".join(rng.sample(WORDS, rng.randint(2, 5))).title()
+                rows.append((f"{title} Vol. {i % 7 + 1}", f"BK{i:07d}", copies[i], rng.choice(SUBJECTS)))
+            with transaction(conn):
+                conn.executemany("INSERT INTO books (bname, bcode, total, subject) VALUES (?, ?, ?, ?)", rows)
+    print(f"{books:,} books in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    pick = zipf_picker(books, skew, rng)
+    today = date.today()
+    on_loan = [0] * books
+    open_pairs = set()
+    rows = []
+    with pool.connection() as conn:
+        for n in range(loans):
+            book = pick()
+            regno = f"REG{rng.randrange(students):06d}"
+            idate = today - timedelta(days=rng.randint(0, 730))
+            due = idate + timedelta(days=14)
+            returned = rng.random() >= open_ratio
+            if not returned and (on_loan[book] >= copies[book] or (regno, book) in open_pairs):
+                returned = True
+            if returned:
+                return_date = min(today, idate + timedelta(days=rng.randint(1, 30)))
+            else:
+                return_date = None
+                on_loan[book] += 1
+                open_pairs.add((regno, book))
+            name = f"{rng.choice(FIRST_NAMES)} {regno[-4:]}"
+            rows.append((name, regno, f"BK{book:07d}", idate, due, return_date, 0 if return_date is None else 1))
+            if len(rows) >= batch or n == loans - 1:
+                with transaction(conn):
+                    conn.executemany(
+                        "INSERT INTO issue (name, regno, bcode, idate, due_date, return_date, returned) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                rows = []
+
+        # Copies out on loan are not on the shelf
+        with transaction(conn):
+            conn.executemany(
+                "UPDATE books SET total = total - ? WHERE bcode = ?",
+                [(count, f"BK{book:07d}") for book, count in enumerate(on_loan) if count],
+            )
+            # No app process has cached anything yet; the triggers' log is noise
+            conn.execute("DELETE FROM data_changes")
+        conn.execute("ANALYZE")
+    print(f"{loans:,} loans ({sum(on_loan):,} open) in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic library database")
+    parser.add_argument("--db", default="library_bench.db", help="database file to create")
+    parser.add_argument("--books", type=int, default=100000, help="number of titles")
+    parser.add_argument("--loans", type=int, default=1000000, help="number of loan records")
+    parser.add_argument("--students", type=int, default=20000, help="number of distinct students")
+    parser.add_argument("--open-ratio", type=float, default=0.05, help="share of loans still open")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for title popularity")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--force", action="store_true", help="overwrite an existing database file")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        if not args.force:
+            parser.error(f"{args.db} already exists (use --force to overwrite)")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    generate(args.db, args.books, args.loans, args.students, args.open_ratio, args.skew, args.seed)
+    print(f"Wrote {args.db}")
+
+
+if __name__ == "__main__":
+    main()
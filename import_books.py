@@ -0,0 +1,42 @@
+import argparse
+import sys
+
+from library.bulk_import import detect_format, import_books
+from library.db import DB_PATH, configure_pool
+
+
+def main():
+    """
+    Bulk load books into the library database from a CSV or JSONL file.
+    CSV files need a header row with the columns bname, bcode, total, subject;
+    JSONL files need one object per line with the same keys.
+    Existing books with the same code are updated.
+    """
+    parser = argparse.ArgumentParser(description="Bulk import books into library.db")
+    parser.add_argument("path", help="CSV or JSONL file to import ('-' for stdin)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="input format (default: from file extension)")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per executemany batch")
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.path)
+    configure_pool(args.db, max_size=1)
+
+    def report(result):
+        print(f"\r{result.imported + result.rejected:,} rows read, "
+              f"{result.rejected:,} rejected, {result.rows_per_sec:,.0f} rows/sec",
+              end="", file=sys.stderr, flush=True)
+
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    with stream:
+        result = import_books(stream, fmt, chunk_size=args.chunk_size, progress=report)
+    print(file=sys.stderr)
+
+    for error in result.errors:
+        print(f"rejected {error}", file=sys.stderr)
+    print(f"Imported {result.imported:,} books in {result.seconds:.2f}s "
+          f"({result.rows_per_sec:,.0f} rows/sec), {result.rejected:,} rejected")
+
+
+if __name__ == "__main__":
+    main()
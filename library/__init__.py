@@ -0,0 +1,10 @@
+"""Headless data access and services for the Library Management System.
+
+The Streamlit pages in ``app.py`` are a thin UI over these modules, which can
+also be used from scripts, benchmarks and worker processes:
+
+- ``library.catalog``: add, delete and list books
+- ``library.circulation``: issue and return books
+- ``library.search``: ranked full-text catalog search
+- ``library.reports``: open/overdue loans, return history, dashboard stats
+"""
@@ -0,0 +1,440 @@
+"""Borrowing analytics: popular titles and "also borrowed" recommendations.
+
+Two aggregate tables are kept up to date from loan history:
+
+- ``loan_counts``: loans per title per issue month. Popular titles for any
+  subject and window of whole months are a sum over this table rather than
+  over the loans.
+- ``co_loans``: a sparse title-by-title matrix stored as
+  ``(bcode, other, patrons)`` rows. It counts the students who borrowed both
+  titles, and backs "students who borrowed X also borrowed Y".
+
+:func:`refresh` folds in only the loans issued since the last run. The
+position is a high-water mark on loan ids in ``analytics_state``; archived
+loans keep their ids, so nothing is counted twice. A batch is read and
+aggregated without holding the write lock. It is then written in one short
+transaction, which checks that the high-water mark has not moved. The first
+run, or ``refresh_analytics.py --rebuild``, works through the whole
+history in batches.
+
+On MySQL, ids are handed out when a loan is inserted, not when it commits,
+so a loan can become visible after a higher id has been folded in. The ids a
+batch skipped are remembered in-process, as in :mod:`library.changes`. Each
+later refresh folds in the ones that have committed since. Ids still missing
+after ``LATE_SECONDS`` are assumed to be rolled-back inserts. SQLite
+commits one writer at a time and never skips.
+
+:class:`AnalyticsRefresher` runs :func:`refresh` in a background thread
+every ``REFRESH_SECONDS``, so pages only ever read the aggregates.
+
+Lookups are cached in-process per high-water mark. Repeated views cost a
+primary-key read to confirm nothing new was aggregated, plus a dict lookup.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict
+from datetime import date
+from typing import List, Optional
+
+from library.changes import LATE_SECONDS
+from library.db import get_pool, select_for_update, transaction
+from library.models import AlsoBorrowed, PopularTitle
+
+logger = logging.getLogger("library.analytics")
+
+DEFAULT_BATCH_SIZE = 50000
+WINDOWS = {"This month": 1, "Last 3 months": 3, "Last 12 months": 12, "All time": None}
+CACHE_SIZE = 512
+# How often the background refresher folds in new loans
+REFRESH_SECONDS = float(os.environ.get("LIBRARY_ANALYTICS_REFRESH_SECONDS", "60"))
+
+MIGRATION = [
+    """
+    CREATE TABLE IF NOT EXISTS loan_counts (
+        bcode TEXT NOT NULL,
+        month TEXT NOT NULL,
+        loans INTEGER NOT NULL,
+        PRIMARY KEY (bcode, month)
+    ) WITHOUT ROWID
+    """,
+    # Popular titles over a window: a range of months, covering the counts
+    "CREATE INDEX IF NOT EXISTS idx_loan_counts_month ON loan_counts(month, bcode, loans)",
+    """
+    CREATE TABLE IF NOT EXISTS co_loans (
+        bcode TEXT NOT NULL,
+        other TEXT NOT NULL,
+        patrons INTEGER NOT NULL,
+        PRIMARY KEY (bcode, other)
+    ) WITHOUT ROWID
+    """,
+    "CREATE TABLE IF NOT EXISTS analytics_state (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO analytics_state (name, value) VALUES ('last_loan_id', 0)",
+    # A student's earlier titles when their new loans are paired up
+    "CREATE INDEX IF NOT EXISTS idx_issue_regno ON issue(regno, bcode)",
+]
+
+READ_MARK = "SELECT value FROM analytics_state WHERE name = 'last_loan_id'"
+NEW_LOANS = """
+SELECT id, regno, bcode, idate FROM loan_history
+WHERE id > ?
+ORDER BY id LIMIT ?
+"""
+EARLIER_TITLES = "SELECT DISTINCT bcode FROM loan_history WHERE regno = ? AND id <= ?"
+LATE_LOANS = "SELECT id, regno, bcode, idate FROM loan_history WHERE id IN (SELECT value FROM json_each(?))"
+# Everything folded in already, which is everything up to the mark except the late loans
+OTHER_TITLES = """
+SELECT DISTINCT bcode FROM loan_history
+WHERE regno = ? AND id <= ? AND id NOT IN (SELECT value FROM json_each(?))
+"""
+ADD_LOAN_COUNTS = """
+INSERT INTO loan_counts (bcode, month, loans) VALUES (?, ?, ?)
+ON CONFLICT(bcode, month) DO UPDATE SET loans = loans + excluded.loans
+"""
+ADD_CO_LOANS = """
+INSERT INTO co_loans (bcode, other, patrons) VALUES (?, ?, ?)
+ON CONFLICT(bcode, other) DO UPDATE SET patrons = patrons + excluded.patrons
+"""
+# Sum the counts first, then join the much smaller result to books
+POPULAR_TITLES = """
+SELECT b.bname, t.bcode, b.subject, t.loans
+FROM (
+    SELECT bcode, SUM(loans) AS loans FROM loan_counts
+    WHERE month >= ?
+    GROUP BY bcode
+) t
+JOIN books b ON b.bcode = t.bcode
+{subject}
+ORDER BY t.loans DESC, t.bcode
+LIMIT ?
+"""
+ALSO_BORROWED = """
+SELECT b.bname, c.other, c.patrons
+FROM co_loans c
+JOIN books b ON b.bcode = c.other
+WHERE c.bcode = ?
+ORDER BY c.patrons DESC, c.other
+LIMIT ?
+"""
+
+
+class RefreshResult:
+    __slots__ = ("loans", "pairs", "batches", "late", "last_loan_id", "seconds")
+
+    def __init__(self):
+        self.loans = 0
+        self.pairs = 0
+        self.batches = 0
+        self.late = 0
+        self.last_loan_id = 0
+        self.seconds = 0.0
+
+    @property
+    def loans_per_sec(self):
+        return self.loans / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "loans": self.loans,
+            "pairs": self.pairs,
+            "batches": self.batches,
+            "late": self.late,
+            "last_loan_id": self.last_loan_id,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+def _month(value):
+    return value.strftime("%Y-%m") if isinstance(value, date) else str(value)[:7]
+
+
+def _pair_up(conn, by_student, earlier):
+    """Count each student's new pairs of distinct titles; ``earlier(regno)`` gives titles already counted."""
+    # A student counts once per pair of distinct titles, however often they re-borrow
+    pairs = Counter()
+    for regno, titles in by_student.items():
+        seen = earlier(regno)
+        for bcode in titles:
+            if bcode in seen:
+                continue
+            for other in seen:
+                pairs[(bcode, other)] += 1
+                pairs[(other, bcode)] += 1
+            seen.add(bcode)
+    return pairs
+
+
+def aggregate_batch(conn, mark, batch_size):
+    """Read and aggregate up to ``batch_size`` loans after ``mark``.
+
+    Returns ``(last id, loan counts, co-loan counts, skipped ids)`` or None
+    when there is nothing new. Nothing is written.
+    """
+    loans = conn.execute(NEW_LOANS, (mark, batch_size)).fetchall()
+    if not loans:
+        return None
+    counts = Counter()
+    by_student = defaultdict(list)
+    for _, regno, bcode, idate in loans:
+        counts[(bcode, _month(idate))] += 1
+        by_student[regno].append(bcode)
+    pairs = _pair_up(conn, by_student,
+                     lambda regno: {row[0] for row in conn.execute(EARLIER_TITLES, (regno, mark))})
+    last_id = loans[-1][0]
+    skipped = []
+    # More holes than loans is a bulk rollback or deletion, not commits in flight
+    if last_id - mark - len(loans) <= batch_size:
+        read = {row[0] for row in loans}
+        skipped = [loan_id for loan_id in range(mark + 1, last_id) if loan_id not in read]
+    return last_id, counts, pairs, skipped
+
+
+def aggregate_late(conn, ids, mark):
+    """Aggregate the loans in ``ids`` (all at or below ``mark``) that have committed since.
+
+    Returns ``(ids found, loan counts, co-loan counts)``.
+    """
+    loans = conn.execute(LATE_LOANS, (json.dumps(ids),)).fetchall()
+    found = [row[0] for row in loans]
+    counts = Counter()
+    by_student = defaultdict(list)
+    for _, regno, bcode, idate in loans:
+        counts[(bcode, _month(idate))] += 1
+        by_student[regno].append(bcode)
+    # Later loans were paired without these, so pair them with every title counted so far
+    pairs = _pair_up(conn, by_student, lambda regno: {
+        row[0] for row in conn.execute(OTHER_TITLES, (regno, mark, json.dumps(found)))
+    })
+    return found, counts, pairs
+
+
+# Ids a batch skipped, per pool: id -> when it was skipped
+_skipped = weakref.WeakKeyDictionary()
+_skipped_lock = threading.Lock()
+
+
+def skipped_loans(pool=None) -> List[int]:
+    """Loan ids passed over by this process that have not committed yet."""
+    with _skipped_lock:
+        return sorted(_skipped.get(pool or get_pool(), ()))
+
+
+def _write(conn, counts, pairs):
+    conn.executemany(ADD_LOAN_COUNTS, [(b, m, n) for (b, m), n in counts.items()])
+    conn.executemany(ADD_CO_LOANS, [(b, o, n) for (b, o), n in pairs.items()])
+
+
+def _fold_late(conn, pool, result):
+    """Fold in skipped loans that have committed since, then forget the old ones."""
+    with _skipped_lock:
+        skipped = dict(_skipped.get(pool, {}))
+    if not skipped:
+        return
+    mark = conn.execute(READ_MARK).fetchone()[0]
+    # Ids above the mark (after a rebuild) are read by the next batch as usual
+    due = [loan_id for loan_id in skipped if loan_id <= mark]
+    found, counts, pairs = aggregate_late(conn, due, mark) if due else ([], Counter(), Counter())
+    if found:
+        with transaction(conn):
+            # Another process rebuilding since would count these loans itself
+            if select_for_update(conn, READ_MARK).fetchone()[0] != mark:
+                return
+            _write(conn, counts, pairs)
+        result.loans += sum(counts.values())
+        result.pairs += len(pairs)
+        result.late += len(found)
+    cutoff = time.monotonic() - LATE_SECONDS
+    with _skipped_lock:
+        holes = _skipped.get(pool, {})
+        for loan_id, skipped_at in skipped.items():
+            if loan_id in found or loan_id > mark or skipped_at < cutoff:
+                holes.pop(loan_id, None)
+
+
+def refresh(batch_size: int = DEFAULT_BATCH_SIZE, max_batches: Optional[int] = None,
+            pool=None, progress=None) -> RefreshResult:
+    """Fold loans issued since the last refresh into the aggregates."""
+    pool = pool or get_pool()
+    result = RefreshResult()
+    start = time.perf_counter()
+    with pool.connection() as conn:
+        _fold_late(conn, pool, result)
+        while max_batches is None or result.batches < max_batches:
+            mark = conn.execute(READ_MARK).fetchone()[0]
+            batch = aggregate_batch(conn, mark, batch_size)
+            if batch is None:
+                result.last_loan_id = mark
+                break
+            last_id, counts, pairs, skipped = batch
+            with transaction(conn):
+                moved = conn.execute(
+                    "UPDATE analytics_state SET value = ? WHERE name = 'last_loan_id' AND value = ?",
+                    (last_id, mark),
+                ).rowcount
+                # Another process folded in this batch first; skip ahead to its mark
+                if moved:
+                    _write(conn, counts, pairs)
+            if moved:
+                if skipped:
+                    now = time.monotonic()
+                    with _skipped_lock:
+                        _skipped.setdefault(pool, {}).update(dict.fromkeys(skipped, now))
+                result.loans += sum(counts.values())
+                result.pairs += len(pairs)
+                result.batches += 1
+                result.last_loan_id = last_id
+                result.seconds = time.perf_counter() - start
+                if progress:
+                    progress(result)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def rebuild(batch_size: int = DEFAULT_BATCH_SIZE, pool=None, progress=None) -> RefreshResult:
+    """Drop the aggregates and recompute them from the full loan history."""
+    pool = pool or get_pool()
+    with pool.connection() as conn, transaction(conn):
+        conn.execute("DELETE FROM loan_counts")
+        conn.execute("DELETE FROM co_loans")
+        conn.execute("UPDATE analytics_state SET value = 0 WHERE name = 'last_loan_id'")
+    with _skipped_lock:
+        _skipped.pop(pool, None)
+    return refresh(batch_size, pool=pool, progress=progress)
+
+
+class AnalyticsRefresher:
+    """Background thread that folds in new loans every ``interval`` seconds."""
+
+    def __init__(self, pool=None, interval=REFRESH_SECONDS, batch_size=DEFAULT_BATCH_SIZE):
+        self.pool = pool
+        self.interval = interval
+        self.batch_size = batch_size
+        self.runs = 0
+        self.loans = 0
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="analytics-refresher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.loans += refresh(self.batch_size, pool=self.pool).loans
+            except Exception:
+                logger.exception("analytics refresh failed")
+            self.runs += 1
+            with self._condition:
+                if self._stopping:
+                    return
+                self._condition.wait(self.interval)
+                if self._stopping:
+                    return
+
+    def stats(self):
+        return {"runs": self.runs, "loans": self.loans}
+
+    def close(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_refresher(pool=None, interval=REFRESH_SECONDS):
+    """Start the process-wide refresher if it is not running yet."""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = AnalyticsRefresher(pool, interval)
+    return _refresher
+
+
+def stop_refresher():
+    global _refresher
+    with _refresher_lock:
+        if _refresher is not None:
+            _refresher.close()
+        _refresher = None
+
+
+def pending_loans(pool=None) -> int:
+    """Loans issued since the last refresh."""
+    with (pool or get_pool()).connection() as conn:
+        mark = conn.execute(READ_MARK).fetchone()[0]
+        return conn.execute("SELECT COUNT(*) FROM loan_history WHERE id > ?", (mark,)).fetchone()[0]
+
+
+def window_start(months: Optional[int], today: Optional[date] = None) -> str:
+    """First month (``YYYY-MM``) of a window of ``months`` that ends with, and includes, this month."""
+    if months is None:
+        return "0000-00"
+    today = today or date.today()
+    index = today.year * 12 + today.month - months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class ResultCache:
+    """Lookup results keyed by query, valid while the high-water mark is unchanged."""
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self._results = {}
+        self._mark = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn, key, compute):
+        mark = conn.execute(READ_MARK).fetchone()[0]
+        with self._lock:
+            if mark != self._mark:
+                self._results.clear()
+                self._mark = mark
+            elif key in self._results:
+                self.hits += 1
+                return self._results[key]
+        value = compute()
+        with self._lock:
+            self.misses += 1
+            if self._mark == mark and len(self._results) < self.max_size:
+                self._results[key] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._mark = None
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._results), "hits": self.hits, "misses": self.misses}
+
+
+cache = ResultCache()
+
+
+def popular_titles(subject: Optional[str] = None, months: Optional[int] = None,
+                   limit: int = 10, pool=None) -> List[PopularTitle]:
+    """Most-borrowed titles over this month and the ``months - 1`` before it (None: all time)."""
+    start = window_start(months)
+    params = [start, subject, limit] if subject else [start, limit]
+    sql = POPULAR_TITLES.format(subject="WHERE b.subject = ?" if subject else "")
+    with (pool or get_pool()).connection() as conn:
+        return cache.get(conn, ("popular", subject, start, limit), lambda: [
+            PopularTitle(*row) for row in conn.execute(sql, params).fetchall()
+        ])
+
+
+def also_borrowed(bcode: str, limit: int = 10, pool=None) -> List[AlsoBorrowed]:
+    """Titles most often borrowed by students who also borrowed ``bcode``."""
+    with (pool or get_pool()).connection() as conn:
+        return cache.get(conn, ("also", bcode, limit), lambda: [
+            AlsoBorrowed(*row) for row in conn.execute(ALSO_BORROWED, (bcode, limit)).fetchall()
+        ])
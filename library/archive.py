@@ -0,0 +1,135 @@
+"""Move old returned loans out of the hot ``issue`` table.
+
+Every open-loan query runs against ``issue``. Without archiving, that table
+grows with all the history the library has ever had. ``archive_returned``
+copies returned loans older than a retention threshold into
+``issue_archive`` and deletes them from ``issue``. It works in small batches,
+each in its own short write transaction, so issues and returns are never
+blocked for more than one batch. After archiving, ``issue`` holds only open
+loans and recent returns.
+
+``loan_history`` is a ``UNION ALL`` view over both tables. History reports
+and exports read from it and see every loan. SQLite merges the two branches
+on their own indexes, so ``ORDER BY ... LIMIT`` over the view stays cheap.
+"""
+import json
+import os
+import time
+from datetime import date, timedelta
+
+from library.db import get_pool, run_with_retry, transaction
+from library.stats import ISSUE_DELETE_TRIGGER
+
+DEFAULT_RETENTION_DAYS = int(os.environ.get("LIBRARY_ARCHIVE_DAYS", 365))
+DEFAULT_BATCH_SIZE = 1000
+
+# Statements for migration 7
+MIGRATION = [
+    # Same columns as issue; ids are carried over so they stay unique across both
+    """
+    CREATE TABLE IF NOT EXISTS issue_archive (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        regno TEXT NOT NULL,
+        bcode TEXT NOT NULL,
+        idate DATE NOT NULL,
+        due_date DATE NOT NULL,
+        return_date DATE,
+        returned INTEGER DEFAULT 1
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_archive_return_date ON issue_archive(return_date)",
+    "CREATE INDEX IF NOT EXISTS idx_archive_regno ON issue_archive(regno)",
+    """
+    CREATE VIEW IF NOT EXISTS loan_history AS
+    SELECT id, name, regno, bcode, idate, due_date, return_date, returned FROM issue
+    UNION ALL
+    SELECT id, name, regno, bcode, idate, due_date, return_date, returned FROM issue_archive
+    """,
+    "DROP TRIGGER IF EXISTS stats_issue_delete",
+    ISSUE_DELETE_TRIGGER,
+]
+
+# Oldest returns first, straight off idx_issue_returned_date
+SELECT_BATCH = """
+SELECT id FROM issue
+WHERE returned = 1 AND return_date < ?
+ORDER BY return_date
+LIMIT ?
+"""
+COPY_BATCH = """
+INSERT INTO issue_archive (id, name, regno, bcode, idate, due_date, return_date, returned)
+SELECT id, name, regno, bcode, idate, due_date, return_date, returned
+FROM issue WHERE id IN (SELECT value FROM json_each(?))
+"""
+DELETE_BATCH = "DELETE FROM issue WHERE id IN (SELECT value FROM json_each(?))"
+COUNT_ELIGIBLE = "SELECT COUNT(*) FROM issue WHERE returned = 1 AND return_date < ?"
+
+
+class ArchiveResult:
+    """Counters for a finished (or in-progress) archive run."""
+
+    __slots__ = ("moved", "batches", "seconds")
+
+    def __init__(self):
+        self.moved = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.moved / self.seconds if self.seconds else 0.0
+
+
+def cutoff_date(retention_days=DEFAULT_RETENTION_DAYS, today=None):
+    """Loans returned before this date are eligible for the archive."""
+    return (today or date.today()) - timedelta(days=retention_days)
+
+
+def archive_batch(conn, cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """Move one batch inside the caller's transaction; returns rows moved."""
+    ids = [row[0] for row in conn.execute(SELECT_BATCH, (cutoff.isoformat(), batch_size))]
+    if ids:
+        payload = json.dumps(ids)
+        conn.execute(COPY_BATCH, (payload,))
+        conn.execute(DELETE_BATCH, (payload,))
+    return len(ids)
+
+
+def count_eligible(retention_days=DEFAULT_RETENTION_DAYS, pool=None):
+    """How many returned loans an archive run would move now."""
+    with (pool or get_pool()).connection() as conn:
+        return conn.execute(COUNT_ELIGIBLE, (cutoff_date(retention_days).isoformat(),)).fetchone()[0]
+
+
+def archive_returned(retention_days=DEFAULT_RETENTION_DAYS, batch_size=DEFAULT_BATCH_SIZE,
+                     pause=0.0, max_batches=None, pool=None, progress=None):
+    """Archive returned loans older than ``retention_days`` in batches.
+
+    The write lock is released between batches. ``pause`` seconds of sleep
+    between them give other writers a clear turn. ``progress`` is called
+    after every batch with the running ArchiveResult.
+    """
+    pool = pool or get_pool()
+    cutoff = cutoff_date(retention_days)
+    result = ArchiveResult()
+    start = time.perf_counter()
+
+    def move():
+        with pool.connection() as conn, transaction(conn):
+            return archive_batch(conn, cutoff, batch_size)
+
+    while max_batches is None or result.batches < max_batches:
+        moved = run_with_retry(move)
+        if not moved:
+            break
+        result.moved += moved
+        result.batches += 1
+        result.seconds = time.perf_counter() - start
+        if progress:
+            progress(result)
+        if pause:
+            time.sleep(pause)
+
+    result.seconds = time.perf_counter() - start
+    return result
@@ -0,0 +1,300 @@
+"""Online backups, snapshots and verified restores of the SQLite database.
+
+Copying ``library.db`` with ``cp`` while the app writes can capture a torn
+file, and a copy without its ``-wal`` file loses recent commits. :func:`backup`
+uses SQLite's online backup API instead. It copies ``pages`` pages per step
+and sleeps ``pause`` seconds between steps, so the copy never holds the disk
+or the file lock for long. The copy runs inside one read transaction. In WAL
+mode that is a fixed snapshot which writers never wait for. Without it, every
+commit made during the copy would restart the backup from the first page.
+While the copy runs, checkpoints cannot pass the snapshot, so the WAL file
+grows until the backup finishes.
+
+:func:`vacuum_into` writes a compacted copy with ``VACUUM INTO`` in a single
+pass instead; it is smaller but cannot be throttled.
+
+:func:`snapshot` writes a timestamped backup into a directory, checks it with
+:func:`verify` and keeps the newest ``keep``. :func:`restore` copies a
+verified snapshot back over the live database in a single step, so other
+connections never see it half-written. It then checks and migrates the
+restored database, putting the previous one back if either fails, and logs
+a change that makes every app process drop its caches. Restores
+are point-in-time only to the granularity of the snapshots.
+
+Only SQLite is supported; back up MySQL with ``mysqldump --single-transaction``.
+"""
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from library import changes
+from library.db import get_pool, transaction
+from library.migrations import LATEST_VERSION, apply_migrations, schema_version
+
+DEFAULT_PAGES = int(os.environ.get("LIBRARY_BACKUP_PAGES", "256"))
+DEFAULT_PAUSE = float(os.environ.get("LIBRARY_BACKUP_PAUSE_MS", "5")) / 1000
+DEFAULT_KEEP = int(os.environ.get("LIBRARY_BACKUP_KEEP", "14"))
+
+SNAPSHOT_PREFIX = "library-"
+SNAPSHOT_FORMAT = "%Y%m%d-%H%M%S"
+SNAPSHOT_SUFFIX = ".db"
+
+# Row counts compared between a snapshot and the database restored from it
+COUNTED_TABLES = ("books", "issue", "issue_archive", "holds", "users")
+
+
+class BackupError(Exception):
+    """A backup, verification or restore that did not complete."""
+
+
+class BackupResult:
+    __slots__ = ("path", "method", "pages", "steps", "bytes", "seconds", "verified")
+
+    def __init__(self, path, method):
+        self.path = path
+        self.method = method
+        self.pages = 0
+        self.steps = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.verified = None
+
+    @property
+    def mb_per_sec(self):
+        return self.bytes / 2 ** 20 / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "path": self.path,
+            "method": self.method,
+            "pages": self.pages,
+            "steps": self.steps,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+            "verified": self.verified,
+        }
+
+
+def _sqlite_pool(pool):
+    pool = pool or get_pool()
+    if pool.dialect.name != "sqlite" or pool.path == ":memory:":
+        raise BackupError("Online backup needs a SQLite database file; "
+                          "back up MySQL with mysqldump --single-transaction.")
+    return pool
+
+
+def _finish(partial, dest, result, start):
+    os.replace(partial, dest)
+    result.bytes = os.path.getsize(dest)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def backup(dest, pages=DEFAULT_PAGES, pause=DEFAULT_PAUSE, pool=None, progress=None) -> BackupResult:
+    """Copy the live database to ``dest`` as of the moment the copy starts.
+
+    ``progress(copied, total)`` is called after each step. The copy is
+    written next to ``dest`` and renamed into place only once it is complete.
+    """
+    pool = _sqlite_pool(pool)
+    result = BackupResult(dest, "backup")
+    partial = dest + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    start = time.perf_counter()
+    source = pool.dedicated()
+    target = sqlite3.connect(partial)
+    try:
+        # Pin one snapshot for the whole copy; otherwise each commit restarts it
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        def step(status, remaining, total):
+            result.steps += 1
+            result.pages = total
+            if progress:
+                progress(total - remaining, total)
+            if pause and remaining:
+                time.sleep(pause)
+
+        source.backup(target, pages=pages, progress=step)
+        source.execute("ROLLBACK")
+        # A self-contained file, with no -wal alongside it
+        target.execute("PRAGMA journal_mode = DELETE")
+    except Exception:
+        target.close()
+        os.remove(partial)
+        raise
+    finally:
+        source.close()
+    target.close()
+    return _finish(partial, dest, result, start)
+
+
+def vacuum_into(dest, pool=None) -> BackupResult:
+    """Write a compacted copy of the live database to ``dest`` in one pass."""
+    pool = _sqlite_pool(pool)
+    result = BackupResult(dest, "vacuum")
+    partial = dest + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    start = time.perf_counter()
+    try:
+        with pool.connection() as conn:
+            conn.execute("VACUUM INTO ?", (partial,))
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    except Exception:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    result.steps = 1
+    _finish(partial, dest, result, start)
+    result.pages = result.bytes // page_size
+    return result
+
+
+def verify(path) -> dict:
+    """Check a backup's integrity and schema; returns its row counts.
+
+    Raises BackupError when SQLite finds corruption or the schema is newer
+    than this code.
+    """
+    if not os.path.isfile(path):
+        raise BackupError(f"No backup at {path}.")
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.Error as e:
+        raise BackupError(f"{path} cannot be opened: {e}") from e
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        if problems != ["ok"]:
+            raise BackupError(f"{path} is corrupt: {'; '.join(problems[:5])}")
+        version = schema_version(conn)
+        if version > LATEST_VERSION:
+            raise BackupError(f"{path} has schema version {version}; this code knows {LATEST_VERSION}.")
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        counts = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in COUNTED_TABLES if table in tables
+        }
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"{path} is not a valid database: {e}") from e
+    finally:
+        conn.close()
+    return {"schema_version": version, "counts": counts}
+
+
+def snapshot_name(taken_at: datetime) -> str:
+    return f"{SNAPSHOT_PREFIX}{taken_at.strftime(SNAPSHOT_FORMAT)}{SNAPSHOT_SUFFIX}"
+
+
+def list_snapshots(directory) -> List[Tuple[datetime, str]]:
+    """``(taken at, path)`` for each snapshot in ``directory``, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        if not (name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)):
+            continue
+        try:
+            taken_at = datetime.strptime(name[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)], SNAPSHOT_FORMAT)
+        except ValueError:
+            continue
+        found.append((taken_at, os.path.join(directory, name)))
+    return sorted(found)
+
+
+def find_snapshot(directory, at: Optional[datetime] = None) -> str:
+    """The newest snapshot taken at or before ``at`` (default: the newest)."""
+    candidates = [path for taken_at, path in list_snapshots(directory) if at is None or taken_at <= at]
+    if not candidates:
+        raise BackupError(f"No snapshot in {directory}" + (f" taken by {at:%Y-%m-%d %H:%M}." if at else "."))
+    return candidates[-1]
+
+
+def prune_snapshots(directory, keep=DEFAULT_KEEP) -> List[str]:
+    """Delete all but the newest ``keep`` snapshots; returns the paths removed."""
+    snapshots = list_snapshots(directory)
+    removed = [path for _, path in snapshots[:max(len(snapshots) - keep, 0)]]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def snapshot(directory, keep=DEFAULT_KEEP, pages=DEFAULT_PAGES, pause=DEFAULT_PAUSE,
+             pool=None, progress=None) -> BackupResult:
+    """Back up into a timestamped file in ``directory``, verify it, then apply retention."""
+    os.makedirs(directory, exist_ok=True)
+    dest = os.path.join(directory, snapshot_name(datetime.now()))
+    if os.path.exists(dest):
+        raise BackupError(f"{dest} already exists; snapshots are at most one per second.")
+    result = backup(dest, pages, pause, pool, progress)
+    try:
+        result.verified = verify(dest)
+    except BackupError:
+        os.remove(dest)
+        raise
+    prune_snapshots(directory, keep)
+    return result
+
+
+def _copy_over(path, pool):
+    """Overwrite the live database with the file at ``path``."""
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    target = pool.dedicated()
+    try:
+        # One step: the destination is locked once and never seen half-restored
+        source.backup(target, pages=-1)
+    finally:
+        source.close()
+        target.close()
+
+
+def _log_replaced(pool, newest):
+    """Log a change that makes every app process drop its caches."""
+    with pool.connection() as conn, transaction(conn):
+        # Log ids went back in time; jump past every id a running process has seen
+        restored = conn.execute("SELECT MAX(id) FROM data_changes").fetchone()[0] or 0
+        conn.execute("INSERT INTO data_changes (id, topic) VALUES (?, ?)",
+                     (max(newest, restored) + 1, changes.ALL))
+
+
+def restore(path, pool=None, safety_copy=None) -> dict:
+    """Replace the live database with the snapshot at ``path``.
+
+    The snapshot is verified first. The live database is then backed up to
+    ``safety_copy``, or to a temporary file next to it when that is None.
+    If the restored database fails its integrity check, does not match the
+    snapshot's row counts or cannot be migrated, the backup is copied back
+    and BackupError is raised. Returns the restored counts.
+    """
+    pool = _sqlite_pool(pool)
+    expected = verify(path)
+    previous = safety_copy or f"{pool.path}.restoring"
+    backup(previous, pause=0, pool=pool)
+    with pool.connection() as conn:
+        newest = conn.execute("SELECT MAX(id) FROM data_changes").fetchone()[0] or 0
+    try:
+        _copy_over(path, pool)
+        with pool.connection() as conn:
+            if conn.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise BackupError(f"The database restored from {path} failed its integrity check.")
+            actual = {
+                table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in expected["counts"]
+            }
+            if actual != expected["counts"]:
+                raise BackupError(f"Restored row counts {actual} do not match the snapshot's {expected['counts']}.")
+            apply_migrations(conn)
+    except Exception as e:
+        _copy_over(previous, pool)
+        _log_replaced(pool, newest)
+        if safety_copy is None:
+            os.remove(previous)
+        raise BackupError(f"Restoring {path} failed, so the previous database was put back: {e}") from e
+    _log_replaced(pool, newest)
+    if safety_copy is None:
+        os.remove(previous)
+    return {"schema_version": expected["schema_version"], "counts": actual}
@@ -0,0 +1,61 @@
+"""One-time database bootstrap: migrations, sample data and the first login.
+
+Streamlit re-executes ``app.py`` on every interaction, so schema setup must
+not live on the rerun path. :func:`bootstrap` runs at most once per process
+(further calls return the first result) and records how long it took.
+"""
+import sys
+import threading
+import time
+
+from library.bulk_import import upsert_books
+from library.db import get_pool, transaction
+from library.migrations import apply_migrations, schema_version
+from library.users import INITIAL_ADMIN, seed_users
+
+SAMPLE_BOOKS = [
+    ('The Great Gatsby', 'BOOK001', 5, 'Fiction'),
+    ('To Kill a Mockingbird', 'BOOK002', 3, 'Fiction'),
+    ('Introduction to Algorithms', 'BOOK003', 2, 'Computer Science'),
+    ('Database Systems', 'BOOK004', 4, 'Computer Science'),
+    ('Physics for Scientists and Engineers', 'BOOK005', 3, 'Science'),
+]
+
+_lock = threading.Lock()
+_result = None
+
+
+def bootstrap(pool=None, seed=True):
+    """Migrate the schema and seed an empty catalog, once per process.
+
+    Returns a dict with the schema version, the migrations applied, whether
+    sample books were added and the elapsed time in milliseconds.
+    """
+    global _result
+    with _lock:
+        if _result is not None:
+            return _result
+        start = time.perf_counter()
+        with (pool or get_pool()).connection() as conn:
+            applied = apply_migrations(conn)
+            seeded = False
+            if seed:
+                with transaction(conn):
+                    # Inside the write lock so two processes cannot both seed
+                    if conn.execute("SELECT 1 FROM books LIMIT 1").fetchone() is None:
+                        upsert_books(conn, SAMPLE_BOOKS)
+                        seeded = True
+            # Without an account nobody could log in to create one
+            password = seed_users(conn)
+            if password is not None:
+                # Shown once; only the hash is stored
+                print(f"Created the {INITIAL_ADMIN} account with password {password} "
+                      "- change it on the Staff Accounts page.", file=sys.stderr)
+            version = schema_version(conn)
+        _result = {
+            "schema_version": version,
+            "migrations_applied": applied,
+            "seeded": seeded,
+            "startup_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+        return _result
@@ -0,0 +1,198 @@
+"""Streaming bulk import of catalog rows into the ``books`` table.
+
+Rows are read lazily from CSV or JSONL, validated, and upserted with
+``executemany`` in chunks. Several chunks share one transaction so a large
+catalog costs a handful of commits instead of one per title. At most
+``chunk_size * chunks_per_commit`` rows (100,000 with the defaults) are held
+in memory before they are written, whatever the size of the input file.
+A malformed line is counted as a rejected row, like a row that fails
+validation. A row that raises the stock of a title with waiting holds hands
+the new copies to the queue in the same transaction.
+"""
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+from library import holds
+from library.catalog_index import get_catalog_index
+from library.db import get_pool, run_with_retry, select_for_update, transaction
+
+FIELDS = ("bname", "bcode", "total", "subject")
+
+UPSERT_BOOK = """
+INSERT INTO books (bname, bcode, total, subject) VALUES (?, ?, ?, ?)
+ON CONFLICT(bcode) DO UPDATE SET
+    bname = excluded.bname,
+    total = excluded.total,
+    subject = excluded.subject
+"""
+# Few titles have a queue, so read them all rather than look up every row
+WAITING_TITLES = "SELECT DISTINCT bcode FROM holds WHERE status = 'waiting'"
+
+# Keep only the first few rejects so a bad file cannot grow memory
+MAX_REPORTED_ERRORS = 50
+
+
+class ImportResult:
+    """Counters for a finished (or in-progress) import."""
+
+    __slots__ = ("imported", "rejected", "errors", "seconds")
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.imported / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "errors": list(self.errors),
+            "seconds": round(self.seconds, 3),
+            "rows_per_sec": round(self.rows_per_sec, 1),
+        }
+
+
+def detect_format(filename):
+    """Guess ``csv`` or ``jsonl`` from a file name."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    return "csv"
+
+
+def iter_records(stream, fmt="csv"):
+    """Yield ``(line number, record)`` for each input record in a text stream.
+
+    CSV records are dicts. JSONL records are the raw line, parsed by
+    :func:`validate_record`, so one bad line is rejected on its own instead
+    of ending the import.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if line:
+                yield number, line
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def validate_record(record):
+    """Return a ``(bname, bcode, total, subject)`` tuple or raise ValueError."""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            raise ValueError(f"not valid JSON: {e}")
+        if not isinstance(record, dict):
+            raise ValueError("not a JSON object")
+    # Strip first: a blank code would otherwise import as "" and collide on upsert
+    values = {field: str(record[field]).strip() if record.get(field) is not None else ""
+              for field in FIELDS}
+    missing = [field for field in FIELDS if not values[field]]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    total = record["total"]
+    # int() would silently truncate 3.7 to 3
+    if isinstance(total, bool) or (isinstance(total, float) and not total.is_integer()):
+        raise ValueError(f"total is not a whole number: {total!r}")
+    try:
+        total = int(total.strip() if isinstance(total, str) else total)
+    except (TypeError, ValueError):
+        raise ValueError(f"total is not a whole number: {total!r}")
+    if total < 0:
+        raise ValueError("total cannot be negative")
+    return values["bname"], values["bcode"], total, values["subject"]
+
+
+def upsert_books(conn, rows):
+    """Insert or update a batch of validated book tuples on ``conn``.
+
+    Returns the holds made ready by copies added to queued titles; the
+    caller announces them with :func:`holds.notify_ready` after commit.
+    """
+    waiting = {row[0] for row in conn.execute(WAITING_TITLES)}
+    # The last row for a code wins, as it does in the upsert
+    restocked = {bcode: total for _, bcode, total, _ in rows if bcode in waiting}
+    before = {}
+    for bcode in restocked:
+        row = select_for_update(conn, "SELECT total FROM books WHERE bcode = ?", (bcode,)).fetchone()
+        before[bcode] = row[0] if row else 0
+    conn.executemany(UPSERT_BOOK, rows)
+    now = datetime.now()
+    ready = []
+    for bcode, total in restocked.items():
+        if total > before[bcode]:
+            ready.extend(holds.allocate_added_in_transaction(conn, bcode, total - before[bcode], now))
+    return ready
+
+
+def import_books(stream, fmt="csv", chunk_size=5000, chunks_per_commit=20,
+                 pool=None, progress=None):
+    """Stream records from ``stream`` into ``books``.
+
+    ``progress`` is called after every chunk with the running ImportResult.
+    """
+    pool = pool or get_pool()
+    result = ImportResult()
+    start = time.perf_counter()
+    chunk = []
+    pending = []
+
+    def flush():
+        if not pending:
+            return
+
+        def write():
+            ready = []
+            with pool.connection() as conn, transaction(conn):
+                for batch in pending:
+                    ready.extend(upsert_books(conn, batch))
+            return ready
+
+        ready = run_with_retry(write)
+        pending.clear()
+        # Cheaper to reload the picker index once than to patch it row by row
+        get_catalog_index().invalidate()
+        holds.notify_ready(ready)
+
+    def end_chunk():
+        nonlocal chunk
+        pending.append(chunk)
+        result.imported += len(chunk)
+        chunk = []
+        if len(pending) >= chunks_per_commit:
+            flush()
+        result.seconds = time.perf_counter() - start
+        if progress:
+            progress(result)
+
+    for line, record in iter_records(stream, fmt):
+        try:
+            chunk.append(validate_record(record))
+        except (ValueError, AttributeError) as e:
+            result.rejected += 1
+            if len(result.errors) < MAX_REPORTED_ERRORS:
+                result.errors.append(f"line {line}: {e}")
+            continue
+        if len(chunk) >= chunk_size:
+            end_chunk()
+
+    if chunk:
+        end_chunk()
+    flush()
+    result.seconds = time.perf_counter() - start
+    if progress:
+        progress(result)
+    return result
@@ -0,0 +1,106 @@
+"""Catalog repository: adding, removing and listing books."""
+from datetime import datetime
+from typing import Optional
+
+from library import holds
+from library.catalog_index import get_catalog_index
+from library.circulation import BookNotFound
+from library.db import get_pool, is_integrity_error, run_with_retry, transaction
+from library.models import Book
+from library.pagination import Page
+from library.stats import subjects
+from library.views import BOOKS_VIEW
+
+BOOK_SORTS = list(BOOKS_VIEW.sortable)
+
+
+class CatalogError(Exception):
+    """Base class for catalog failures the UI reports to the user."""
+
+
+class DuplicateBook(CatalogError):
+    pass
+
+
+class BookOnLoan(CatalogError):
+    pass
+
+
+def _filters(subject, available_only):
+    filters = []
+    if subject:
+        filters.append(("subject = ?", (subject,)))
+    if available_only:
+        filters.append(("total > 0", ()))
+    return filters
+
+
+def get_book(bcode: str, pool=None) -> Optional[Book]:
+    with (pool or get_pool()).connection() as conn:
+        row = conn.execute(
+            "SELECT bname, bcode, total, subject FROM books WHERE bcode = ?", (bcode,)
+        ).fetchone()
+    return Book(*row) if row else None
+
+
+def add_book(bname: str, bcode: str, total: int, subject: str, pool=None) -> Book:
+    """Add a new title; raises DuplicateBook if the code is taken."""
+    pool = pool or get_pool()
+
+    def attempt():
+        with pool.connection() as conn, transaction(conn):
+            conn.execute(
+                "INSERT INTO books (bname, bcode, total, subject) VALUES (?, ?, ?, ?)",
+                (bname, bcode, total, subject),
+            )
+            return holds.allocate_added_in_transaction(conn, bcode, total, datetime.now())
+
+    try:
+        ready = run_with_retry(attempt)
+    except Exception as e:
+        if not is_integrity_error(e):
+            raise
+        raise DuplicateBook("Book with this code already exists!")
+    shelved = total - len(ready)
+    get_catalog_index().add(bcode, bname, shelved)
+    holds.notify_ready(ready)
+    return Book(bname, bcode, shelved, subject)
+
+
+def delete_book(bcode: str, pool=None) -> None:
+    """Remove a title; refuses while any copy is on loan or on hold."""
+    pool = pool or get_pool()
+
+    def attempt():
+        with pool.connection() as conn, transaction(conn):
+            on_loan = conn.execute(
+                "SELECT id FROM issue WHERE bcode = ? AND returned = 0 LIMIT 1", (bcode,)
+            ).fetchone()
+            if on_loan:
+                raise BookOnLoan("Cannot delete book as it is currently issued to students.")
+            on_hold = conn.execute(
+                "SELECT id FROM holds WHERE bcode = ? AND status IN ('waiting', 'ready') LIMIT 1", (bcode,)
+            ).fetchone()
+            if on_hold:
+                raise BookOnLoan("Cannot delete book as students are waiting for it.")
+            if conn.execute("DELETE FROM books WHERE bcode = ?", (bcode,)).rowcount == 0:
+                raise BookNotFound("Book not found in the system.")
+
+    run_with_retry(attempt)
+    get_catalog_index().remove(bcode)
+
+
+def find_books(text: str, limit: int = 20, available_only: bool = False):
+    """Typeahead over the shared in-memory index; returns IndexedBook records."""
+    return get_catalog_index().lookup(text, limit=limit, available_only=available_only)
+
+
+def list_books(sort: str = "Book Name", after=None, page_size: int = 25, descending: bool = False,
+               subject: Optional[str] = None, available_only: bool = False, pool=None) -> Page:
+    """One page of the catalog; ``Page.rows`` holds Book records."""
+    return BOOKS_VIEW.page(sort, after, page_size, descending,
+                           _filters(subject, available_only), pool=pool)
+
+
+def count_books(subject: Optional[str] = None, available_only: bool = False, pool=None) -> int:
+    return BOOKS_VIEW.count(_filters(subject, available_only), pool=pool)
@@ -0,0 +1,183 @@
+"""Process-wide in-memory catalog index for book pickers.
+
+The Issue and Delete pages used to load every title into a selectbox on each
+rerun of each session. This index is loaded once per process and shared: one
+small ``__slots__`` record per title plus two sorted key lists (book codes and
+title words) searched with ``bisect`` for typeahead. Catalog and circulation
+writes update it in place; bulk imports mark it stale so it reloads on the
+next lookup. Writes made by other processes arrive through
+:mod:`library.changes`, which reloads just the titles they touched.
+"""
+import bisect
+import re
+import threading
+
+from library import changes
+from library.db import get_pool
+
+_WORD = re.compile(r"\w+")
+
+
+class IndexedBook:
+    __slots__ = ("bcode", "bname", "total")
+
+    def __init__(self, bcode, bname, total):
+        self.bcode = bcode
+        self.bname = bname
+        self.total = total
+
+    def label(self):
+        return f"{self.bname} ({self.bcode})"
+
+
+def _words(title):
+    return sorted(set(_WORD.findall(title.lower())))
+
+
+class CatalogIndex:
+    def __init__(self, pool=None):
+        self._pool = pool
+        self._lock = threading.RLock()
+        self._books = {}
+        self._codes = []   # sorted (lower code, code)
+        self._words = []   # sorted (word, code)
+        self._loaded = False
+
+    def load(self):
+        """(Re)build the index from the books table."""
+        books, codes, words = {}, [], []
+        with (self._pool or get_pool()).connection() as conn:
+            for bcode, bname, total in conn.execute("SELECT bcode, bname, total FROM books"):
+                books[bcode] = IndexedBook(bcode, bname, total)
+                codes.append((bcode.lower(), bcode))
+                words.extend((word, bcode) for word in _words(bname))
+        codes.sort()
+        words.sort()
+        with self._lock:
+            self._books, self._codes, self._words = books, codes, words
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def invalidate(self):
+        """Drop the index; the next lookup reloads it."""
+        with self._lock:
+            self._loaded = False
+            self._books, self._codes, self._words = {}, [], []
+
+    def refresh(self, bcodes):
+        """Reload ``bcodes`` from the books table; None reloads everything."""
+        if bcodes is None:
+            self.invalidate()
+            return
+        if not self._loaded:
+            return
+        bcodes = list(bcodes)
+        found = {}
+        with (self._pool or get_pool()).connection() as conn:
+            for start in range(0, len(bcodes), 500):
+                chunk = bcodes[start:start + 500]
+                found.update((row[0], row) for row in conn.execute(
+                    f"SELECT bcode, bname, total FROM books WHERE bcode IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ))
+        with self._lock:
+            for bcode in bcodes:
+                if bcode in found:
+                    self.add(*found[bcode])
+                else:
+                    self.remove(bcode)
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._books)
+
+    def get(self, bcode):
+        self._ensure_loaded()
+        return self._books.get(bcode)
+
+    # Incremental maintenance; ignored until the index has been loaded
+
+    def add(self, bcode, bname, total):
+        with self._lock:
+            if not self._loaded:
+                return
+            if bcode in self._books:
+                self.remove(bcode)
+            self._books[bcode] = IndexedBook(bcode, bname, total)
+            bisect.insort(self._codes, (bcode.lower(), bcode))
+            for word in _words(bname):
+                bisect.insort(self._words, (word, bcode))
+
+    def remove(self, bcode):
+        with self._lock:
+            book = self._books.pop(bcode, None) if self._loaded else None
+            if book is None:
+                return
+            self._discard(self._codes, (bcode.lower(), bcode))
+            for word in _words(book.bname):
+                self._discard(self._words, (word, bcode))
+
+    def adjust_stock(self, bcode, delta):
+        with self._lock:
+            book = self._books.get(bcode) if self._loaded else None
+            if book is not None:
+                book.total += delta
+
+    @staticmethod
+    def _discard(keys, key):
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    @staticmethod
+    def _prefix(keys, prefix):
+        """Yield codes whose key starts with ``prefix``, in key order."""
+        i = bisect.bisect_left(keys, (prefix, ""))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            yield keys[i][1]
+            i += 1
+
+    def lookup(self, text, limit=20, available_only=False):
+        """Typeahead: books whose code starts with ``text`` or whose title has
+        a word starting with each word of ``text``."""
+        self._ensure_loaded()
+        tokens = _WORD.findall(text.lower())
+        results, seen = [], set()
+        with self._lock:
+            candidates = []
+            if text.strip():
+                candidates.append(self._prefix(self._codes, text.strip().lower()))
+            if tokens:
+                # Scan the rarest-looking (longest) token, then check the rest
+                anchor = max(range(len(tokens)), key=lambda i: len(tokens[i]))
+                rest = tokens[:anchor] + tokens[anchor + 1:]
+                candidates.append(
+                    code for code in self._prefix(self._words, tokens[anchor])
+                    if all(any(w.startswith(t) for w in _WORD.findall(self._books[code].bname.lower()))
+                           for t in rest)
+                )
+            if not candidates:
+                candidates.append(self._prefix(self._codes, ""))
+            for source in candidates:
+                for code in source:
+                    book = self._books[code]
+                    if code in seen or (available_only and book.total <= 0):
+                        continue
+                    seen.add(code)
+                    results.append(book)
+                    if len(results) >= limit:
+                        return results
+        return results
+
+
+_index = CatalogIndex()
+changes.subscribe(changes.BOOKS, _index.refresh)
+changes.subscribe(changes.STOCK, _index.refresh)
+
+
+def get_catalog_index():
+    """Return the process-wide index (loaded on first lookup)."""
+    return _index
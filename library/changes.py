@@ -0,0 +1,283 @@
+"""Change notifications that keep in-memory caches fresh across processes.
+
+Several app processes can serve one database behind a load balancer. Each
+keeps caches in memory: the catalog index behind the book pickers, the
+Streamlit stats cache and the session tokens. A write made by one process
+would otherwise leave the others serving stale availability until a TTL ran
+out.
+
+Every change is appended to ``data_changes`` as a ``(topic, item)`` row, in
+the writing transaction. Triggers on ``books`` and ``issue`` cover every
+writer, including the API, imports and scripts. :mod:`library.users` records
+account changes itself, because rehashing a password on login is not one.
+
+Each process remembers the last change id it has seen. :func:`poll` reads the
+newer rows and passes each subscriber the set of items changed in its topic,
+so a cache drops only those keys. On SQLite, ``PRAGMA data_version`` on a
+private connection tells first whether any other connection has committed
+at all. If nothing has, the poll stops there. MySQL reads the change log
+directly; that is a primary-key range read.
+
+On MySQL, ids are handed out when a row is inserted, not when it commits, so
+a change can become visible after a higher id has already been read. The
+watcher remembers the ids it skipped over and reads from the lowest of them
+on later polls, for up to ``LATE_SECONDS``. After that it assumes the id
+belonged to a transaction that rolled back. SQLite commits one writer at a
+time, so it never leaves such holes.
+
+The log keeps the newest ``LIBRARY_CHANGE_LOG_ROWS`` rows (default 100000).
+A subscriber is passed None, meaning assume everything changed, in three
+cases: when a poll finds more than ``MAX_ITEMS`` changes in its topic, when
+it finds more than ``MAX_READ`` changes in total, or when the process has
+fallen further behind than the log keeps.
+"""
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict
+
+from library.db import get_pool, transaction
+
+BOOKS = "books"  # title added, removed, renamed or moved to another subject
+STOCK = "stock"  # copies on the shelf
+LOANS = "loans"  # book issued or returned
+USERS = "users"  # password changed or account disabled
+ALL = "*"  # the whole database was replaced, e.g. restored from a backup
+
+KEEP_CHANGES = int(os.environ.get("LIBRARY_CHANGE_LOG_ROWS", "100000"))
+# Prune each time the log has grown by this many rows
+PRUNE_EVERY = 10000
+# Rows read per poll; beyond that every topic is treated as changed
+MAX_READ = 5000
+# Items per topic passed to subscribers; beyond that the topic reloads whole
+MAX_ITEMS = 1000
+# How long a skipped id is re-read in case its transaction commits late
+LATE_SECONDS = 60
+# How often long-running processes such as the API server poll
+POLL_SECONDS = float(os.environ.get("LIBRARY_CHANGE_POLL_SECONDS", "1"))
+
+# Identifies changes this process recorded itself, which it has already applied
+ORIGIN = secrets.token_hex(8)
+
+MIGRATION = [
+    """
+    CREATE TABLE IF NOT EXISTS data_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT NOT NULL,
+        item TEXT,
+        origin TEXT
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS changes_books_insert AFTER INSERT ON books BEGIN
+        INSERT INTO data_changes (topic, item) VALUES ('books', new.bcode);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS changes_books_delete AFTER DELETE ON books BEGIN
+        INSERT INTO data_changes (topic, item) VALUES ('books', old.bcode);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS changes_books_title AFTER UPDATE OF bname, subject ON books
+    WHEN new.bname IS NOT old.bname OR new.subject IS NOT old.subject BEGIN
+        INSERT INTO data_changes (topic, item) VALUES ('books', new.bcode);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS changes_books_total AFTER UPDATE OF total ON books
+    WHEN new.total <> old.total BEGIN
+        INSERT INTO data_changes (topic, item) VALUES ('stock', new.bcode);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS changes_issue_insert AFTER INSERT ON issue BEGIN
+        INSERT INTO data_changes (topic, item) VALUES ('loans', new.bcode);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS changes_issue_returned AFTER UPDATE OF returned ON issue
+    WHEN new.returned <> old.returned BEGIN
+        INSERT INTO data_changes (topic, item) VALUES ('loans', new.bcode);
+    END
+    """,
+]
+
+NEWEST = "SELECT MAX(id) FROM data_changes"
+OLDEST = "SELECT MIN(id) FROM data_changes"
+READ_CHANGES = """
+SELECT id, topic, item, origin FROM data_changes
+WHERE id > ?
+ORDER BY id LIMIT ?
+"""
+RECORD_CHANGE = "INSERT INTO data_changes (topic, item, origin) VALUES (?, ?, ?)"
+
+
+def record(conn, topic, item):
+    """Log a change the triggers do not see; call inside the writing transaction."""
+    conn.execute(RECORD_CHANGE, (topic, item, ORIGIN))
+
+
+def prune(keep=KEEP_CHANGES, pool=None):
+    """Delete all but the newest ``keep`` changes; returns how many went."""
+    with (pool or get_pool()).connection() as conn, transaction(conn):
+        newest = conn.execute(NEWEST).fetchone()[0] or 0
+        return conn.execute("DELETE FROM data_changes WHERE id <= ?", (newest - keep,)).rowcount
+
+
+class ChangeWatcher:
+    """Reads the change log for one process and notifies subscribers.
+
+    Callbacks run on the polling thread with the watcher's lock held. They
+    must not call :meth:`poll` themselves.
+    """
+
+    def __init__(self, pool=None, origin=ORIGIN):
+        self._pool = pool
+        self.origin = origin
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(list)
+        self._source = None
+        self._last_id = None
+        self._conn = None
+        self._data_version = None
+        # Skipped ids not seen yet: id -> when it was first skipped
+        self._holes = {}
+        self.polls = 0
+        self.skipped = 0
+        self.changes = 0
+        self.late = 0
+        self.reloads = 0
+
+    def subscribe(self, topic, callback):
+        """Call ``callback(items)`` with each poll's changed items in ``topic``."""
+        with self._lock:
+            self._subscribers[topic].append(callback)
+
+    def _reset(self, pool):
+        # configure_pool() pointed the process at another database
+        if self._conn is not None:
+            self._conn.close()
+        self._source, self._last_id, self._conn, self._data_version = pool, None, None, None
+        self._holes = {}
+
+    def _unchanged(self, pool):
+        """SQLite only: whether no other connection has committed since the last poll."""
+        if pool.dialect.name != "sqlite" or pool.path == ":memory:":
+            return False
+        if self._conn is None:
+            self._conn = pool.dedicated()
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        unchanged = version == self._data_version
+        self._data_version = version
+        return unchanged
+
+    def poll(self):
+        """Notify subscribers of changes since the last poll; returns how many were read.
+
+        The first poll only records where the log ends: a process that just
+        started has nothing cached yet.
+        """
+        pool = self._pool or get_pool()
+        with self._lock:
+            if pool is not self._source:
+                self._reset(pool)
+            self.polls += 1
+            if self._unchanged(pool) and self._last_id is not None and not self._holes:
+                self.skipped += 1
+                return 0
+            self._forget_holes(time.monotonic() - LATE_SECONDS)
+            with pool.connection() as conn:
+                newest = conn.execute(NEWEST).fetchone()[0] or 0
+                if self._last_id is None:
+                    self._last_id = newest
+                    return 0
+                since = min(self._holes, default=self._last_id + 1) - 1
+                read = conn.execute(READ_CHANGES, (since, MAX_READ)).fetchall()
+                # The rows just after ours were pruned: some changes are lost
+                missed = bool(read) and read[0][0] > since + 1 and \
+                    conn.execute(OLDEST).fetchone()[0] > since + 1
+            # Rows below the high-water mark were seen already, unless they fill a hole
+            rows = [row for row in read if row[0] > self._last_id or self._holes.pop(row[0], None) is not None]
+            self.late += sum(1 for row in rows if row[0] <= self._last_id)
+            if not rows:
+                return 0
+            full = len(read) == MAX_READ
+            last_id = max(newest, read[-1][0]) if full else max(self._last_id, rows[-1][0])
+            if missed or full:
+                self._holes.clear()
+                self._notify_all()
+            else:
+                self._skip_holes(rows, last_id)
+                self._notify(rows)
+            previous, self._last_id = self._last_id, last_id
+            self.changes += len(rows)
+            if last_id // PRUNE_EVERY != previous // PRUNE_EVERY:
+                prune(pool=pool)
+            return len(rows)
+
+    def _skip_holes(self, rows, last_id):
+        """Remember the ids between the last high-water mark and ``last_id`` not read yet."""
+        if last_id - self._last_id > MAX_READ:
+            return
+        read = {row[0] for row in rows}
+        now = time.monotonic()
+        for change_id in range(self._last_id + 1, last_id):
+            if change_id not in read:
+                self._holes[change_id] = now
+
+    def _forget_holes(self, cutoff):
+        for change_id, skipped_at in list(self._holes.items()):
+            if skipped_at < cutoff:
+                del self._holes[change_id]
+
+    def _notify(self, rows):
+        if any(topic == ALL for _, topic, _, _ in rows):
+            self._notify_all()
+            return
+        changed = defaultdict(set)
+        for _, topic, item, origin in rows:
+            if origin != self.origin:
+                changed[topic].add(item)
+        for topic, items in changed.items():
+            if len(items) > MAX_ITEMS:
+                self.reloads += 1
+                items = None
+            for callback in self._subscribers.get(topic, ()):
+                callback(items)
+
+    def _notify_all(self):
+        self.reloads += 1
+        for callbacks in self._subscribers.values():
+            for callback in callbacks:
+                callback(None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "last_change": self._last_id,
+                "polls": self.polls,
+                "skipped": self.skipped,
+                "changes": self.changes,
+                "late": self.late,
+                "holes": len(self._holes),
+                "reloads": self.reloads,
+            }
+
+    def close(self):
+        with self._lock:
+            self._reset(None)
+
+
+watcher = ChangeWatcher()
+
+
+def subscribe(topic, callback):
+    """Subscribe ``callback`` to ``topic`` on the process-wide watcher."""
+    watcher.subscribe(topic, callback)
+
+
+def poll():
+    """Apply other processes' changes to this process's caches."""
+    return watcher.poll()
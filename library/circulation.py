@@ -0,0 +1,144 @@
+"""Issue and return books as single atomic transactions.
+
+Each operation takes the write lock once with ``BEGIN IMMEDIATE``, guards the
+stock change with a conditional UPDATE and commits once, so concurrent desks
+can neither oversell a copy nor leave ``issue`` and ``books`` out of step.
+MySQL locks rows rather than the database, so there each issue first locks
+the title's row; two desks cannot then both pass the duplicate-loan check.
+Holds are settled in the same transactions: a return hands the copy to the
+next student waiting for it (see ``library.holds``), and an issue claims the
+copy set aside for the borrower.
+"""
+from datetime import date, datetime
+from typing import Optional, Tuple
+
+from library import holds
+from library.catalog_index import get_catalog_index
+from library.db import get_pool, run_with_retry, select_for_update, transaction
+from library.models import Hold
+
+
+class CirculationError(Exception):
+    """Base class for circulation failures the UI reports to the user."""
+
+
+class BookNotFound(CirculationError):
+    pass
+
+
+class OutOfStock(CirculationError):
+    pass
+
+
+class AlreadyIssued(CirculationError):
+    pass
+
+
+class LoanNotFound(CirculationError):
+    pass
+
+
+def issue_in_transaction(conn, name, regno, bcode, idate, due_date):
+    """Issue a copy using an already-open transaction.
+
+    Returns the loan id and whether the copy was one set aside for the
+    student's hold, which leaves the shelf count unchanged.
+    """
+    # Desks issuing the same title queue here, so the checks below stay true
+    if select_for_update(conn, "SELECT total FROM books WHERE bcode = ?", (bcode,)).fetchone() is None:
+        raise BookNotFound("Book not found in the system.")
+
+    duplicate = conn.execute(
+        "SELECT id FROM issue WHERE regno = ? AND bcode = ? AND returned = 0",
+        (regno, bcode),
+    ).fetchone()
+    if duplicate:
+        raise AlreadyIssued("This student already has this book issued.")
+
+    # A copy set aside for this student's hold is already off the shelf
+    claimed = holds.claim_in_transaction(conn, regno, bcode, datetime.now())
+    if not claimed:
+        taken = conn.execute(
+            "UPDATE books SET total = total - 1 WHERE bcode = ? AND total > 0",
+            (bcode,),
+        )
+        if taken.rowcount == 0:
+            raise OutOfStock("Book is out of stock.")
+
+    cursor = conn.execute(
+        "INSERT INTO issue (name, regno, bcode, idate, due_date, returned) VALUES (?, ?, ?, ?, ?, 0)",
+        (name, regno, bcode, idate, due_date),
+    )
+    return cursor.lastrowid, claimed
+
+
+def return_in_transaction(conn, loan_id, return_date):
+    """Close a loan using an already-open transaction.
+
+    Returns the book code and the hold the copy was allocated to, or None if
+    nobody was waiting and the copy went back on the shelf.
+    """
+    row = conn.execute(
+        "SELECT bcode FROM issue WHERE id = ? AND returned = 0", (loan_id,)
+    ).fetchone()
+    if not row:
+        raise LoanNotFound("This issue record is not open.")
+    bcode = row[0]
+    conn.execute(
+        "UPDATE issue SET returned = 1, return_date = ? WHERE id = ? AND returned = 0",
+        (return_date, loan_id),
+    )
+    hold = holds.allocate_in_transaction(conn, bcode, datetime.now())
+    if hold is None:
+        conn.execute("UPDATE books SET total = total + 1 WHERE bcode = ?", (bcode,))
+    return bcode, hold
+
+
+def _writer(pool):
+    # Imported here: the write queue builds on the functions above
+    from library.write_queue import group_commit_writer
+    writer = group_commit_writer()
+    return writer if writer is not None and pool in (None, writer.pool) else None
+
+
+def issue_book(name: str, regno: str, bcode: str, idate: date, due_date: date, pool=None) -> int:
+    """Issue one copy of ``bcode`` to a student; returns the new loan id."""
+    writer = _writer(pool)
+    if writer is not None:
+        loan_id, claimed = writer.issue_book(name, regno, bcode, idate, due_date).result()
+    else:
+        pool = pool or get_pool()
+
+        def attempt():
+            with pool.connection() as conn, transaction(conn):
+                return issue_in_transaction(conn, name, regno, bcode, idate, due_date)
+
+        loan_id, claimed = run_with_retry(attempt)
+    if not claimed:
+        get_catalog_index().adjust_stock(bcode, -1)
+    return loan_id
+
+
+def return_copy(loan_id: int, return_date: date, pool=None) -> Tuple[str, Optional[Hold]]:
+    """Mark a loan returned; returns the book code and the hold now ready, if any."""
+    writer = _writer(pool)
+    if writer is not None:
+        bcode, hold = writer.return_book(loan_id, return_date).result()
+    else:
+        pool = pool or get_pool()
+
+        def attempt():
+            with pool.connection() as conn, transaction(conn):
+                return return_in_transaction(conn, loan_id, return_date)
+
+        bcode, hold = run_with_retry(attempt)
+    if hold is None:
+        get_catalog_index().adjust_stock(bcode, 1)
+    else:
+        holds.notify_ready([hold])
+    return bcode, hold
+
+
+def return_book(loan_id: int, return_date: date, pool=None) -> str:
+    """Mark a loan returned and restock or allocate the copy; returns the book code."""
+    return return_copy(loan_id, return_date, pool)[0]
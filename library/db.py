@@ -0,0 +1,287 @@
+"""Pooled, long-lived SQLite connections for the library database.
+
+Opening ``library.db`` for every statement costs a file open, a schema load
+and a cold page cache each time. The pool keeps connections alive between
+Streamlit reruns and hands each thread back the connection it used last, so
+the hot path only pays for the query itself.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from library.dialects import SQLITE
+from library.metrics import connection_factory
+from library.statements import STATEMENT_CACHE_SIZE
+
+# A file path for SQLite, or a mysql:// URL (see library.mysql_backend)
+DB_PATH = os.environ.get("LIBRARY_DB", "library.db")
+
+# Tunable through the environment so deployments can trade durability for speed
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.environ.get("LIBRARY_DB_SYNCHRONOUS", "NORMAL"),
+    "cache_size": int(os.environ.get("LIBRARY_DB_CACHE_SIZE", "-16000")),
+    "mmap_size": int(os.environ.get("LIBRARY_DB_MMAP_SIZE", str(64 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+    "busy_timeout": int(os.environ.get("LIBRARY_DB_BUSY_TIMEOUT_MS", "5000")),
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the pool timeout."""
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of SQLite connections.
+
+    Connections are opened in autocommit mode (``isolation_level=None``) so
+    callers control transactions explicitly with ``BEGIN``/``COMMIT``.
+    Acquiring twice on the same thread returns the connection already held.
+    """
+
+    dialect = SQLITE
+
+    def __init__(self, path=DB_PATH, max_size=8, timeout=30.0, pragmas=None,
+                 shared_cache=False):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        # Shared cache uses table-level locks that bypass busy_timeout, so it
+        # is opt-in rather than the default for a multi-session app.
+        self.shared_cache = shared_cache
+        self._idle = []
+        self._all = []
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._closed = False
+        self._acquisitions = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        if self.path == ":memory:":
+            target, uri = self.path, False
+        else:
+            target = f"file:{self.path}" + ("?cache=shared" if self.shared_cache else "")
+            uri = True
+        conn = sqlite3.connect(
+            target,
+            uri=uri,
+            timeout=self.pragmas.get("busy_timeout", 5000) / 1000,
+            check_same_thread=False,
+            isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            factory=connection_factory(),
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def dedicated(self):
+        """A new connection outside the pool, with the same settings; the caller closes it."""
+        return self._connect()
+
+    def _acquire(self):
+        start = time.perf_counter()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                if self._idle:
+                    # Prefer the connection this thread used last: its page
+                    # cache and statement cache are already warm.
+                    last = getattr(self._local, "last", None)
+                    if last is not None and last in self._idle:
+                        self._idle.remove(last)
+                        conn = last
+                    else:
+                        conn = self._idle.pop()
+                    break
+                if len(self._all) < self.max_size:
+                    conn = None
+                    # Reserve the slot before connecting outside the lock
+                    self._all.append(None)
+                    break
+                waited = True
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and len(self._all) >= self.max_size:
+                        raise PoolTimeout(
+                            f"no database connection free after {self.timeout:.1f}s"
+                        )
+            elapsed = time.perf_counter() - start
+            self._acquisitions += 1
+            if waited:
+                self._waits += 1
+                self._wait_total += elapsed
+                self._wait_max = max(self._wait_max, elapsed)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._all.remove(None)
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._all[self._all.index(None)] = conn
+        return conn
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if self._closed:
+                conn.close()
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a ``with`` block."""
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.last = conn
+            self._release(conn)
+
+    def stats(self):
+        """Return pool-size and wait-time counters for display."""
+        with self._cond:
+            size = sum(1 for conn in self._all if conn is not None)
+            return {
+                "size": size,
+                "idle": len(self._idle),
+                "in_use": size - len(self._idle),
+                "max_size": self.max_size,
+                "acquisitions": self._acquisitions,
+                "waits": self._waits,
+                "wait_total_ms": round(self._wait_total * 1000, 3),
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+    def close(self):
+        """Close idle connections; busy ones are closed when released."""
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._all = [conn for conn in self._all if conn not in self._idle]
+            self._idle = []
+            self._cond.notify_all()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = open_pool(
+                    DB_PATH,
+                    max_size=int(os.environ.get("LIBRARY_DB_POOL_SIZE", "8")),
+                    shared_cache=os.environ.get("LIBRARY_DB_SHARED_CACHE") == "1",
+                )
+    return _pool
+
+
+def configure_pool(path=DB_PATH, **kwargs):
+    """Replace the process-wide pool, e.g. to point a script at another file."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = open_pool(path, **kwargs)
+    return _pool
+
+
+def open_pool(target=DB_PATH, **kwargs):
+    """A pool for ``target``: a SQLite file path or a ``mysql://`` URL."""
+    if target.startswith("mysql"):
+        from library.mysql_backend import MySQLPool
+        # File-level options mean nothing to a server
+        kwargs.pop("shared_cache", None)
+        kwargs.pop("pragmas", None)
+        return MySQLPool(target, **kwargs)
+    return ConnectionPool(target, **kwargs)
+
+
+# MySQL lock wait timeout and deadlock: the transaction can simply be retried
+MYSQL_RETRYABLE = (1205, 1213)
+# MySQL duplicate key and foreign key violations
+MYSQL_INTEGRITY = (1062, 1451, 1452)
+
+
+def is_busy_error(error):
+    """True when ``error`` is the database reporting a lock held by another writer."""
+    if getattr(error, "errno", None) in MYSQL_RETRYABLE:
+        return True
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+@contextmanager
+def transaction(conn, mode="IMMEDIATE"):
+    """Run a block inside ``BEGIN <mode>`` ... ``COMMIT`` on ``conn``.
+
+    ``IMMEDIATE`` takes the write lock up front, so read-then-write sequences
+    cannot be interleaved with another writer's changes. MySQL's ``START
+    TRANSACTION`` takes no lock; such sequences there must begin with
+    :func:`select_for_update`.
+    """
+    conn.execute(f"BEGIN {mode}")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def select_for_update(conn, sql, parameters=()):
+    """Run a SELECT whose rows stay locked until the transaction ends.
+
+    A plain SELECT on SQLite, where the transaction already holds the lock.
+    """
+    return conn.execute(getattr(conn, "dialect", SQLITE).for_update(sql), parameters)
+
+
+def is_integrity_error(error):
+    """True when ``error`` is a unique or foreign key constraint violation."""
+    return isinstance(error, sqlite3.IntegrityError) or getattr(error, "errno", None) in MYSQL_INTEGRITY
+
+
+def run_with_retry(operation, retries=5, backoff=0.05):
+    """Call ``operation()`` again when it fails with SQLITE_BUSY/LOCKED or a deadlock."""
+    for attempt in range(retries + 1):
+        try:
+            return operation()
+        except Exception as e:
+            if attempt == retries or not is_busy_error(e):
+                raise
+            time.sleep(backoff * (2 ** attempt))
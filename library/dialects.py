@@ -0,0 +1,82 @@
+"""SQL dialects for the storage backends.
+
+Service code is written once, in SQLite's dialect: ``?`` placeholders,
+``date('now')``, ``BEGIN IMMEDIATE``, ``ON CONFLICT ... DO UPDATE`` and
+``julianday``. Each backend has a :class:`Dialect` that rewrites that text
+for its server on first use and caches the result. SQLite's rewrite is the
+identity. The few constructs with no mechanical rewrite go through dialect
+helpers instead: two-argument scalar ``MAX``/``MIN`` (``greatest``/``least``),
+row locks (``for_update``) and full-text search.
+"""
+import re
+from functools import lru_cache
+
+from library.statements import STATEMENT_CACHE_SIZE
+
+
+class Dialect:
+    name = "sqlite"
+    placeholder = "?"
+
+    def translate(self, sql):
+        return sql
+
+    def greatest(self, *args):
+        return f"MAX({', '.join(args)})"
+
+    def least(self, *args):
+        return f"MIN({', '.join(args)})"
+
+    def for_update(self, sql):
+        # BEGIN IMMEDIATE already holds the database write lock
+        return sql
+
+
+# Single-quoted literals are copied through untouched
+_QUOTED = re.compile(r"('(?:[^']|'')*')")
+
+_BEGIN = re.compile(r"^\s*BEGIN(?:\s+(?:IMMEDIATE|DEFERRED|EXCLUSIVE))?\s*$", re.I)
+_TODAY = re.compile(r"date\('now'\)", re.I)
+
+# (pattern, replacement) applied outside string literals, in order
+MYSQL_REWRITES = [
+    (re.compile(r"\bjulianday\(", re.I), "TO_DAYS("),
+    (re.compile(r"\bAS\s+INTEGER\)", re.I), "AS SIGNED)"),
+    (re.compile(r"\bINSERT\s+OR\s+IGNORE\b", re.I), "INSERT IGNORE"),
+    (re.compile(r"\bON\s+CONFLICT\s*\([^)]*\)\s*DO\s+UPDATE\s+SET\b", re.I), "ON DUPLICATE KEY UPDATE"),
+    (re.compile(r"\bexcluded\.(\w+)", re.I), r"VALUES(\1)"),
+    # Id lists are bound as one JSON array, read with json_each in SQLite
+    (re.compile(r"\bjson_each\(\?\)", re.I),
+     "JSON_TABLE(?, '$[*]' COLUMNS (value BIGINT PATH '$')) AS ids"),
+]
+
+
+class MySQLDialect(Dialect):
+    name = "mysql"
+    placeholder = "%s"
+
+    @lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def translate(self, sql):
+        if _BEGIN.match(sql):
+            return "START TRANSACTION"
+        parts = _QUOTED.split(_TODAY.sub("CURDATE()", sql))
+        for i in range(0, len(parts), 2):
+            text = parts[i]
+            for pattern, replacement in MYSQL_REWRITES:
+                text = pattern.sub(replacement, text)
+            parts[i] = text.replace("?", "%s")
+        return "".join(parts)
+
+    def greatest(self, *args):
+        return f"GREATEST({', '.join(args)})"
+
+    def least(self, *args):
+        return f"LEAST({', '.join(args)})"
+
+    def for_update(self, sql):
+        # READ COMMITTED lets two transactions read the same row; lock it instead
+        return f"{sql} FOR UPDATE"
+
+
+SQLITE = Dialect()
+MYSQL = MySQLDialect()
@@ -0,0 +1,174 @@
+"""Streaming export of the loan history to CSV or Parquet.
+
+Rows come from the ``loan_history`` view, so archived loans are included.
+They are pulled from a single cursor with ``fetchmany`` and written out one
+chunk at a time, so memory stays flat however many loans the library has
+accumulated. Parquet output needs ``pyarrow``; CSV only needs the standard
+library.
+"""
+import csv
+import os
+import time
+from datetime import date
+
+from library.db import get_pool
+
+FORMATS = ("csv", "parquet")
+STATUSES = ("all", "returned", "open")
+
+COLUMNS = ("loan_id", "student_name", "regno", "book_name", "bcode",
+           "issue_date", "due_date", "return_date", "returned")
+
+# LEFT JOIN: loans of books deleted since must still appear in an audit
+HISTORY_SQL = """
+SELECT i.id, i.name, i.regno, b.bname, i.bcode, i.idate, i.due_date, i.return_date, i.returned
+FROM loan_history i
+LEFT JOIN books b ON i.bcode = b.bcode
+"""
+
+
+class ExportError(Exception):
+    """Raised for an unusable export request (bad format, missing pyarrow)."""
+
+
+class ExportResult:
+    """Counters for a finished (or in-progress) export."""
+
+    __slots__ = ("rows", "seconds")
+
+    def __init__(self):
+        self.rows = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def detect_format(filename):
+    """Guess ``csv`` or ``parquet`` from a file name."""
+    ext = os.path.splitext(filename)[1].lower()
+    return "parquet" if ext in (".parquet", ".pq") else "csv"
+
+
+def history_query(start=None, end=None, regno=None, status="all"):
+    """Build the filtered history SELECT; dates bound the issue date, inclusive."""
+    if status not in STATUSES:
+        raise ExportError(f"Unknown status {status!r}; expected one of {', '.join(STATUSES)}")
+    clauses, params = [], []
+    if start:
+        clauses.append("i.idate >= ?")
+        params.append(start)
+    if end:
+        clauses.append("i.idate <= ?")
+        params.append(end)
+    if regno:
+        clauses.append("i.regno = ?")
+        params.append(regno)
+    if status != "all":
+        clauses.append("i.returned = ?")
+        params.append(1 if status == "returned" else 0)
+    sql = HISTORY_SQL
+    if clauses:
+        sql += "WHERE " + " AND ".join(clauses) + "\n"
+    # Both halves of loan_history are in id order, so this is a merge, not a sort
+    return sql + "ORDER BY i.id", params
+
+
+def iter_history(start=None, end=None, regno=None, status="all", chunk_size=5000, pool=None):
+    """Yield lists of at most ``chunk_size`` history rows, oldest loan first."""
+    sql, params = history_query(start, end, regno, status)
+    with (pool or get_pool()).connection() as conn:
+        cursor = conn.execute(sql, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+
+def write_csv(stream, chunks):
+    """Write a header and every chunk to the text ``stream``; returns rows written."""
+    writer = csv.writer(stream)
+    writer.writerow(COLUMNS)
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def _parquet_schema(pa):
+    return pa.schema([
+        ("loan_id", pa.int64()),
+        ("student_name", pa.string()),
+        ("regno", pa.string()),
+        ("book_name", pa.string()),
+        ("bcode", pa.string()),
+        ("issue_date", pa.date32()),
+        ("due_date", pa.date32()),
+        ("return_date", pa.date32()),
+        ("returned", pa.bool_()),
+    ])
+
+
+def _as_date(value):
+    # Rows written before the DATE column types were declared may still be text
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def write_parquet(sink, chunks):
+    """Write every chunk as one Parquet row group to ``sink`` (path or binary file)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export requires pyarrow (pip install pyarrow)") from None
+
+    schema = _parquet_schema(pa)
+    count = 0
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            for i in (5, 6, 7):
+                columns[i] = [_as_date(v) for v in columns[i]]
+            columns[8] = [bool(v) for v in columns[8]]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            count += len(rows)
+    return count
+
+
+def export_history(sink, fmt="csv", start=None, end=None, regno=None, status="all",
+                   chunk_size=5000, pool=None, progress=None):
+    """Stream the filtered loan history into ``sink``.
+
+    ``sink`` is a text stream for CSV and a path or binary stream for Parquet.
+    ``progress`` is called after every chunk with the running ExportResult.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    result = ExportResult()
+    begin = time.perf_counter()
+
+    def tracked():
+        for rows in iter_history(start, end, regno, status, chunk_size, pool):
+            yield rows
+            result.rows += len(rows)
+            result.seconds = time.perf_counter() - begin
+            if progress:
+                progress(result)
+
+    if fmt == "csv":
+        write_csv(sink, tracked())
+    else:
+        write_parquet(sink, tracked())
+    result.seconds = time.perf_counter() - begin
+    return result
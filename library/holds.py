@@ -0,0 +1,378 @@
+"""Hold queues for titles that are out of stock.
+
+A student can place a hold on a title that has no copy on the shelf. Holds
+for a title form a FIFO queue ordered by id. When a copy comes back,
+:func:`allocate_in_transaction` runs inside the return transaction and
+hands the copy to the head of the queue. The hold becomes ``ready`` with a
+pickup deadline, and the copy is set aside rather than restocked. Copies
+added to the stock, by the catalog or an import, pass through
+:func:`allocate_added_in_transaction` the same way. Issuing the title to
+that student claims the copy and fulfils the hold.
+
+A ready hold that is not collected by its deadline expires. Its copy then
+passes to the next student in the queue, or back to the shelf if nobody is
+waiting. :class:`HoldScheduler` does this in a background thread. It never
+scans the table: the partial index ``idx_holds_expiry`` holds only ready
+holds, ordered by deadline. The scheduler reads the earliest deadline from
+it, sleeps until then (at most ``max_sleep`` seconds, to catch holds made
+ready by other processes) and expires the due holds with a range scan.
+Allocations made in this process wake it early when they set an earlier
+deadline.
+
+Students are told a copy is ready through the functions registered with
+:func:`on_ready`. They run after the transaction commits. Every ready hold
+is also logged.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from library.catalog_index import get_catalog_index
+from library.db import get_pool, is_integrity_error, run_with_retry, select_for_update, transaction
+from library.models import Hold
+
+logger = logging.getLogger("library.holds")
+
+PICKUP_HOURS = float(os.environ.get("LIBRARY_HOLD_PICKUP_HOURS", "72"))
+
+MIGRATION = [
+    """
+    CREATE TABLE IF NOT EXISTS holds (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        bcode TEXT NOT NULL,
+        name TEXT NOT NULL,
+        regno TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'waiting',
+        placed_at TIMESTAMP NOT NULL,
+        expires_at TIMESTAMP,
+        closed_at TIMESTAMP,
+        FOREIGN KEY (bcode) REFERENCES books(bcode)
+    )
+    """,
+    # Queue head and position per title, and the "anyone waiting?" check in delete_book
+    "CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds(bcode, status, id)",
+    # Only ready holds, by deadline: what the expiry scheduler reads
+    "CREATE INDEX IF NOT EXISTS idx_holds_expiry ON holds(expires_at) WHERE status = 'ready'",
+    # One active hold per student and title; also the claim check in issue_book
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_active ON holds(regno, bcode) "
+    "WHERE status IN ('waiting', 'ready')",
+]
+
+HOLD_COLUMNS = "id, name, regno, bcode, status, placed_at, expires_at"
+QUEUE_HEAD = f"""
+SELECT {HOLD_COLUMNS} FROM holds
+WHERE bcode = ? AND status = 'waiting'
+ORDER BY id LIMIT 1
+"""
+# ORDER BY rather than MIN() so the column keeps its TIMESTAMP type
+NEXT_EXPIRY = "SELECT expires_at FROM holds WHERE status = 'ready' ORDER BY expires_at LIMIT 1"
+DUE_HOLDS = """
+SELECT id, bcode FROM holds
+WHERE status = 'ready' AND expires_at <= ?
+ORDER BY expires_at LIMIT ?
+"""
+
+
+class HoldError(Exception):
+    """Base class for hold failures the UI reports to the user."""
+
+
+class HoldNotFound(HoldError):
+    pass
+
+
+class DuplicateHold(HoldError):
+    pass
+
+
+class CopiesAvailable(HoldError):
+    pass
+
+
+_listeners = []
+
+
+def on_ready(callback):
+    """Call ``callback(hold)`` whenever a hold becomes ready for pickup."""
+    _listeners.append(callback)
+    return callback
+
+
+def notify_ready(ready):
+    """Announce holds made ready by a committed transaction."""
+    for hold in ready:
+        if hold is None:
+            continue
+        logger.info("hold %d ready: %s for %s (%s) until %s",
+                    hold.id, hold.bcode, hold.name, hold.regno, hold.expires_at)
+        for callback in _listeners:
+            try:
+                callback(hold)
+            except Exception:
+                logger.exception("hold notification failed for hold %d", hold.id)
+        if _scheduler is not None:
+            _scheduler.wake(hold.expires_at)
+
+
+def allocate_in_transaction(conn, bcode, now) -> Optional[Hold]:
+    """Give a returned or added copy of ``bcode`` to the head of its queue.
+
+    Returns the hold made ready, or None if nobody is waiting, in which case
+    the caller puts the copy back on the shelf.
+    """
+    row = conn.execute(QUEUE_HEAD, (bcode,)).fetchone()
+    if row is None:
+        return None
+    expires_at = now + timedelta(hours=PICKUP_HOURS)
+    conn.execute(
+        "UPDATE holds SET status = 'ready', expires_at = ? WHERE id = ?", (expires_at, row[0])
+    )
+    return Hold(*row[:4], "ready", row[5], expires_at)
+
+
+def allocate_added_in_transaction(conn, bcode, copies, now) -> List[Hold]:
+    """Offer ``copies`` copies just added to the stock of ``bcode`` to its queue.
+
+    ``books.total`` must already count the new copies; each one handed to a
+    waiting student is taken back off the shelf. Returns the holds made ready.
+    """
+    ready = []
+    for _ in range(copies):
+        hold = allocate_in_transaction(conn, bcode, now)
+        if hold is None:
+            break
+        conn.execute("UPDATE books SET total = total - 1 WHERE bcode = ?", (bcode,))
+        ready.append(hold)
+    return ready
+
+
+def claim_in_transaction(conn, regno, bcode, now):
+    """Close the student's active hold on ``bcode`` as they borrow it.
+
+    Returns True if a copy had been set aside for them, so the caller must
+    not take another one off the shelf.
+    """
+    row = conn.execute(
+        "SELECT id, status FROM holds WHERE regno = ? AND bcode = ? AND status IN ('waiting', 'ready')",
+        (regno, bcode),
+    ).fetchone()
+    if row is None:
+        return False
+    conn.execute(
+        "UPDATE holds SET status = 'fulfilled', closed_at = ? WHERE id = ?", (now, row[0])
+    )
+    return row[1] == "ready"
+
+
+def _release_in_transaction(conn, bcode, now):
+    """Pass a set-aside copy to the next student, or back to the shelf."""
+    hold = allocate_in_transaction(conn, bcode, now)
+    if hold is None:
+        conn.execute("UPDATE books SET total = total + 1 WHERE bcode = ?", (bcode,))
+    return hold
+
+
+def _restocked(bcode, hold):
+    if hold is None:
+        get_catalog_index().adjust_stock(bcode, 1)
+
+
+def place_hold(name: str, regno: str, bcode: str, pool=None):
+    """Join the queue for an out-of-stock title; returns ``(hold id, position)``."""
+    pool = pool or get_pool()
+
+    def attempt():
+        with pool.connection() as conn, transaction(conn):
+            # Serializes holds on this title on MySQL, like issue_in_transaction
+            book = select_for_update(conn, "SELECT total FROM books WHERE bcode = ?", (bcode,)).fetchone()
+            if book is None:
+                raise HoldNotFound("Book not found in the system.")
+            if book[0] > 0:
+                raise CopiesAvailable("Copies are on the shelf; issue the book instead.")
+            if conn.execute(
+                "SELECT id FROM issue WHERE regno = ? AND bcode = ? AND returned = 0", (regno, bcode)
+            ).fetchone():
+                raise DuplicateHold("This student already has this book issued.")
+            if conn.execute(
+                "SELECT id FROM holds WHERE regno = ? AND bcode = ? AND status IN ('waiting', 'ready')",
+                (regno, bcode),
+            ).fetchone():
+                raise DuplicateHold("This student already has a hold on this book.")
+            hold_id = conn.execute(
+                "INSERT INTO holds (bcode, name, regno, status, placed_at) VALUES (?, ?, ?, 'waiting', ?)",
+                (bcode, name, regno, datetime.now()),
+            ).lastrowid
+            position = conn.execute(
+                "SELECT COUNT(*) FROM holds WHERE bcode = ? AND status = 'waiting' AND id <= ?",
+                (bcode, hold_id),
+            ).fetchone()[0]
+            return hold_id, position
+
+    try:
+        return run_with_retry(attempt)
+    except Exception as e:
+        # idx_holds_active is the backstop for the check above
+        if not is_integrity_error(e):
+            raise
+        raise DuplicateHold("This student already has a hold on this book.")
+
+
+def cancel_hold(hold_id: int, pool=None) -> Optional[Hold]:
+    """Cancel an active hold; returns the hold its set-aside copy passed to, if any."""
+    pool = pool or get_pool()
+
+    def attempt():
+        with pool.connection() as conn, transaction(conn):
+            row = conn.execute(
+                "SELECT bcode, status FROM holds WHERE id = ? AND status IN ('waiting', 'ready')",
+                (hold_id,),
+            ).fetchone()
+            if row is None:
+                raise HoldNotFound("This hold is not active.")
+            now = datetime.now()
+            conn.execute(
+                "UPDATE holds SET status = 'cancelled', closed_at = ? WHERE id = ?", (now, hold_id)
+            )
+            if row[1] == "ready":
+                return row[0], True, _release_in_transaction(conn, row[0], now)
+            return row[0], False, None
+
+    bcode, released, passed_to = run_with_retry(attempt)
+    if released:
+        _restocked(bcode, passed_to)
+        notify_ready([passed_to])
+    return passed_to
+
+
+def expire_due(now=None, limit: int = 500, pool=None) -> int:
+    """Expire ready holds past their deadline, up to ``limit``; returns how many."""
+    pool = pool or get_pool()
+    now = now or datetime.now()
+
+    def attempt():
+        with pool.connection() as conn, transaction(conn):
+            due = conn.execute(DUE_HOLDS, (now, limit)).fetchall()
+            released = []
+            for hold_id, bcode in due:
+                conn.execute(
+                    "UPDATE holds SET status = 'expired', closed_at = ? WHERE id = ?", (now, hold_id)
+                )
+                released.append((bcode, _release_in_transaction(conn, bcode, now)))
+            return released
+
+    released = run_with_retry(attempt)
+    for bcode, passed_to in released:
+        _restocked(bcode, passed_to)
+    notify_ready([passed_to for _, passed_to in released])
+    return len(released)
+
+
+def next_expiry(pool=None) -> Optional[datetime]:
+    """The earliest pickup deadline among ready holds, from the expiry index."""
+    with (pool or get_pool()).connection() as conn:
+        row = conn.execute(NEXT_EXPIRY).fetchone()
+    return row[0] if row else None
+
+
+def active_holds(bcode: Optional[str] = None, limit: int = 200, pool=None) -> List[Hold]:
+    """Waiting and ready holds in queue order, optionally for one title."""
+    sql = f"SELECT {HOLD_COLUMNS} FROM holds WHERE status IN ('waiting', 'ready')"
+    params = []
+    if bcode:
+        sql += " AND bcode = ?"
+        params.append(bcode)
+    sql += " ORDER BY bcode, id LIMIT ?"
+    with (pool or get_pool()).connection() as conn:
+        rows = conn.execute(sql, (*params, limit)).fetchall()
+    return [Hold(*row) for row in rows]
+
+
+def count_holds(pool=None):
+    """``{"waiting": n, "ready": n}`` across all titles."""
+    # Each count reads only a partial index, never the closed holds
+    with (pool or get_pool()).connection() as conn:
+        active, ready = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM holds WHERE status IN ('waiting', 'ready')),"
+            " (SELECT COUNT(*) FROM holds WHERE status = 'ready')"
+        ).fetchone()
+    return {"waiting": active - ready, "ready": ready}
+
+
+class HoldScheduler:
+    """Background thread that expires uncollected holds at their deadlines."""
+
+    def __init__(self, pool=None, max_sleep=60.0, batch_size=500):
+        self.pool = pool
+        self.max_sleep = max_sleep
+        self.batch_size = batch_size
+        self.expired = 0
+        self.runs = 0
+        self._wake_at = None
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="hold-scheduler", daemon=True)
+        self._thread.start()
+
+    def wake(self, deadline):
+        """Make sure the scheduler is awake by ``deadline``."""
+        with self._condition:
+            if self._wake_at is None or deadline < self._wake_at:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            try:
+                # A full batch may mean more are due; go round again at once
+                expired = self.batch_size
+                while expired == self.batch_size:
+                    expired = expire_due(limit=self.batch_size, pool=self.pool)
+                    self.expired += expired
+                deadline = next_expiry(self.pool)
+            except Exception:
+                logger.exception("hold expiry failed")
+                deadline = None
+            self.runs += 1
+            now = datetime.now()
+            sleep = self.max_sleep
+            if deadline is not None:
+                sleep = min(max((deadline - now).total_seconds(), 0.0), self.max_sleep)
+            with self._condition:
+                if self._stopping:
+                    return
+                self._wake_at = now + timedelta(seconds=sleep)
+                self._condition.wait(sleep)
+                self._wake_at = None
+                if self._stopping:
+                    return
+
+    def stats(self):
+        return {"runs": self.runs, "expired": self.expired, "next_expiry": self._wake_at}
+
+    def close(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(pool=None, max_sleep=60.0):
+    """Start the process-wide expiry scheduler if it is not running yet."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = HoldScheduler(pool, max_sleep)
+    return _scheduler
+
+
+def stop_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.close()
+        _scheduler = None
@@ -0,0 +1,339 @@
+"""Per-statement query metrics and a slow-query log.
+
+Set ``LIBRARY_QUERY_METRICS=1`` and the pool opens its connections with
+``InstrumentedConnection``. Each statement then records its latency, call
+count and row count under the page that issued it. A write is recorded as
+soon as it executes, a query when its first fetch returns: the first
+``fetchone``, or ``fetchmany``/``fetchall``. Later fetches from the same
+cursor add their time and rows to the statement's totals when the cursor is
+exhausted, closed or reused. Nothing is recorded from a finalizer, so a
+cursor dropped after ``execute(...).fetchone()`` has already been counted.
+
+Statements slower than ``LIBRARY_SLOW_QUERY_MS`` are logged with their
+``EXPLAIN QUERY PLAN`` output. When metrics are off the pool uses plain
+``sqlite3`` connections, so the disabled path costs nothing.
+
+Pages tag their queries with ``with tag_page("Reports"): ...``. Registered
+statements are reported under their registry name; ad-hoc SQL appears as
+its whitespace-collapsed text.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from library.statements import registry
+
+logger = logging.getLogger("library.queries")
+
+# Upper bounds in seconds, Prometheus-style; the last bucket is +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SLOW_QUERY_SECONDS = float(os.environ.get("LIBRARY_SLOW_QUERY_MS", "100")) / 1000
+SLOW_LOG_SIZE = 50
+MAX_LABELS = 1024
+
+# Only these can be explained; BEGIN, PRAGMA and friends are timed but not planned
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_page = ContextVar("library_page", default="-")
+_enabled = os.environ.get("LIBRARY_QUERY_METRICS") == "1"
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    """Switch instrumentation for connections opened from now on."""
+    global _enabled
+    _enabled = on
+
+
+@contextmanager
+def tag_page(name):
+    """Attribute queries run inside the block to page ``name``."""
+    token = _page.set(name)
+    try:
+        yield
+    finally:
+        _page.reset(token)
+
+
+def current_page():
+    return _page.get()
+
+
+class QueryStats:
+    """Latency histogram and counters for one (page, statement) pair."""
+
+    __slots__ = ("calls", "rows", "total", "max", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds, rows):
+        self.calls += 1
+        self.rows += rows
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def extend(self, seconds, rows):
+        """Add later fetches to a call already counted by :meth:`add`."""
+        self.rows += rows
+        self.total += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile, in seconds."""
+        target = q * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+
+class SlowQuery:
+    __slots__ = ("at", "page", "statement", "sql", "seconds", "rows", "plan")
+
+    def __init__(self, page, statement, sql, seconds, rows, plan):
+        self.at = time.time()
+        self.page = page
+        self.statement = statement
+        self.sql = sql
+        self.seconds = seconds
+        self.rows = rows
+        self.plan = plan
+
+
+class QueryMetrics:
+    """Thread-safe store of QueryStats keyed by (page, statement)."""
+
+    def __init__(self, slow_seconds=SLOW_QUERY_SECONDS, slow_log_size=SLOW_LOG_SIZE):
+        self.slow_seconds = slow_seconds
+        self._stats = {}
+        self._labels = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def label(self, sql):
+        """Registry name of ``sql``, or its text with whitespace collapsed."""
+        with self._lock:
+            return self._label(sql)
+
+    def _label(self, sql):
+        label = self._labels.get(sql)
+        if label is None:
+            label = registry.name_of(sql) or " ".join(sql.split())
+            if len(self._labels) < MAX_LABELS:
+                self._labels[sql] = label
+        return label
+
+    def record(self, sql, seconds, rows, conn=None, params=None):
+        """Count one call of ``sql``; returns the key to :meth:`extend` it under."""
+        page = _page.get()
+        with self._lock:
+            statement = self._label(sql)
+            stats = self._stats.get((page, statement))
+            if stats is None:
+                stats = self._stats[(page, statement)] = QueryStats()
+            stats.add(seconds, rows)
+        if seconds >= self.slow_seconds:
+            plan = explain_plan(conn, sql, params) if conn is not None else []
+            self._slow.append(SlowQuery(page, statement, sql, seconds, rows, plan))
+            logger.warning("slow query on %s: %s took %.1f ms (%d rows)\n%s",
+                           page, statement, seconds * 1000, rows, "\n".join(plan))
+        return page, statement
+
+    def extend(self, key, seconds, rows):
+        """Add the time and rows of later fetches to the call recorded under ``key``."""
+        with self._lock:
+            stats = self._stats.get(key)
+            # Gone if the metrics were reset in between
+            if stats is not None:
+                stats.extend(seconds, rows)
+
+    def snapshot(self):
+        """List of dicts, slowest total time first."""
+        with self._lock:
+            items = [(key, stats) for key, stats in self._stats.items()]
+            rows = [{
+                "page": page,
+                "statement": statement,
+                "calls": stats.calls,
+                "rows": stats.rows,
+                "total_ms": round(stats.total * 1000, 3),
+                "mean_ms": round(stats.total / stats.calls * 1000, 3),
+                "p95_ms": round(stats.quantile(0.95) * 1000, 3),
+                "max_ms": round(stats.max * 1000, 3),
+            } for (page, statement), stats in items]
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def slow_queries(self):
+        """The most recent slow queries, newest first."""
+        return list(reversed(self._slow))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+    def prometheus(self):
+        """Render every histogram in the Prometheus text exposition format."""
+        lines = [
+            "# HELP library_query_duration_seconds SQLite statement latency by page and statement.",
+            "# TYPE library_query_duration_seconds histogram",
+        ]
+        rows = ["# HELP library_query_rows_total Rows returned or changed by page and statement.",
+                "# TYPE library_query_rows_total counter"]
+        with self._lock:
+            items = sorted(self._stats.items())
+            for (page, statement), stats in items:
+                labels = f'page="{_escape(page)}",statement="{_escape(statement)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'library_query_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'library_query_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.calls}')
+                lines.append(f"library_query_duration_seconds_sum{{{labels}}} {stats.total:.6f}")
+                lines.append(f"library_query_duration_seconds_count{{{labels}}} {stats.calls}")
+                rows.append(f"library_query_rows_total{{{labels}}} {stats.rows}")
+        return "\n".join(lines + rows) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def explain_plan(conn, sql, params=None):
+    """EXPLAIN QUERY PLAN lines for ``sql``, run on an uninstrumented cursor."""
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    try:
+        cursor = sqlite3.Cursor(conn)
+        return [row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params or ())]
+    except sqlite3.Error as e:
+        return [f"(plan unavailable: {e})"]
+
+
+metrics = QueryMetrics()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times its statement from execute through the last fetch."""
+
+    # The statement not yet recorded, then the key later fetches extend
+    _sql = None
+    _key = None
+
+    def _begin(self, sql, params, elapsed):
+        self._sql = sql
+        self._params = params
+        self._elapsed = elapsed
+        self._rows = 0
+        # Writes and DDL have no result set to fetch; record them now
+        if self.description is None:
+            self._rows = max(self.rowcount, 0)
+            self._record()
+
+    def _record(self):
+        sql, self._sql = self._sql, None
+        self._key = metrics.record(sql, self._elapsed, self._rows, self.connection, self._params)
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        if self._sql is not None:
+            self._record()
+        if self._key is not None:
+            key, self._key = self._key, None
+            if self._rows or self._elapsed:
+                metrics.extend(key, self._elapsed, self._rows)
+
+    def _fetched(self, rows):
+        self._rows += rows
+        if not rows:
+            self._finish()
+        elif self._sql is not None:
+            self._record()
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        self._elapsed += time.perf_counter() - start
+        return result
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._begin(sql, parameters, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        # One call per batch; no plan, as there is no single parameter set
+        self._begin(sql, None, time.perf_counter() - start)
+        return self
+
+    def fetchone(self):
+        if self._sql is None and self._key is None:
+            return super().fetchone()
+        row = self._timed(super().fetchone)
+        self._fetched(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        if self._sql is None and self._key is None:
+            return super().fetchmany(size or self.arraysize)
+        rows = self._timed(super().fetchmany, size or self.arraysize)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        if self._sql is None and self._key is None:
+            return super().fetchall()
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose shortcut and explicit cursors are instrumented."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    """The class the pool should open connections with."""
+    return InstrumentedConnection if _enabled else sqlite3.Connection
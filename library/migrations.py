@@ -0,0 +1,215 @@
+"""Versioned schema migrations for the library database.
+
+The applied version is stored in ``PRAGMA user_version``. Each migration runs
+in its own ``BEGIN IMMEDIATE`` transaction together with the version bump, so
+a crash mid-way leaves the database at the previous version and several app
+processes starting at once apply each step exactly once.
+"""
+import argparse
+import sys
+
+from library import analytics, archive, changes, holds, mysql_backend, stats, users
+from library.db import DB_PATH, configure_pool, get_pool, run_with_retry, transaction
+from library.dialects import SQLITE
+
+# (version, description, statements)
+MIGRATIONS = [
+    (1, "base schema", [
+        """
+        CREATE TABLE IF NOT EXISTS books (
+            bname TEXT NOT NULL,
+            bcode TEXT PRIMARY KEY,
+            total INTEGER NOT NULL,
+            subject TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS issue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            regno TEXT NOT NULL,
+            bcode TEXT NOT NULL,
+            idate DATE NOT NULL,
+            due_date DATE NOT NULL,
+            return_date DATE,
+            returned INTEGER DEFAULT 0,
+            FOREIGN KEY (bcode) REFERENCES books(bcode)
+        )
+        """,
+    ]),
+    (2, "indexes for circulation and report queries", [
+        # Open loans by due date: overdue counts and the issued/overdue reports
+        "CREATE INDEX IF NOT EXISTS idx_issue_open_due ON issue(due_date) WHERE returned = 0",
+        # Duplicate-loan check in issue_book
+        "CREATE INDEX IF NOT EXISTS idx_issue_open_student ON issue(regno, bcode) WHERE returned = 0",
+        # "Is this title on loan?" check in delete_book
+        "CREATE INDEX IF NOT EXISTS idx_issue_open_bcode ON issue(bcode) WHERE returned = 0",
+        # Recent activity on the Dashboard
+        "CREATE INDEX IF NOT EXISTS idx_issue_open_idate ON issue(idate) WHERE returned = 0",
+        "CREATE INDEX IF NOT EXISTS idx_issue_returned_date ON issue(return_date) WHERE returned = 1",
+        # Catalog listing order
+        "CREATE INDEX IF NOT EXISTS idx_books_bname ON books(bname)",
+    ]),
+    (3, "full-text search index over the catalog", [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            bname, bcode, subject,
+            content='books', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts(rowid, bname, bcode, subject)
+            VALUES (new.rowid, new.bname, new.bcode, new.subject);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts(books_fts, rowid, bname, bcode, subject)
+            VALUES ('delete', old.rowid, old.bname, old.bcode, old.subject);
+        END
+        """,
+        # Stock changes only touch books.total, so they skip the index
+        """
+        CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF bname, bcode, subject ON books BEGIN
+            INSERT INTO books_fts(books_fts, rowid, bname, bcode, subject)
+            VALUES ('delete', old.rowid, old.bname, old.bcode, old.subject);
+            INSERT INTO books_fts(rowid, bname, bcode, subject)
+            VALUES (new.rowid, new.bname, new.bcode, new.subject);
+        END
+        """,
+        "INSERT INTO books_fts(books_fts) VALUES ('rebuild')",
+    ]),
+    (4, "indexes for paginated catalog listings", [
+        # Subject filter and the distinct subject list
+        "CREATE INDEX IF NOT EXISTS idx_books_subject ON books(subject, bname)",
+        # "Show only available books" sorted by stock
+        "CREATE INDEX IF NOT EXISTS idx_books_total ON books(total)",
+    ]),
+    (5, "trigger-maintained dashboard counters", stats.MIGRATION),
+    (6, "covering index for per-student fine totals", [
+        "CREATE INDEX IF NOT EXISTS idx_issue_open_fines ON issue(regno, due_date, name) WHERE returned = 0",
+    ]),
+    (7, "archive table and history view for returned loans", archive.MIGRATION),
+    (8, "staff accounts with hashed passwords", users.MIGRATION),
+    (9, "hold queues for out-of-stock titles", holds.MIGRATION),
+    (10, "incremental borrowing analytics", analytics.MIGRATION),
+    (11, "change log for cross-process cache invalidation", changes.MIGRATION),
+    # Version 9's partial index already makes this unique on SQLite
+    (12, "one active hold per student and title", []),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Hot queries that must stay index-backed, with the index each should use
+HOT_QUERIES = [
+    ("open loans count", "SELECT COUNT(*) FROM issue WHERE returned = 0", (), None),
+    ("overdue count",
+     "SELECT COUNT(*) FROM issue WHERE returned = 0 AND due_date < date('now')", (),
+     "idx_issue_open_due"),
+    ("duplicate loan check",
+     "SELECT id FROM issue WHERE regno = ? AND bcode = ? AND returned = 0", ("R1", "B1"),
+     "idx_issue_open_student"),
+    ("title on loan check",
+     "SELECT id FROM issue WHERE bcode = ? AND returned = 0", ("B1",),
+     "idx_issue_open_bcode"),
+    ("recent issues",
+     "SELECT name, bcode, idate FROM issue WHERE returned = 0 ORDER BY idate DESC LIMIT 5", (),
+     "idx_issue_open_idate"),
+    ("recent returns",
+     "SELECT name, bcode, return_date FROM issue WHERE returned = 1 ORDER BY return_date DESC LIMIT 5", (),
+     "idx_issue_returned_date"),
+    ("overdue report",
+     """SELECT i.name, i.regno, b.bname, i.bcode, i.idate, i.due_date
+        FROM issue i JOIN books b ON i.bcode = b.bcode
+        WHERE i.returned = 0 AND i.due_date < date('now')
+        ORDER BY i.due_date""", (),
+     "idx_issue_open_due"),
+]
+
+
+def _dialect(conn):
+    # Only the MySQL connection wrapper carries a dialect; sqlite3 connections cannot
+    return getattr(conn, "dialect", SQLITE)
+
+
+def schema_version(conn):
+    if _dialect(conn) is not SQLITE:
+        return mysql_backend.schema_version(conn)
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _set_schema_version(conn, version):
+    if _dialect(conn) is not SQLITE:
+        mysql_backend.set_schema_version(conn, version)
+    else:
+        conn.execute(f"PRAGMA user_version = {version}")
+
+
+def apply_migrations(conn):
+    """Bring ``conn``'s database up to LATEST_VERSION; returns versions applied."""
+    migrations = MIGRATIONS if _dialect(conn) is SQLITE else mysql_backend.MIGRATIONS
+    applied = []
+    for version, _description, statements in migrations:
+        if schema_version(conn) >= version:
+            continue
+
+        def step():
+            with transaction(conn):
+                # Another process may have migrated while we waited for the lock
+                if schema_version(conn) >= version:
+                    return False
+                for statement in statements:
+                    conn.execute(statement)
+                _set_schema_version(conn, version)
+                return True
+
+        if run_with_retry(step):
+            applied.append(version)
+    return applied
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for ``sql``."""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query_plans(conn):
+    """Return ``(name, plan)`` for hot queries that are not index-backed."""
+    failures = []
+    for name, sql, params, index in HOT_QUERIES:
+        plan = explain(conn, sql, params)
+        full_scan = any(line.startswith("SCAN") and "INDEX" not in line for line in plan)
+        missing = index is not None and not any(index in line for line in plan)
+        if full_scan or missing:
+            failures.append((name, plan))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to library.db")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file or mysql:// URL")
+    parser.add_argument("--check", action="store_true",
+                        help="verify hot queries use their indexes (exit 1 if not)")
+    args = parser.parse_args()
+
+    configure_pool(args.db, max_size=1)
+    with get_pool().connection() as conn:
+        applied = apply_migrations(conn)
+        print(f"Schema at version {schema_version(conn)}"
+              + (f" (applied {', '.join(map(str, applied))})" if applied else ""))
+        if args.check and _dialect(conn) is not SQLITE:
+            sys.exit("--check reads SQLite query plans; it does not support MySQL")
+        if args.check:
+            failures = check_query_plans(conn)
+            for name, plan in failures:
+                print(f"NOT INDEXED: {name}: {'; '.join(plan)}")
+            if failures:
+                sys.exit(1)
+            print(f"All {len(HOT_QUERIES)} hot queries are index-backed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Typed row records returned by the service functions.
+
+They are NamedTuples, so callers can treat them as plain tuples (for example
+to build a DataFrame) or read fields by name.
+"""
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+
+class Book(NamedTuple):
+    bname: str
+    bcode: str
+    total: int
+    subject: str
+
+
+class Loan(NamedTuple):
+    id: int
+    name: str
+    regno: str
+    bname: str
+    bcode: str
+    idate: date
+    due_date: date
+
+
+class ReturnedLoan(NamedTuple):
+    name: str
+    regno: str
+    bname: str
+    bcode: str
+    idate: date
+    return_date: Optional[date]
+
+
+class Hold(NamedTuple):
+    id: int
+    name: str
+    regno: str
+    bcode: str
+    status: str
+    placed_at: datetime
+    expires_at: Optional[datetime]
+
+
+class PopularTitle(NamedTuple):
+    bname: str
+    bcode: str
+    subject: str
+    loans: int
+
+
+class AlsoBorrowed(NamedTuple):
+    bname: str
+    bcode: str
+    patrons: int
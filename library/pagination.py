@@ -0,0 +1,76 @@
+"""Keyset pagination for the table views.
+
+A :class:`PagedView` describes one listing (columns, source tables, fixed
+filter, sortable columns). ``page()`` fetches a single page positioned by the
+last row of the previous one, so every page costs an index seek plus
+``page_size`` rows no matter how deep the user pages, and ``count()`` is a
+separate COUNT(*) that the partial indexes keep cheap.
+"""
+from library.db import get_pool
+
+
+class Page:
+    """One page of rows plus the cursor for the page after it."""
+
+    __slots__ = ("rows", "next_cursor")
+
+    def __init__(self, rows, next_cursor):
+        self.rows = rows
+        self.next_cursor = next_cursor
+
+
+class PagedView:
+    """A paginated ``SELECT`` over a fixed source.
+
+    ``sortable`` maps display labels to SQL expressions; ``key`` must be a
+    unique, non-null expression used to break ties between equal sort values.
+    Rows are built with ``row_type`` (e.g. a NamedTuple) when one is given.
+    """
+
+    def __init__(self, columns, source, sortable, key, where=None, row_type=None):
+        self.row_type = row_type
+        self.columns = list(columns)
+        self.source = source
+        self.sortable = dict(sortable)
+        self.key = key
+        self.where = where
+
+    def _conditions(self, filters):
+        conditions = [self.where] if self.where else []
+        return conditions + [condition for condition, _ in filters]
+
+    def page(self, sort, after=None, page_size=25, descending=False, filters=(), pool=None):
+        """Return the page following cursor ``after`` (the first page if None).
+
+        ``filters`` is a sequence of ``(sql_condition, params)`` pairs added
+        to the view's fixed WHERE clause.
+        """
+        sort_expr = self.sortable[sort]
+        conditions = self._conditions(filters)
+        params = [param for _, values in filters for param in values]
+        if after is not None:
+            conditions.append(f"({sort_expr}, {self.key}) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+        direction = "DESC" if descending else "ASC"
+        sql = (
+            f"SELECT {', '.join(self.columns)}, {sort_expr}, {self.key} FROM {self.source}"
+            + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+            + f" ORDER BY {sort_expr} {direction}, {self.key} {direction} LIMIT ?"
+        )
+        params.append(page_size + 1)
+        with (pool or get_pool()).connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        width = len(self.columns)
+        next_cursor = tuple(rows[page_size - 1][width:]) if len(rows) > page_size else None
+        make = self.row_type._make if self.row_type else tuple
+        return Page([make(row[:width]) for row in rows[:page_size]], next_cursor)
+
+    def count(self, filters=(), pool=None):
+        """Return the number of rows the view would list."""
+        conditions = self._conditions(filters)
+        params = [param for _, values in filters for param in values]
+        sql = f"SELECT COUNT(*) FROM {self.source}" + (
+            f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        )
+        with (pool or get_pool()).connection() as conn:
+            return conn.execute(sql, params).fetchone()[0]
@@ -0,0 +1,203 @@
+"""Opt-in render profiling for the Streamlit pages.
+
+Set ``LIBRARY_PROFILE=1`` to enable it. Pages mark their phases with
+``with phase("query"):`` (and ``"dataframe"``, ``"render"`` and so on), and
+``main`` wraps each page in ``rerun()``, which records the page total. The
+timings are grouped under the page tag set by ``metrics.tag_page`` and
+accumulate across reruns. For each (page, phase) pair the profiler keeps a
+call count, the total and maximum time, and a window of recent durations for
+percentiles.
+
+``rerun(capture=True)`` also profiles that single rerun. It uses
+pyinstrument when ``LIBRARY_PROFILER=pyinstrument`` and the package is
+installed, and cProfile otherwise. When ``LIBRARY_PROFILE_DIR`` is set,
+captures and aggregate dumps are also written there. Disabled, ``phase()``
+returns a shared no-op context manager.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from library.metrics import current_page
+
+PROFILE_DIR = os.environ.get("LIBRARY_PROFILE_DIR")
+PROFILER = os.environ.get("LIBRARY_PROFILER", "cprofile")
+RECENT_SAMPLES = 256
+MAX_CAPTURES = 10
+CAPTURE_LINES = 30
+
+_enabled = os.environ.get("LIBRARY_PROFILE") == "1"
+_NOOP = nullcontext()
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+class PhaseStats:
+    """Timings for one (page, phase) pair."""
+
+    __slots__ = ("calls", "total", "max", "recent")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, q):
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class Capture:
+    __slots__ = ("at", "page", "seconds", "text", "path")
+
+    def __init__(self, page, seconds, text, path=None):
+        self.at = time.time()
+        self.page = page
+        self.seconds = seconds
+        self.text = text
+        self.path = path
+
+
+class RenderProfiler:
+    """Thread-safe aggregate of phase timings and single-rerun captures."""
+
+    def __init__(self):
+        self._stats = {}
+        self._captures = deque(maxlen=MAX_CAPTURES)
+        self._lock = threading.Lock()
+
+    def record(self, page, phase_name, seconds):
+        with self._lock:
+            stats = self._stats.get((page, phase_name))
+            if stats is None:
+                stats = self._stats[(page, phase_name)] = PhaseStats()
+            stats.add(seconds)
+
+    def add_capture(self, capture):
+        self._captures.append(capture)
+
+    def captures(self):
+        """The most recent captures, newest first."""
+        return list(reversed(self._captures))
+
+    def snapshot(self):
+        """List of dicts grouped by page, phases by total time within a page."""
+        with self._lock:
+            rows = [{
+                "page": page,
+                "phase": phase_name,
+                "calls": stats.calls,
+                "total_ms": round(stats.total * 1000, 3),
+                "mean_ms": round(stats.total / stats.calls * 1000, 3),
+                "p95_ms": round(stats.percentile(0.95) * 1000, 3),
+                "max_ms": round(stats.max * 1000, 3),
+            } for (page, phase_name), stats in self._stats.items()]
+        return sorted(rows, key=lambda row: (row["page"], -row["total_ms"]))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._captures.clear()
+
+    def dump(self, directory=PROFILE_DIR):
+        """Write the aggregate to ``directory``/render_profile.json; returns the path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "render_profile.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"generated_at": time.time(), "phases": self.snapshot()}, f, indent=2)
+        return path
+
+
+profiler = RenderProfiler()
+
+
+@contextmanager
+def _timed(phase_name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(current_page(), phase_name, time.perf_counter() - start)
+
+
+def phase(phase_name):
+    """Time the enclosed block as ``phase_name`` of the current page."""
+    return _timed(phase_name) if _enabled else _NOOP
+
+
+def _start_profiler():
+    if PROFILER == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            pass
+        else:
+            profile = Profiler()
+            profile.start()
+            return "pyinstrument", profile
+    profile = cProfile.Profile()
+    profile.enable()
+    return "cprofile", profile
+
+
+def _finish_profiler(kind, profile, page):
+    """Stop ``profile``; returns its report text and the file written, if any."""
+    stem = f"{page}-{time.strftime('%Y%m%d-%H%M%S')}".replace(" ", "_").replace("/", "_")
+    path = None
+    if kind == "pyinstrument":
+        profile.stop()
+        text = profile.output_text(unicode=True)
+        if PROFILE_DIR:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{stem}.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profile.output_html())
+        return text, path
+
+    profile.disable()
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(CAPTURE_LINES)
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{stem}.prof")
+        profile.dump_stats(path)
+    return out.getvalue(), path
+
+
+@contextmanager
+def rerun(capture=False):
+    """Record the page total; with ``capture`` also profile this rerun."""
+    if not _enabled:
+        yield
+        return
+    page = current_page()
+    started = _start_profiler() if capture else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        profiler.record(page, "total", elapsed)
+        if started:
+            text, path = _finish_profiler(*started, page)
+            profiler.add_capture(Capture(page, elapsed, text, path))
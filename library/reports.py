@@ -0,0 +1,39 @@
+"""Report repository: open loans, overdue loans and return history."""
+from typing import List
+
+from library.db import get_pool
+from library.models import ReturnedLoan
+from library.pagination import Page
+from library.statements import register
+# Dashboard figures come from the trigger-maintained counters
+from library.stats import dashboard_stats, recent_activity
+from library.views import OPEN_LOANS_VIEW, OVERDUE_FILTER
+
+LOAN_SORTS = list(OPEN_LOANS_VIEW.sortable)
+
+RETURN_HISTORY = register("reports.history", """
+SELECT i.name, i.regno, b.bname, i.bcode, i.idate, i.return_date
+FROM loan_history i
+JOIN books b ON i.bcode = b.bcode
+WHERE i.returned = 1
+ORDER BY i.return_date DESC
+LIMIT ?
+""")
+
+
+def open_loans(sort: str = "Due Date", after=None, page_size: int = 25, descending: bool = False,
+               overdue_only: bool = False, pool=None) -> Page:
+    """One page of loans not yet returned; ``Page.rows`` holds Loan records."""
+    filters = [OVERDUE_FILTER] if overdue_only else []
+    return OPEN_LOANS_VIEW.page(sort, after, page_size, descending, filters, pool=pool)
+
+
+def count_open_loans(overdue_only: bool = False, pool=None) -> int:
+    return OPEN_LOANS_VIEW.count([OVERDUE_FILTER] if overdue_only else [], pool=pool)
+
+
+def return_history(limit: int = 100, pool=None) -> List[ReturnedLoan]:
+    """The most recent returns, newest first, archived loans included."""
+    with (pool or get_pool()).connection() as conn:
+        rows = conn.execute(RETURN_HISTORY, (limit,)).fetchall()
+    return [ReturnedLoan(*row) for row in rows]
@@ -0,0 +1,127 @@
+"""Full-text catalog search backed by the ``books_fts`` FTS5 index.
+
+``books_fts`` is an external-content index over ``books`` kept in sync by
+triggers (see migration 3), so a search reads only the matching postings
+instead of scanning every title with ``LIKE '%term%'``. Results are ranked
+with bm25 and paged with a ``(score, rowid)`` keyset cursor. Subject and
+availability filters are part of the same query, so every page is full.
+
+``books_fts`` points at ``books.rowid``, which a plain ``VACUUM`` may
+renumber; call :func:`rebuild_index` after vacuuming the main database.
+
+On MySQL the same search runs against the ``books_ft`` FULLTEXT index in
+boolean mode, keyed by ``(score, bcode)`` as MySQL tables have no rowid.
+"""
+import re
+
+from library.db import get_pool
+from library.models import Book
+
+# bm25 column weights: title matches count most, then code, then subject
+BM25_WEIGHTS = (10.0, 2.0, 5.0)
+
+SEARCH_BOOKS = f"""
+SELECT b.bname, b.bcode, b.total, b.subject, f.score, f.rowid
+FROM (
+    SELECT rowid, bm25(books_fts, {', '.join(map(str, BM25_WEIGHTS))}) AS score
+    FROM books_fts
+    WHERE books_fts MATCH ?
+) f
+JOIN books b ON b.rowid = f.rowid
+WHERE (f.score, f.rowid) > (?, ?){{filters}}
+ORDER BY f.score, f.rowid
+LIMIT ?
+"""
+
+# Relevance is negated so both dialects page in ascending (score, key) order
+MYSQL_SEARCH_BOOKS = """
+SELECT bname, bcode, total, subject, score, bcode
+FROM (
+    SELECT bname, bcode, total, subject,
+           -MATCH(bname, bcode, subject) AGAINST (? IN BOOLEAN MODE) AS score
+    FROM books
+    WHERE MATCH(bname, bcode, subject) AGAINST (? IN BOOLEAN MODE)
+) f
+WHERE (score, bcode) > (?, ?){filters}
+ORDER BY score, bcode
+LIMIT ?
+"""
+
+_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+_WORD = re.compile(r"\w+")
+
+
+def build_match_query(term):
+    """Turn user input into an FTS5 MATCH expression.
+
+    Quoted text becomes a phrase query; every bare word becomes a prefix
+    query, so ``data sys`` finds "Database Systems". Words are quoted so
+    FTS5 operators typed by users are treated as text.
+    """
+    parts = []
+    for phrase, word in _TOKEN.findall(term):
+        if phrase:
+            words = _WORD.findall(phrase)
+            if words:
+                parts.append('"' + " ".join(words) + '"')
+        else:
+            parts.extend(f'"{w}"*' for w in _WORD.findall(word))
+    return " ".join(parts)
+
+
+def build_boolean_query(term):
+    """The MySQL boolean-mode equivalent of :func:`build_match_query`."""
+    parts = []
+    for phrase, word in _TOKEN.findall(term):
+        if phrase:
+            words = _WORD.findall(phrase)
+            if words:
+                parts.append('+"' + " ".join(words) + '"')
+        else:
+            parts.extend(f"+{w}*" for w in _WORD.findall(word))
+    return " ".join(parts)
+
+
+def _filters(subject, available_only):
+    clauses, params = "", ()
+    if subject:
+        clauses, params = " AND subject = ?", (subject,)
+    if available_only:
+        clauses += " AND total > 0"
+    return clauses, params
+
+
+def search_books(term, limit=25, after=None, subject=None, available_only=False, pool=None):
+    """Return ``(rows, next_cursor)`` for one page of ranked matches.
+
+    Rows are Book records, optionally only those in ``subject`` or with a
+    copy on the shelf. Pass ``next_cursor`` back as ``after`` for the
+    following page; it is None on the last page.
+    """
+    pool = pool or get_pool()
+    if pool.dialect.name == "mysql":
+        match = build_boolean_query(term)
+        sql, params = MYSQL_SEARCH_BOOKS, (match, match)
+        score, key = after if after else (-1e308, "")
+    else:
+        match = build_match_query(term)
+        sql, params = SEARCH_BOOKS, (match,)
+        score, key = after if after else (float("-inf"), -1)
+    if not match:
+        return [], None
+    clauses, filter_params = _filters(subject, available_only)
+    with pool.connection() as conn:
+        rows = conn.execute(
+            sql.format(filters=clauses), params + (score, key) + filter_params + (limit + 1,)
+        ).fetchall()
+    next_cursor = (rows[limit - 1][4], rows[limit - 1][5]) if len(rows) > limit else None
+    return [Book._make(row[:4]) for row in rows[:limit]], next_cursor
+
+
+def rebuild_index(pool=None):
+    """Rebuild ``books_fts`` from ``books`` (InnoDB maintains FULLTEXT itself)."""
+    pool = pool or get_pool()
+    if pool.dialect.name == "mysql":
+        return
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
@@ -0,0 +1,60 @@
+"""Statement names and the statement cache size.
+
+Service code executes its SQL directly. Pooled SQLite connections keep the
+compiled form of the last ``STATEMENT_CACHE_SIZE`` statements in sqlite3's
+own statement cache, keyed by the SQL text, and the MySQL dialect caches that
+many translations. A statement registered here under a name is reported by
+that name in the query metrics instead of by its text.
+
+:meth:`StatementRegistry.stats` reports the cache sizes and, on MySQL, the
+translation cache's hits and misses. sqlite3 keeps no counters for its
+statement cache.
+"""
+import os
+import threading
+
+STATEMENT_CACHE_SIZE = int(os.environ.get("LIBRARY_STATEMENT_CACHE_SIZE", "256"))
+
+
+class StatementRegistry:
+    """Names for statements, keyed by their SQL text."""
+
+    def __init__(self):
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, sql):
+        """Record ``sql`` under ``name`` and return it unchanged."""
+        with self._lock:
+            self._names[sql] = name
+        return sql
+
+    def name_of(self, sql):
+        """The registered name for ``sql``, or None for ad-hoc SQL."""
+        return self._names.get(sql)
+
+    def stats(self, pool):
+        """Registered statements and the statement caches behind ``pool``."""
+        with self._lock:
+            registered = len(self._names)
+        stats = {
+            "registered": registered,
+            "dialect": pool.dialect.name,
+            "cache_size": STATEMENT_CACHE_SIZE,
+        }
+        # Only the MySQL dialect translates, through an lru_cache
+        cache_info = getattr(pool.dialect.translate, "cache_info", None)
+        if cache_info is not None:
+            info = cache_info()
+            lookups = info.hits + info.misses
+            stats.update({
+                "translations_cached": info.currsize,
+                "hits": info.hits,
+                "misses": info.misses,
+                "hit_rate": round(info.hits / lookups, 3) if lookups else 0.0,
+            })
+        return stats
+
+
+registry = StatementRegistry()
+register = registry.register
@@ -0,0 +1,130 @@
+"""Dashboard statistics served from trigger-maintained counters.
+
+Migration 5 adds ``library_stats`` (title, copy and open-loan counters) and
+``subject_counts`` (titles per subject). Triggers on ``books`` and ``issue``
+adjust them inside the writing transaction, so reading the dashboard is a
+handful of primary-key lookups whatever the table sizes. The overdue count
+depends on today's date and cannot be kept by triggers; it is a range count
+on the ``idx_issue_open_due`` partial index instead.
+"""
+from library.db import get_pool, transaction
+
+COUNTER_NAMES = ("book_titles", "book_copies", "open_loans")
+
+READ_COUNTERS = "SELECT name, value FROM library_stats"
+COUNT_SUBJECTS = "SELECT COUNT(*) FROM subject_counts"
+COUNT_OVERDUE = "SELECT COUNT(*) FROM issue WHERE returned = 0 AND due_date < date('now')"
+RECENT_ISSUES = """
+SELECT 'Issue' as action, name, bcode, idate as date
+FROM issue
+WHERE returned = 0
+ORDER BY idate DESC LIMIT ?
+"""
+RECENT_RETURNS = """
+SELECT 'Return' as action, name, bcode, return_date as date
+FROM issue
+WHERE returned = 1
+ORDER BY return_date DESC LIMIT ?
+"""
+
+# Archiving deletes returned loans in bulk; they never touch the counter
+ISSUE_DELETE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS stats_issue_delete AFTER DELETE ON issue
+WHEN old.returned = 0 BEGIN
+    UPDATE library_stats SET value = value - 1 WHERE name = 'open_loans';
+END
+"""
+
+TABLES_AND_TRIGGERS = [
+    "CREATE TABLE IF NOT EXISTS library_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS subject_counts (subject TEXT PRIMARY KEY, titles INTEGER NOT NULL)",
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_books_insert AFTER INSERT ON books BEGIN
+        UPDATE library_stats SET value = value + 1 WHERE name = 'book_titles';
+        UPDATE library_stats SET value = value + new.total WHERE name = 'book_copies';
+        INSERT INTO subject_counts (subject, titles) VALUES (new.subject, 1)
+            ON CONFLICT(subject) DO UPDATE SET titles = titles + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_books_delete AFTER DELETE ON books BEGIN
+        UPDATE library_stats SET value = value - 1 WHERE name = 'book_titles';
+        UPDATE library_stats SET value = value - old.total WHERE name = 'book_copies';
+        UPDATE subject_counts SET titles = titles - 1 WHERE subject = old.subject;
+        DELETE FROM subject_counts WHERE subject = old.subject AND titles <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_books_total AFTER UPDATE OF total ON books BEGIN
+        UPDATE library_stats SET value = value + new.total - old.total WHERE name = 'book_copies';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_books_subject AFTER UPDATE OF subject ON books
+    WHEN new.subject IS NOT old.subject BEGIN
+        UPDATE subject_counts SET titles = titles - 1 WHERE subject = old.subject;
+        DELETE FROM subject_counts WHERE subject = old.subject AND titles <= 0;
+        INSERT INTO subject_counts (subject, titles) VALUES (new.subject, 1)
+            ON CONFLICT(subject) DO UPDATE SET titles = titles + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_issue_insert AFTER INSERT ON issue BEGIN
+        UPDATE library_stats SET value = value + (new.returned = 0) WHERE name = 'open_loans';
+    END
+    """,
+    ISSUE_DELETE_TRIGGER,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_issue_returned AFTER UPDATE OF returned ON issue BEGIN
+        UPDATE library_stats SET value = value + (new.returned = 0) - (old.returned = 0)
+        WHERE name = 'open_loans';
+    END
+    """,
+]
+
+# Recompute every counter from the base tables
+RECOUNT = [
+    "DELETE FROM library_stats",
+    """
+    INSERT INTO library_stats (name, value)
+    SELECT 'book_titles', COUNT(*) FROM books
+    UNION ALL SELECT 'book_copies', COALESCE(SUM(total), 0) FROM books
+    UNION ALL SELECT 'open_loans', COUNT(*) FROM issue WHERE returned = 0
+    """,
+    "DELETE FROM subject_counts",
+    "INSERT INTO subject_counts (subject, titles) SELECT subject, COUNT(*) FROM books GROUP BY subject",
+]
+
+# Statements for migration 5: create the tables and triggers, then seed them
+MIGRATION = TABLES_AND_TRIGGERS + RECOUNT
+
+
+def dashboard_stats(pool=None):
+    """Return the dashboard and catalog metrics as a dict."""
+    with (pool or get_pool()).connection() as conn:
+        stats = dict.fromkeys(COUNTER_NAMES, 0)
+        stats.update(conn.execute(READ_COUNTERS).fetchall())
+        stats["subjects"] = conn.execute(COUNT_SUBJECTS).fetchone()[0]
+        stats["overdue"] = conn.execute(COUNT_OVERDUE).fetchone()[0]
+    return stats
+
+
+def subjects(pool=None):
+    """Return the distinct subjects in the catalog, sorted."""
+    with (pool or get_pool()).connection() as conn:
+        return [row[0] for row in conn.execute("SELECT subject FROM subject_counts ORDER BY subject")]
+
+
+def recent_activity(per_kind=5, pool=None):
+    """Return the latest ``per_kind`` issues and returns, newest first."""
+    with (pool or get_pool()).connection() as conn:
+        issues = conn.execute(RECENT_ISSUES, (per_kind,)).fetchall()
+        returns = conn.execute(RECENT_RETURNS, (per_kind,)).fetchall()
+    return sorted(issues + returns, key=lambda row: row[3], reverse=True)
+
+
+def recount(pool=None):
+    """Rebuild the counters from the base tables, e.g. after manual edits."""
+    with (pool or get_pool()).connection() as conn, transaction(conn):
+        for statement in RECOUNT:
+            conn.execute(statement)
@@ -0,0 +1,327 @@
+"""Staff accounts with scrypt-hashed passwords and a session token cache.
+
+Passwords are stored as ``scrypt$n$r$p$salt$hash`` strings, so the cost can
+be raised later: :func:`authenticate` rehashes a password stored at older
+parameters the next time its owner logs in. The cost defaults to
+``n=2**14, r=8, p=1`` (about 16 MiB and tens of milliseconds per hash) and is
+tuned with ``LIBRARY_SCRYPT_N``, ``LIBRARY_SCRYPT_R`` and ``LIBRARY_SCRYPT_P``;
+``benchmark_login.py`` measures what a setting costs. At most
+``LIBRARY_KDF_CONCURRENCY`` hashes run at once, which caps the memory a burst
+of logins can take.
+
+The KDF runs once per login, not once per rerun. A successful login returns
+an opaque token held in the process-wide :data:`tokens` cache. Streamlit keeps
+the token in the session, and each rerun checks it with a dictionary lookup.
+Tokens expire after ``LIBRARY_SESSION_HOURS`` and are revoked on logout, on a
+password change and when an account is disabled, in every app process: the
+change is logged through :mod:`library.changes`. The cache lives in memory,
+so restarting the server signs everyone out.
+
+Unknown usernames are checked against a dummy hash, and hashes are compared
+with :func:`hmac.compare_digest`. A failed login therefore takes as long
+whether or not the account exists.
+
+A new database gets a single ``admin`` account. Its password comes from
+``LIBRARY_ADMIN_PASSWORD`` or is generated at random, and is printed once
+when the account is created.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+from library import changes
+from library.db import get_pool, is_integrity_error, transaction
+
+SCRYPT_N = int(os.environ.get("LIBRARY_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("LIBRARY_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("LIBRARY_SCRYPT_P", "1"))
+SALT_BYTES = 16
+HASH_BYTES = 32
+KDF_CONCURRENCY = int(os.environ.get("LIBRARY_KDF_CONCURRENCY", str(os.cpu_count() or 2)))
+SESSION_SECONDS = float(os.environ.get("LIBRARY_SESSION_HOURS", "12")) * 3600
+
+ROLES = ("admin", "staff")
+
+# The one account created on an empty users table; it adds the others
+INITIAL_ADMIN = "admin"
+
+MIGRATION = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'staff',
+        disabled INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+]
+
+_kdf_slots = threading.BoundedSemaphore(KDF_CONCURRENCY)
+
+
+class UserError(Exception):
+    """Base class for account failures the UI reports to the user."""
+
+
+class UserNotFound(UserError):
+    pass
+
+
+class DuplicateUser(UserError):
+    pass
+
+
+class User:
+    __slots__ = ("username", "role")
+
+    def __init__(self, username, role):
+        self.username = username
+        self.role = role
+
+    def __eq__(self, other):
+        return isinstance(other, User) and (self.username, self.role) == (other.username, other.role)
+
+    def __repr__(self):
+        return f"User({self.username!r}, {self.role!r})"
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt needs 128 * n * r bytes; leave headroom over OpenSSL's 32 MiB default
+    with _kdf_slots:
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=HASH_BYTES)
+
+
+def hash_password(password, n=None, r=None, p=None):
+    """Hash ``password`` with a fresh salt; returns the encoded string to store."""
+    n, r, p = n or SCRYPT_N, r or SCRYPT_R, p or SCRYPT_P
+    salt = os.urandom(SALT_BYTES)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_password(password, encoded):
+    """Whether ``password`` matches ``encoded``, compared in constant time."""
+    try:
+        scheme, n, r, p, salt, expected = encoded.split("$")
+        if scheme != "scrypt":
+            return False
+        actual = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, base64.b64decode(expected))
+
+
+def needs_rehash(encoded):
+    """Whether ``encoded`` was hashed with other than the current parameters."""
+    return not encoded.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+_dummy_hash = None
+
+
+def _dummy():
+    # Hashed on first use so importing the module stays cheap
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(8))
+    return _dummy_hash
+
+
+class TokenCache:
+    """Thread-safe map of session tokens to the users they were issued to.
+
+    Only a SHA-256 digest of each token is kept, so a dump of the cache
+    cannot be replayed as a session.
+    """
+
+    def __init__(self, ttl=SESSION_SECONDS):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode("ascii")).digest()
+
+    def issue(self, user):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[self._key(token)] = (user, time.monotonic() + self.ttl)
+        return token
+
+    def user_for(self, token):
+        """The User ``token`` was issued to, or None if unknown or expired."""
+        if not token:
+            return None
+        key = self._key(token)
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self._sessions.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def revoke(self, token):
+        if token:
+            with self._lock:
+                self._sessions.pop(self._key(token), None)
+
+    def revoke_user(self, username):
+        with self._lock:
+            for key in [key for key, (user, _) in self._sessions.items() if user.username == username]:
+                del self._sessions[key]
+
+    def revoke_all(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            active = sum(1 for _, expires in self._sessions.values() if expires >= now)
+        return {"active": active, "hits": self.hits, "misses": self.misses}
+
+
+tokens = TokenCache()
+
+
+def _revoke_changed(usernames):
+    # Another process changed these accounts; None means it cannot tell which
+    if usernames is None:
+        tokens.revoke_all()
+        return
+    for username in usernames:
+        tokens.revoke_user(username)
+
+
+changes.subscribe(changes.USERS, _revoke_changed)
+
+
+def authenticate(username, password, pool=None):
+    """Check a login; returns the User or None.
+
+    Runs the KDF once whether or not the account exists, and upgrades the
+    stored hash when the cost parameters have changed since it was written.
+    """
+    with (pool or get_pool()).connection() as conn:
+        row = conn.execute(
+            "SELECT password_hash, role FROM users WHERE username = ? AND disabled = 0",
+            (username,),
+        ).fetchone()
+    if row is None:
+        verify_password(password, _dummy())
+        return None
+    encoded, role = row
+    if not verify_password(password, encoded):
+        return None
+    if needs_rehash(encoded):
+        _store_hash(username, hash_password(password), pool)
+    return User(username, role)
+
+
+def login(username, password, pool=None):
+    """Authenticate and open a session; returns ``(user, token)`` or ``(None, None)``."""
+    user = authenticate(username, password, pool)
+    if user is None:
+        return None, None
+    return user, tokens.issue(user)
+
+
+def logout(token):
+    tokens.revoke(token)
+
+
+def _store_hash(username, encoded, pool=None, revoke=False):
+    with (pool or get_pool()).connection() as conn:
+        with transaction(conn):
+            updated = conn.execute(
+                "UPDATE users SET password_hash = ? WHERE username = ?", (encoded, username)
+            ).rowcount
+            # A rehash on login keeps the sessions; a new password ends them everywhere
+            if updated and revoke:
+                changes.record(conn, changes.USERS, username)
+    if not updated:
+        raise UserNotFound(f"No account named {username}.")
+
+
+def create_user(username, password, role="staff", pool=None):
+    """Add an account; raises DuplicateUser if the name is taken."""
+    if role not in ROLES:
+        raise UserError(f"Role must be one of {', '.join(ROLES)}.")
+    encoded = hash_password(password)
+    try:
+        with (pool or get_pool()).connection() as conn:
+            with transaction(conn):
+                conn.execute(
+                    "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                    (username, encoded, role),
+                )
+    except Exception as e:
+        # The primary key decides; a SELECT first would let two desks both pass
+        if not is_integrity_error(e):
+            raise
+        raise DuplicateUser(f"An account named {username} already exists.")
+    return User(username, role)
+
+
+def set_password(username, password, pool=None):
+    """Change a password and sign the account out everywhere."""
+    _store_hash(username, hash_password(password), pool, revoke=True)
+    tokens.revoke_user(username)
+
+
+def set_disabled(username, disabled=True, pool=None):
+    with (pool or get_pool()).connection() as conn:
+        with transaction(conn):
+            updated = conn.execute(
+                "UPDATE users SET disabled = ? WHERE username = ?", (int(disabled), username)
+            ).rowcount
+            if updated and disabled:
+                changes.record(conn, changes.USERS, username)
+    if not updated:
+        raise UserNotFound(f"No account named {username}.")
+    if disabled:
+        tokens.revoke_user(username)
+
+
+def list_users(pool=None):
+    """``(username, role, disabled)`` tuples ordered by username."""
+    with (pool or get_pool()).connection() as conn:
+        return [
+            (username, role, bool(disabled))
+            for username, role, disabled in conn.execute(
+                "SELECT username, role, disabled FROM users ORDER BY username"
+            )
+        ]
+
+
+def seed_users(conn):
+    """Create the initial admin account if the users table is empty.
+
+    Returns its password, or None if there were accounts already.
+    """
+    if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None:
+        return None
+    password = os.environ.get("LIBRARY_ADMIN_PASSWORD") or secrets.token_urlsafe(12)
+    # Hash before taking the write lock; the KDF is the slow part
+    encoded = hash_password(password)
+    with transaction(conn):
+        if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None:
+            return None
+        conn.execute(
+            "INSERT INTO users (username, password_hash, role) VALUES (?, ?, 'admin')",
+            (INITIAL_ADMIN, encoded),
+        )
+    return password
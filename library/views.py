@@ -0,0 +1,22 @@
+"""Paginated listings shared by the app pages, scripts and benchmarks."""
+from library.models import Book, Loan
+from library.pagination import PagedView
+
+BOOKS_VIEW = PagedView(
+    ["bname", "bcode", "total", "subject"],
+    "books",
+    {"Book Name": "bname", "Book Code": "bcode", "Available": "total", "Subject": "subject"},
+    key="bcode",
+    row_type=Book,
+)
+
+OPEN_LOANS_VIEW = PagedView(
+    ["i.id", "i.name", "i.regno", "b.bname", "i.bcode", "i.idate", "i.due_date"],
+    "issue i JOIN books b ON i.bcode = b.bcode",
+    {"Due Date": "i.due_date", "Issue Date": "i.idate", "Issue ID": "i.id"},
+    key="i.id",
+    where="i.returned = 0",
+    row_type=Loan,
+)
+
+OVERDUE_FILTER = ("i.due_date < date('now')", ())
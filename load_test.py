@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+from aiohttp import web
+
+from api_server import create_app
+from benchmark import percentile
+from generate_data import generate
+from library import users
+from library.db import open_pool
+
+# A staff account created in the throwaway database for the clients
+LOGIN = {"username": "loadtest", "password": "load-test-password"}
+
+
+async def run_load(base_url, codes, duration, concurrency, rng):
+    """Drive a mixed read/write workload; returns latencies (ms) per endpoint."""
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    open_loans = []
+    deadline = time.perf_counter() + duration
+
+    async def one(session):
+        roll = rng.random()
+        if roll < 0.35:
+            name, method, url, body = "search", "GET", f"/books?q={rng.choice(['intro', 'data', 'theory', 'history', 'guide'])}", None
+        elif roll < 0.55:
+            name, method, url, body = "list_books", "GET", "/books?limit=25", None
+        elif roll < 0.65:
+            name, method, url, body = "open_loans", "GET", "/reports/open?overdue=1", None
+        elif roll < 0.75:
+            name, method, url, body = "stats", "GET", "/stats", None
+        elif roll < 0.90 or not open_loans:
+            name, method, url = "issue", "POST", "/loans"
+            body = {"name": "Load Test", "regno": f"LT{rng.randrange(10**7)}", "bcode": rng.choice(codes)}
+        else:
+            name, method, url, body = "return", "POST", f"/loans/{open_loans.pop()}/return", {}
+
+        start = time.perf_counter()
+        async with session.request(method, base_url + url, json=body) as response:
+            payload = await response.read()
+        latencies[name].append((time.perf_counter() - start) * 1000)
+        if response.status >= 500:
+            errors[name] += 1
+        elif name == "issue" and response.status == 201:
+            open_loans.append(json.loads(payload)["id"])
+
+    async def worker(session):
+        while time.perf_counter() < deadline:
+            await one(session)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async with session.post(base_url + "/sessions", json=LOGIN) as response:
+            response.raise_for_status()
+            session.headers["Authorization"] = f"Bearer {(await response.json())['token']}"
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def main_async(args):
+    tmp = tempfile.mkdtemp(prefix="library-load-")
+    db_path = os.path.join(tmp, "library.db")
+    print(f"Generating {args.books:,} books / {args.loans:,} loans in {db_path}")
+    generate(db_path, args.books, args.loans, students=5000, open_ratio=0.05, skew=1.1, seed=args.seed)
+
+    pool = open_pool(db_path, max_size=1)
+    try:
+        with pool.connection() as conn:
+            codes = [row[0] for row in conn.execute("SELECT bcode FROM books WHERE total > 0 LIMIT 2000")]
+        users.create_user(LOGIN["username"], LOGIN["password"], pool=pool)
+    finally:
+        pool.close()
+
+    runner = web.AppRunner(create_app(db_path, workers=args.workers))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        start = time.perf_counter()
+        latencies, errors = await run_load(f"http://127.0.0.1:{port}", codes, args.duration,
+                                           args.concurrency, random.Random(args.seed))
+        elapsed = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+
+    total = sum(len(values) for values in latencies.values())
+    results = {"requests": total, "requests_per_sec": round(total / elapsed, 1), "endpoints": {}}
+    print(f"\n{total:,} requests in {elapsed:.1f}s = {total / elapsed:,.0f} req/s "
+          f"(concurrency {args.concurrency}, {args.workers} db workers)\n")
+    print(f"{'endpoint':<12} {'count':>8} {'p50 ms':>9} {'p99 ms':>9} {'5xx':>5}")
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        results["endpoints"][name] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "errors": errors[name],
+        }
+        r = results["endpoints"][name]
+        print(f"{name:<12} {r['count']:>8,} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['errors']:>5}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+def main():
+    """
+    Load-test the HTTP API against a throwaway database.
+    The server runs in-process on a random local port, so nothing touches
+    the real library.db.
+    """
+    parser = argparse.ArgumentParser(description="Load-test the circulation HTTP API")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--workers", type=int, default=8, help="server database threads")
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument("--loans", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
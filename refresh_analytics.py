@@ -0,0 +1,49 @@
+import argparse
+import sys
+import time
+
+from library import analytics
+from library.db import DB_PATH, configure_pool
+from library.migrations import apply_migrations
+
+
+def main():
+    """
+    Fold loans issued since the last run into the borrowing analytics tables
+    (per-month loan counts and the "also borrowed" co-loan matrix). Each batch
+    is aggregated outside the write lock and written in one short transaction,
+    so this is safe to run from cron while the app is serving. Every app and
+    API process also refreshes in a background thread; run this after a
+    large import or to build the tables the first time. On MySQL it waits up
+    to LATE_SECONDS for loans that were still committing when it passed them.
+    """
+    parser = argparse.ArgumentParser(description="Refresh borrowing analytics in library.db")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file or mysql:// URL")
+    parser.add_argument("--batch-size", type=int, default=analytics.DEFAULT_BATCH_SIZE,
+                        help="loans aggregated per transaction")
+    parser.add_argument("--rebuild", action="store_true", help="recompute from the full loan history")
+    args = parser.parse_args()
+
+    pool = configure_pool(args.db, max_size=1)
+    with pool.connection() as conn:
+        apply_migrations(conn)
+    print(f"{analytics.pending_loans():,} loans to aggregate", file=sys.stderr)
+
+    def report(result):
+        print(f"\r{result.loans:,} loans aggregated in {result.batches:,} batches",
+              end="", file=sys.stderr, flush=True)
+
+    run = analytics.rebuild if args.rebuild else analytics.refresh
+    result = run(args.batch_size, progress=report)
+    deadline = time.monotonic() + analytics.LATE_SECONDS
+    while analytics.skipped_loans() and time.monotonic() < deadline:
+        time.sleep(1)
+        result.loans += analytics.refresh(args.batch_size).loans
+    print(file=sys.stderr)
+    print(f"Aggregated {result.loans:,} loans ({result.pairs:,} co-loan updates) in "
+          f"{result.seconds:.2f}s ({result.loans_per_sec:,.0f} loans/sec); "
+          f"up to loan {result.last_loan_id:,}")
+
+
+if __name__ == "__main__":
+    main()
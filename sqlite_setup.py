@@ -1,38 +1,18 @@
 import sqlite3
 
+from library.migrations import apply_migrations
+
 def setup_sqlite_database():
     """
     Set up a SQLite database for the library management system.
     This script creates the necessary tables and adds some sample data.
     """
     # Connect to SQLite database (will create it if it doesn't exist)
-    conn = sqlite3.connect('library.db')
+    conn = sqlite3.connect('library.db', isolation_level=None)
     cursor = conn.cursor()
     
-    # Create books table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS books (
-        bname TEXT NOT NULL,
-        bcode TEXT PRIMARY KEY,
-        total INTEGER NOT NULL,
-        subject TEXT NOT NULL
-    )
-    ''')
-    
-    # Create issue table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS issue (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        regno TEXT NOT NULL,
-        bcode TEXT NOT NULL,
-        idate DATE NOT NULL,
-        due_date DATE NOT NULL,
-        return_date DATE,
-        returned INTEGER DEFAULT 0,
-        FOREIGN KEY (bcode) REFERENCES books(bcode)
-    )
-    ''')
+    # Create tables and indexes through the versioned migrations
+    apply_migrations(conn)
     
     # Add sample books
     sample_books = [
@@ -43,6 +23,7 @@ def setup_sqlite_database():
         ('Physics for Scientists and Engineers', 'BOOK005', 3, 'Science')
     ]
     
+    cursor.execute("BEGIN")
     cursor.executemany('''
     INSERT OR IGNORE INTO books (bname, bcode, total, subject) VALUES (?, ?, ?, ?)
     ''', sample_books)
@@ -0,0 +1,72 @@
+from datetime import date
+
+import pytest
+
+from library import analytics
+from library.db import open_pool, transaction
+from library.migrations import apply_migrations
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = open_pool(str(tmp_path / "library.db"), max_size=2)
+    with pool.connection() as conn:
+        apply_migrations(conn)
+        with transaction(conn):
+            conn.executemany("INSERT INTO books (bname, bcode, total, subject) VALUES (?, ?, 5, 'S')",
+                             [(f"Title {code}", code) for code in ("A", "B", "C", "D")])
+    yield pool
+    pool.close()
+
+
+def add_loans(pool, loans):
+    """Insert ``(id, regno, bcode)`` loans; an explicit id leaves holes like a MySQL insert in flight."""
+    with pool.connection() as conn, transaction(conn):
+        conn.executemany(
+            "INSERT INTO issue (id, name, regno, bcode, idate, due_date, returned) VALUES (?, 'S', ?, ?, ?, ?, 0)",
+            [(loan_id, regno, bcode, TODAY, TODAY) for loan_id, regno, bcode in loans],
+        )
+
+
+def aggregates(pool):
+    with pool.connection() as conn:
+        return (sorted(conn.execute("SELECT bcode, month, loans FROM loan_counts").fetchall()),
+                sorted(conn.execute("SELECT bcode, other, patrons FROM co_loans").fetchall()))
+
+
+def test_incremental_refresh_matches_a_rebuild(pool):
+    add_loans(pool, [(1, "R1", "A"), (2, "R1", "B"), (3, "R2", "A")])
+    assert analytics.refresh(pool=pool).loans == 3
+    add_loans(pool, [(4, "R2", "B"), (5, "R1", "C"), (6, "R1", "A")])
+    assert analytics.pending_loans(pool=pool) == 3
+    result = analytics.refresh(batch_size=2, pool=pool)
+    assert (result.loans, result.batches) == (3, 2)
+    assert analytics.refresh(pool=pool).loans == 0
+    incremental = aggregates(pool)
+    analytics.rebuild(pool=pool)
+    assert aggregates(pool) == incremental
+    # R1 and R2 both borrowed A and B; re-borrowing A adds nothing
+    assert ("A", "B", 2) in incremental[1]
+
+
+def test_loans_committed_after_a_higher_id_are_folded_in(pool):
+    add_loans(pool, [(1, "R1", "A"), (3, "R1", "C")])
+    analytics.refresh(pool=pool)
+    assert analytics.skipped_loans(pool=pool) == [2]
+    add_loans(pool, [(2, "R1", "B"), (4, "R2", "D")])
+    result = analytics.refresh(pool=pool)
+    assert (result.loans, result.late) == (2, 1)
+    assert analytics.skipped_loans(pool=pool) == []
+    late = aggregates(pool)
+    analytics.rebuild(pool=pool)
+    assert aggregates(pool) == late
+
+
+def test_ids_that_never_commit_are_forgotten(pool, monkeypatch):
+    add_loans(pool, [(1, "R1", "A"), (3, "R1", "C")])
+    analytics.refresh(pool=pool)
+    monkeypatch.setattr(analytics, "LATE_SECONDS", 0)
+    assert analytics.refresh(pool=pool).loans == 0
+    assert analytics.skipped_loans(pool=pool) == []
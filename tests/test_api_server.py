@@ -0,0 +1,106 @@
+import asyncio
+import base64
+import json
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import api_server
+from library import bootstrap, users
+
+ADMIN_PASSWORD = "api-test-admin"
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Run ``scenario(client, headers)`` against a fresh database as the admin."""
+    monkeypatch.setenv("LIBRARY_ADMIN_PASSWORD", ADMIN_PASSWORD)
+    # bootstrap() runs once per process; each test has its own database
+    monkeypatch.setattr(bootstrap, "_result", None)
+    db_path = str(tmp_path / "library.db")
+
+    def run(scenario):
+        async def main():
+            async with TestClient(TestServer(api_server.create_app(db_path, workers=2))) as client:
+                response = await client.post("/sessions", json={"username": "admin", "password": ADMIN_PASSWORD})
+                assert response.status == 201
+                token = (await response.json())["token"]
+                await scenario(client, {"Authorization": f"Bearer {token}"})
+
+        asyncio.run(main())
+
+    return run
+
+
+def test_requests_without_a_session_are_refused(api):
+    async def scenario(client, headers):
+        assert (await client.get("/books")).status == 401
+        assert (await client.post("/loans", json={"name": "A", "regno": "R1", "bcode": "BOOK001"})).status == 401
+        assert (await client.get("/books", headers={"Authorization": "Bearer nope"})).status == 401
+        wrong = await client.post("/sessions", json={"username": "admin", "password": "12345"})
+        assert wrong.status == 401
+        assert (await client.get("/books", headers=headers)).status == 200
+        assert (await client.delete("/sessions", headers=headers)).status == 204
+        assert (await client.get("/books", headers=headers)).status == 401
+
+    api(scenario)
+
+
+def test_metrics_are_for_admins_only(api):
+    async def scenario(client, headers):
+        assert (await client.get("/metrics", headers=headers)).status == 200
+        await asyncio.get_running_loop().run_in_executor(None, users.create_user, "desk", "desk-password")
+        response = await client.post("/sessions", json={"username": "desk", "password": "desk-password"})
+        staff = {"Authorization": f"Bearer {(await response.json())['token']}"}
+        assert (await client.get("/metrics", headers=staff)).status == 403
+        assert (await client.get("/books", headers=staff)).status == 200
+
+    api(scenario)
+
+
+@pytest.mark.parametrize("body", [
+    {"name": "", "regno": "R1", "bcode": "BOOK001"},
+    {"name": "Ali", "regno": " ", "bcode": "BOOK001"},
+    {"name": "Ali", "regno": "R1", "bcode": None},
+    {"name": "Ali", "regno": "R1", "bcode": 7},
+    {"name": "Ali", "regno": "R1"},
+])
+def test_loans_and_holds_need_every_field(api, body):
+    async def scenario(client, headers):
+        assert (await client.post("/loans", json=body, headers=headers)).status == 400
+        assert (await client.post("/holds", json=body, headers=headers)).status == 400
+
+    api(scenario)
+
+
+def test_valid_loan_is_issued(api):
+    async def scenario(client, headers):
+        response = await client.post("/loans", json={"name": " Ali ", "regno": "R1", "bcode": "BOOK001"},
+                                     headers=headers)
+        assert response.status == 201
+        assert (await response.json())["bcode"] == "BOOK001"
+
+    api(scenario)
+
+
+@pytest.mark.parametrize("query", [
+    "limit=0", "limit=-1", "limit=ten",
+    "after=zzz",
+    "after=" + base64.urlsafe_b64encode(json.dumps(["only one"]).encode()).decode(),
+    "after=" + base64.urlsafe_b64encode(json.dumps({"a": 1}).encode()).decode(),
+])
+def test_bad_paging_parameters_are_rejected(api, query):
+    async def scenario(client, headers):
+        assert (await client.get(f"/books?{query}", headers=headers)).status == 400
+
+    api(scenario)
+
+
+def test_pages_follow_the_cursor(api):
+    async def scenario(client, headers):
+        first = await (await client.get("/books?limit=2", headers=headers)).json()
+        second = await (await client.get(f"/books?limit=2&after={first['next']}", headers=headers)).json()
+        assert len(first["rows"]) == len(second["rows"]) == 2
+        assert not {row["bcode"] for row in first["rows"]} & {row["bcode"] for row in second["rows"]}
+
+    api(scenario)
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+import backend_conformance
+from backend_conformance import CHECKS
+from library.db import open_pool
+
+TARGETS = ["sqlite"] + (["mysql"] if os.environ.get("LIBRARY_TEST_MYSQL_URL") else [])
+
+
+class Backend:
+    """One reset database that the checks run against in order."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.done = 0
+
+    def run(self, check):
+        index = CHECKS.index(check)
+        # Checks build on what earlier ones leave behind, so run any that
+        # were deselected first
+        while self.done < index:
+            CHECKS[self.done](self.pool)
+            self.done += 1
+        try:
+            check(self.pool)
+        finally:
+            self.done = index + 1
+
+
+@pytest.fixture(scope="module", params=TARGETS)
+def backend(request, tmp_path_factory):
+    # MySQL runs only with LIBRARY_TEST_MYSQL_URL set; its database is wiped first
+    if request.param == "mysql":
+        target = os.environ["LIBRARY_TEST_MYSQL_URL"]
+    else:
+        target = str(tmp_path_factory.mktemp("conformance") / "conformance.db")
+    pool = open_pool(target, max_size=8)
+    backend_conformance.reset(pool)
+    yield Backend(pool)
+    pool.close()
+
+
+@pytest.mark.parametrize("check", CHECKS, ids=[check.__name__ for check in CHECKS])
+def test_conformance(backend, check):
+    backend.run(check)
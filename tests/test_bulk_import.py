@@ -0,0 +1,64 @@
+import io
+
+import pytest
+
+from library import catalog
+from library.bulk_import import import_books, validate_record
+from library.db import open_pool
+from library.migrations import apply_migrations
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = open_pool(str(tmp_path / "library.db"), max_size=2)
+    with pool.connection() as conn:
+        apply_migrations(conn)
+    yield pool
+    pool.close()
+
+
+def test_valid_records_are_stripped():
+    record = {"bname": " Dune ", "bcode": " SF1 ", "total": " 3 ", "subject": "Fiction"}
+    assert validate_record(record) == ("Dune", "SF1", 3, "Fiction")
+    assert validate_record('{"bname": "Dune", "bcode": "SF1", "total": 2.0, "subject": "Fiction"}') == \
+        ("Dune", "SF1", 2, "Fiction")
+
+
+@pytest.mark.parametrize("record, error", [
+    ({"bname": "   ", "bcode": "SF1", "total": 1, "subject": "Fiction"}, "missing bname"),
+    ({"bname": "Dune", "bcode": " ", "total": 1, "subject": "Fiction"}, "missing bcode"),
+    ({"bname": "Dune", "bcode": None, "total": 1, "subject": "Fiction"}, "missing bcode"),
+    ({"bname": "Dune", "bcode": "SF1", "subject": "Fiction"}, "missing total"),
+    ({"bname": "Dune", "bcode": "SF1", "total": 3.7, "subject": "Fiction"}, "not a whole number"),
+    ({"bname": "Dune", "bcode": "SF1", "total": "3.7", "subject": "Fiction"}, "not a whole number"),
+    ({"bname": "Dune", "bcode": "SF1", "total": True, "subject": "Fiction"}, "not a whole number"),
+    ({"bname": "Dune", "bcode": "SF1", "total": -1, "subject": "Fiction"}, "cannot be negative"),
+    ("{not json", "not valid JSON"),
+    ("[1, 2]", "not a JSON object"),
+])
+def test_invalid_records_are_rejected(record, error):
+    with pytest.raises(ValueError, match=error):
+        validate_record(record)
+
+
+def test_bad_lines_are_rejected_without_ending_the_import(pool):
+    lines = [
+        '{"bname": "One", "bcode": "J1", "total": 1, "subject": "S"}',
+        '{"bname": "Two", "bcode": "J2", "total": 2',
+        '',
+        '["J3"]',
+        '{"bname": "Four", "bcode": " ", "total": 1, "subject": "S"}',
+        '{"bname": "Five", "bcode": "J5", "total": 5, "subject": "S"}',
+    ]
+    result = import_books(io.StringIO("\n".join(lines) + "\n"), "jsonl", chunk_size=1, pool=pool)
+    assert (result.imported, result.rejected) == (2, 3)
+    assert [error.split(":")[0] for error in result.errors] == ["line 2", "line 4", "line 5"]
+    assert catalog.get_book("J5", pool=pool).total == 5
+    assert catalog.get_book("", pool=pool) is None
+
+
+def test_csv_reports_file_line_numbers(pool):
+    rows = "bname,bcode,total,subject\nOne,C1,1,S\nTwo,C2,2.5,S\n"
+    result = import_books(io.StringIO(rows), "csv", pool=pool)
+    assert (result.imported, result.rejected) == (1, 1)
+    assert result.errors[0].startswith("line 3:")
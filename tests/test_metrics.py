@@ -0,0 +1,77 @@
+import sqlite3
+import threading
+
+import pytest
+
+from library import metrics as query_metrics
+from library.metrics import InstrumentedConnection, QueryMetrics
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = QueryMetrics(slow_seconds=60)
+    monkeypatch.setattr(query_metrics, "metrics", metrics)
+    return metrics
+
+
+@pytest.fixture
+def conn(metrics):
+    conn = sqlite3.connect(":memory:", factory=InstrumentedConnection)
+    conn.execute("CREATE TABLE t (n INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(n,) for n in range(10)])
+    yield conn
+    conn.close()
+
+
+def calls(metrics, statement):
+    return {row["statement"]: (row["calls"], row["rows"]) for row in metrics.snapshot()}.get(statement)
+
+
+def test_first_fetch_records_without_waiting_for_the_cursor(metrics, conn):
+    cursor = conn.execute("SELECT n FROM t ORDER BY n")
+    assert calls(metrics, "SELECT n FROM t ORDER BY n") is None
+    assert cursor.fetchone() == (0,)
+    # Recorded while the cursor is still alive and unexhausted
+    assert calls(metrics, "SELECT n FROM t ORDER BY n") == (1, 1)
+    del cursor
+    assert calls(metrics, "SELECT n FROM t ORDER BY n") == (1, 1)
+
+
+def test_later_fetches_extend_the_same_call(metrics, conn):
+    cursor = conn.execute("SELECT n FROM t")
+    assert len(cursor.fetchmany(4)) == 4
+    assert calls(metrics, "SELECT n FROM t") == (1, 4)
+    assert len(list(cursor)) == 6
+    assert calls(metrics, "SELECT n FROM t") == (1, 10)
+
+
+def test_writes_are_recorded_on_execute(metrics, conn):
+    assert calls(metrics, "INSERT INTO t VALUES (?)") == (1, 10)
+    conn.execute("DELETE FROM t WHERE n < 3")
+    assert calls(metrics, "DELETE FROM t WHERE n < 3") == (1, 3)
+
+
+def test_reusing_a_cursor_records_each_statement_once(metrics, conn):
+    cursor = conn.cursor()
+    for _ in range(3):
+        cursor.execute("SELECT COUNT(*) FROM t").fetchall()
+    cursor.execute("SELECT n FROM t").fetchone()
+    cursor.close()
+    assert calls(metrics, "SELECT COUNT(*) FROM t") == (3, 3)
+    assert calls(metrics, "SELECT n FROM t") == (1, 1)
+
+
+def test_labels_are_shared_safely_between_threads(metrics):
+    statements = [f"SELECT {n}" for n in range(query_metrics.MAX_LABELS * 2)]
+
+    def label_all():
+        for sql in statements:
+            metrics.record(sql, 0.001, 1)
+
+    threads = [threading.Thread(target=label_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(metrics._labels) == query_metrics.MAX_LABELS
+    assert all(row["calls"] == 4 for row in metrics.snapshot())
@@ -0,0 +1,13 @@
+from library.db import open_pool
+from library.migrations import LATEST_VERSION, apply_migrations, check_query_plans, schema_version
+
+
+def test_hot_queries_use_their_indexes(tmp_path):
+    pool = open_pool(str(tmp_path / "library.db"), max_size=1)
+    try:
+        with pool.connection() as conn:
+            apply_migrations(conn)
+            assert schema_version(conn) == LATEST_VERSION
+            assert check_query_plans(conn) == []
+    finally:
+        pool.close()
@@ -0,0 +1,41 @@
+import pytest
+
+from library import catalog
+from library.db import open_pool
+from library.migrations import apply_migrations
+from library.search import search_books
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = open_pool(str(tmp_path / "library.db"), max_size=2)
+    with pool.connection() as conn:
+        apply_migrations(conn)
+    for n in range(30):
+        subject = "Physics" if n % 3 == 0 else "Chemistry"
+        catalog.add_book(f"Applied Science {n}", f"AS{n:02}", n % 2, subject, pool=pool)
+    yield pool
+    pool.close()
+
+
+def all_pages(pool, **filters):
+    books, after = [], None
+    while True:
+        page, after = search_books("applied", limit=4, after=after, pool=pool, **filters)
+        books.extend(page)
+        if after is None:
+            return books
+
+
+def test_filters_apply_before_paging(pool):
+    page, _ = search_books("applied", limit=4, subject="Physics", available_only=True, pool=pool)
+    # Every page is full of matching titles, not a filtered-down page of matches
+    assert len(page) == 4
+    assert all(book.subject == "Physics" and book.total > 0 for book in page)
+
+
+def test_filtered_pages_cover_every_match_once(pool):
+    books = all_pages(pool, subject="Physics", available_only=True)
+    assert sorted(book.bcode for book in books) == [f"AS{n:02}" for n in range(30) if n % 6 == 3]
+    assert len(all_pages(pool)) == 30
+    assert len(all_pages(pool, available_only=True)) == 15
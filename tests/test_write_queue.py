@@ -0,0 +1,82 @@
+from datetime import date
+
+import pytest
+
+from library import catalog
+from library.circulation import OutOfStock
+from library.db import open_pool
+from library.migrations import apply_migrations
+from library.write_queue import GroupCommitWriter
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = open_pool(str(tmp_path / "library.db"), max_size=2)
+    with pool.connection() as conn:
+        apply_migrations(conn)
+    catalog.add_book("Dune", "SF1", 1, "Fiction", pool=pool)
+    catalog.add_book("Emma", "CL1", 5, "Classics", pool=pool)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def writer(pool):
+    # A wide window and a batch size the tests fill exactly, so the operations
+    # each test submits land in one batch
+    writer = GroupCommitWriter(pool, max_batch=3, window=5.0)
+    yield writer
+    writer.close()
+
+
+def issue(writer, regno, bcode):
+    today = date.today()
+    return writer.issue_book(f"Student {regno}", regno, bcode, today, today)
+
+
+def open_loans(pool):
+    with pool.connection() as conn:
+        return conn.execute("SELECT regno, bcode FROM issue WHERE returned = 0 ORDER BY id").fetchall()
+
+
+def test_operations_share_one_commit(pool, writer):
+    futures = [issue(writer, f"R{n}", "CL1") for n in range(3)]
+    assert all(future.result(timeout=10)[0] > 0 for future in futures)
+    assert writer.stats()["batches"] == 1
+    assert writer.stats()["operations"] == 3
+    assert catalog.get_book("CL1", pool=pool).total == 2
+
+
+def test_refused_operation_rolls_back_alone(pool, writer):
+    futures = [issue(writer, "R1", "SF1"), issue(writer, "R2", "SF1"), issue(writer, "R3", "CL1")]
+    assert futures[0].result(timeout=10)[0] > 0
+    with pytest.raises(OutOfStock):
+        futures[1].result(timeout=10)
+    assert futures[2].result(timeout=10)[0] > 0
+    assert writer.stats()["batches"] == 1
+    assert open_loans(pool) == [("R1", "SF1"), ("R3", "CL1")]
+
+
+def test_unexpected_error_fails_only_its_own_operation(pool, writer):
+    def broken(conn):
+        conn.execute("UPDATE books SET total = 99 WHERE bcode = 'CL1'")
+        raise RuntimeError("broken operation")
+
+    futures = [issue(writer, "R1", "SF1"), writer.submit(broken), issue(writer, "R3", "CL1")]
+    assert futures[0].result(timeout=10)[0] > 0
+    with pytest.raises(RuntimeError, match="broken operation"):
+        futures[1].result(timeout=10)
+    assert futures[2].result(timeout=10)[0] > 0
+    assert writer.stats()["split_batches"] == 1
+    assert open_loans(pool) == [("R1", "SF1"), ("R3", "CL1")]
+    assert catalog.get_book("CL1", pool=pool).total == 4
+
+
+def test_close_drains_queued_operations(pool):
+    writer = GroupCommitWriter(pool, max_batch=4, window=0.001)
+    futures = [issue(writer, f"R{n}", "CL1") for n in range(5)]
+    writer.close()
+    assert all(future.done() and future.result()[0] > 0 for future in futures)
+    assert len(open_loans(pool)) == 5
+    with pytest.raises(RuntimeError):
+        issue(writer, "R9", "CL1")